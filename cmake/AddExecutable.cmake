@@ -185,10 +185,10 @@ function(shift_add_executable target)
   # Setup Google Breakpad toolchain on Linux
   # if(CMAKE_HOST_SYSTEM_NAME STREQUAL "Linux" AND NOT SHIFT_NO_BREAKPAD_SYMBOLS)
   #   add_custom_target(${target}_breakpad ALL
-  #     COMMAND ${CMAKE_SOURCE_DIR}/scripts/breakpad-process-binary.sh
+  #     COMMAND ${Python3_EXECUTABLE} ${CMAKE_SOURCE_DIR}/scripts/breakpad_symbols.py
   #       "$<TARGET_FILE:${target}>"
-  #       "${CMAKE_SOURCE_DIR}"
-  #       "$ENV{STRIP}"
+  #       --output "${CMAKE_SOURCE_DIR}/symbols"
+  #       --strip "$ENV{STRIP}"
   #     COMMENT "Producing Breakpad symbols for target ${target}..."
   #     VERBATIM
   #   )
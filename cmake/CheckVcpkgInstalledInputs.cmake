@@ -0,0 +1,50 @@
+# Included by the toolchain files before vcpkg's toolchain runs the manifest install.
+#
+# With "vcpkg-installed-store-path" set, scripts/cmake.py links vcpkg_installed to a tree shared by
+# all build folders with the same vcpkg inputs, and records the hashes of these inputs in
+# vcpkg-installed-inputs.txt (see vcpkg_cache.write_inputs_stamp). If CMake reruns on its own
+# (e.g. from ninja after vcpkg.json changed), vcpkg would install into a tree still shared under
+# the old inputs, and change it for every other build folder using it. Such reruns are refused.
+
+set(VCPKG_INSTALLED_INPUTS_FILENAME "${CMAKE_BINARY_DIR}/vcpkg-installed-inputs.txt")
+if(EXISTS "${VCPKG_INSTALLED_INPUTS_FILENAME}" AND IS_SYMLINK "${CMAKE_BINARY_DIR}/vcpkg_installed")
+  file(STRINGS "${VCPKG_INSTALLED_INPUTS_FILENAME}" vcpkg_installed_inputs)
+  set(vcpkg_installed_changed)
+  foreach(vcpkg_installed_input IN LISTS vcpkg_installed_inputs)
+    string(REPLACE "|" ";" vcpkg_installed_input "${vcpkg_installed_input}")
+    list(GET vcpkg_installed_input 0 input_kind)
+    if(input_kind STREQUAL "key")
+      continue()
+    endif()
+    list(GET vcpkg_installed_input 1 input_path)
+    if(input_kind STREQUAL "missing")
+      if(EXISTS "${input_path}")
+        list(APPEND vcpkg_installed_changed "${input_path}")
+      endif()
+      continue()
+    endif()
+    list(GET vcpkg_installed_input 2 expected_hash)
+    if(NOT EXISTS "${input_path}")
+      list(APPEND vcpkg_installed_changed "${input_path}")
+    elseif(input_kind STREQUAL "folder")
+      file(GLOB_RECURSE input_files LIST_DIRECTORIES false RELATIVE "${input_path}" "${input_path}/*")
+      list(SORT input_files)
+      string(SHA256 input_hash "${input_files}")
+      if(NOT input_hash STREQUAL expected_hash)
+        list(APPEND vcpkg_installed_changed "${input_path}")
+      endif()
+    else()
+      file(SHA256 "${input_path}" input_hash)
+      if(NOT input_hash STREQUAL expected_hash)
+        list(APPEND vcpkg_installed_changed "${input_path}")
+      endif()
+    endif()
+  endforeach()
+  if(vcpkg_installed_changed)
+    list(JOIN vcpkg_installed_changed "\n  " vcpkg_installed_changed)
+    message(FATAL_ERROR
+      "The vcpkg inputs changed since scripts/cmake.py linked the shared vcpkg_installed tree:\n"
+      "  ${vcpkg_installed_changed}\n"
+      "Please rerun scripts/cmake.py, which links the tree matching the new inputs.")
+  endif()
+endif()
@@ -30,5 +30,6 @@ set(ENV{VCPKG_BINARY_SOURCES} "${VCPKG_BINARY_SOURCES}")
 set(VCPKG_PATH_SOURCE "${CMAKE_BINARY_DIR}/vcpkg-path.txt")
 if(EXISTS "${VCPKG_PATH_SOURCE}")
   file(READ "${VCPKG_PATH_SOURCE}" VCPKG_PATH)
+  include("${CMAKE_CURRENT_LIST_DIR}/CheckVcpkgInstalledInputs.cmake")
   include("${VCPKG_PATH}/scripts/buildsystems/vcpkg.cmake")
 endif()
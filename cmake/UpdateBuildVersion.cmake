@@ -2,25 +2,33 @@ if(USE_DEVELOPMENT_VERSION)
   message(STATUS "Tagging the build as non-official development version.")
   set(BUILD_VERSION_HASH "non-official")
 else()
-  # Retrieve current git commit hash.
-  execute_process(
-    COMMAND git log -1 --format=%h
-    WORKING_DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR}
-    OUTPUT_VARIABLE BUILD_VERSION_HASH
-    OUTPUT_STRIP_TRAILING_WHITESPACE
-  )
+  if(VERSION_STATE_FILENAME AND EXISTS "${VERSION_STATE_FILENAME}")
+    # Commit hash and status as precomputed by scripts/version_state.py.
+    set(BUILD_VERSION_HASH "")
+    set(GIT_STATUS_OUTPUT "")
+    include("${VERSION_STATE_FILENAME}")
+  else()
+    # Retrieve current git commit hash.
+    execute_process(
+      COMMAND git log -1 --format=%h
+      WORKING_DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR}
+      OUTPUT_VARIABLE BUILD_VERSION_HASH
+      OUTPUT_STRIP_TRAILING_WHITESPACE
+    )
+
+    # Check if build tree is dirty (i.e. modified or untracked files).
+    execute_process(
+      COMMAND git status -s
+      WORKING_DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR}
+      OUTPUT_VARIABLE GIT_STATUS_OUTPUT
+      OUTPUT_STRIP_TRAILING_WHITESPACE
+    )
+  endif()
   if("${BUILD_VERSION_HASH}" STREQUAL "")
     message(WARNING "Failed to retrieve current Git commit hash. You probably don't have Git in your system's PATH or you build from a copy of the repository.")
     set(BUILD_VERSION_HASH "unknown")
   endif()
 
-  # Check if build tree is dirty (i.e. modified or untracked files).
-  execute_process(
-    COMMAND git status -s
-    WORKING_DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR}
-    OUTPUT_VARIABLE GIT_STATUS_OUTPUT
-    OUTPUT_STRIP_TRAILING_WHITESPACE
-  )
   if(NOT "${GIT_STATUS_OUTPUT}" STREQUAL "")
     message(STATUS "${CMAKE_CURRENT_SOURCE_DIR} has pending changes:\n${GIT_STATUS_OUTPUT}")
     if(USE_DIRTY_BUILD_CHECK)
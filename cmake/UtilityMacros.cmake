@@ -182,9 +182,25 @@ function(update_build_version target)
     list(APPEND version_filenames ${version_filename})
   endforeach()
 
+  # With a Python interpreter passed by scripts/cmake.py, the version state is computed by
+  # scripts/version_state.py, which only queries git if the worktree changed.
+  set(version_state_command)
+  set(version_state_definition)
+  if(VERSION_STATE_PYTHON AND NOT USE_DEVELOPMENT_VERSION)
+    # Like the git fallback in cmake/UpdateBuildVersion.cmake, the state refers to the current
+    # source folder, so each target gets its own stamp.
+    set(version_state_filename "${CMAKE_CURRENT_BINARY_DIR}/${target}-version-state.cmake")
+    set(version_state_command
+      COMMAND ${VERSION_STATE_PYTHON} ${CMAKE_SOURCE_DIR}/scripts/version_state.py
+              --source ${CMAKE_CURRENT_SOURCE_DIR} --stamp ${version_state_filename})
+    set(version_state_definition "-DVERSION_STATE_FILENAME=${version_state_filename}")
+  endif()
+
   add_custom_target(${target} ALL
+    ${version_state_command}
     COMMAND ${CMAKE_COMMAND}
             "-DVERSION_FILENAMES=${version_filenames}"
+            ${version_state_definition}
             -DUSE_DEVELOPMENT_VERSION=${USE_DEVELOPMENT_VERSION}
             -DUSE_DIRTY_BUILD_CHECK=${USE_DIRTY_BUILD_CHECK}
             -DBUILD_VERSION_MAJOR=${PROJECT_VERSION_MAJOR}
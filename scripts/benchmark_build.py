@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# Measures configure and build times of a small fixture project (`benchmark_fixture`) configured
+# through cmake.py, for each given combination of config files. The fixture doesn't use a vcpkg
+# manifest, so all scenarios run offline and measure the overhead of cmake.py, CMake and Ninja
+# rather than building dependencies:
+# - cold-configure: configure into an empty build folder,
+# - warm-configure: configure again with the existing CMakeCache.txt,
+# - noop-build: build with nothing to do,
+# - touch-build: rebuild after touching a single translation unit,
+# - install: install the build into an empty prefix using incremental_install.py.
+# Each scenario is repeated, and its statistics are appended to a history file. A scenario is
+# reported as regression if its median exceeds the median of the previous runs on the same host by
+# more than the threshold.
+
+import argparse
+import build_config
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+import vcpkg_cache
+
+history_filename = build_config.cache_path / 'build-benchmark.jsonl'
+fixture_path = build_config.scripts_path / 'benchmark_fixture'
+SCENARIOS = ['cold-configure', 'warm-configure', 'noop-build', 'touch-build', 'install']
+# Differences below this many seconds are never reported as regression, as they are within the
+# noise of process startup.
+MINIMUM_REGRESSION = 0.05
+
+
+def fixture_hash():
+    hasher = hashlib.sha256()
+    for root, dirs, files in os.walk(fixture_path):
+        dirs.sort()
+        for filename in sorted(files):
+            path = Path(root) / filename
+            hasher.update(path.relative_to(fixture_path).as_posix().encode())
+            hasher.update(path.read_bytes())
+    return hasher.hexdigest()[:16]
+
+
+def _run(command):
+    start = timer()
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    duration = timer() - start
+    if process.returncode != 0:
+        print(process.stdout.decode(errors='replace'))
+        print(f'Error: {" ".join(str(argument) for argument in command)} failed with error code ' +
+              f'{process.returncode}.')
+        exit(1)
+    return duration
+
+
+class FixtureRun:
+    # Runs the scenarios for one combination of config files in its own copy of the fixture.
+    def __init__(self, config_set, cmake):
+        self.config_set = config_set
+        self.cmake = cmake
+        config, _, _, _ = build_config.load_configs(config_set)
+        label = '+'.join(Path(name).stem.removeprefix('config-') for name in sorted(config_set))
+        self.work_path = build_config.cache_path / 'benchmark' / label
+        self.source_path = self.work_path / 'source'
+        self.build_path = self.source_path / build_config.build_folder_name(config)
+        self.prefix_path = self.work_path / 'prefix'
+        shutil.copytree(fixture_path, self.source_path, dirs_exist_ok=True)
+
+    def configure(self):
+        return _run([sys.executable, build_config.scripts_path / 'cmake.py', *self.config_set,
+                     '--source', self.source_path])
+
+    def build(self):
+        return _run([self.cmake, '--build', self.build_path, '--config', 'Release'])
+
+    def install(self):
+        return _run([sys.executable, build_config.scripts_path / 'incremental_install.py', self.build_path,
+                     '--config', 'Release', '--prefix', self.prefix_path, '--cmake', self.cmake])
+
+    def _ensure_built(self):
+        if not (self.build_path / 'CMakeCache.txt').exists():
+            self.configure()
+        self.build()
+
+    def measure(self, scenario):
+        """Runs one repetition of a scenario. Returns its duration in seconds, excluding setup."""
+        if scenario == 'cold-configure':
+            shutil.rmtree(self.build_path, ignore_errors=True)
+            return self.configure()
+        if scenario == 'warm-configure':
+            if not (self.build_path / 'CMakeCache.txt').exists():
+                self.configure()
+            # Without the fingerprint cmake.py can't skip CMake, but keeps the existing cache.
+            (self.build_path / 'configure-fingerprint.json').unlink(missing_ok=True)
+            return self.configure()
+        self._ensure_built()
+        if scenario == 'touch-build':
+            os.utime(self.source_path / 'src' / 'main.cpp')
+            return self.build()
+        if scenario == 'install':
+            shutil.rmtree(self.prefix_path, ignore_errors=True)
+            return self.install()
+        return self.build()
+
+
+def statistics_of(durations):
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'max': max(durations),
+        'stdev': statistics.stdev(durations) if len(durations) > 1 else 0.0,
+        'durations': durations
+    }
+
+
+def read_history(filename):
+    records = []
+    try:
+        with open(filename, 'r') as history_file:
+            for line in history_file:
+                try:
+                    records += [json.loads(line)]
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def baseline(history, record, scenario, runs):
+    """Returns the median of the medians of the last `runs` comparable runs of a scenario and the
+    number of runs it is based on."""
+    medians = [entry['scenarios'][scenario]['median'] for entry in history
+               if entry.get('configs') == record['configs'] and entry.get('host') == record['host'] and
+               entry.get('fixture') == record['fixture'] and scenario in entry.get('scenarios', {})]
+    medians = medians[-runs:]
+    return (statistics.median(medians), len(medians)) if medians else (None, 0)
+
+
+def default_config_sets():
+    # Every target config which builds on this host, on top of the base config.
+    host_system = platform.system().lower()
+    config_sets = []
+    for path in sorted(build_config.scripts_path.glob('config-target-*.json')):
+        config, _, _, _ = build_config.load_configs(['config-base.json', path.name])
+        if config['target-system'] == host_system:
+            config_sets += [['config-base.json', path.name]]
+    return config_sets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure configure and build times of a fixture project and detect regressions.')
+    parser.add_argument('configs_json', nargs='*',
+                        help='Comma separated sets of config files to benchmark (default: the base ' +
+                             'config with each target config for this host).')
+    parser.add_argument('-n', '--repetitions', type=int, default=5,
+                        help='Number of runs per scenario.')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, default=None,
+                        help='Scenario to run, may be repeated (default: all scenarios).')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown of the median reported as regression (default: 0.1).')
+    parser.add_argument('--baseline-runs', type=int, default=5,
+                        help='Number of previous runs the baseline median is computed from.')
+    parser.add_argument('--cmake', default='cmake', help='CMake executable (default: cmake from PATH).')
+    args = parser.parse_args()
+
+    cmake = shutil.which(args.cmake)
+    if cmake is None:
+        print(f'Error: Cannot find CMake executable "{args.cmake}".')
+        exit(1)
+    config_sets = [config_set.split(',') for config_set in args.configs_json] or default_config_sets()
+    scenarios = [scenario for scenario in SCENARIOS if scenario in (args.scenario or SCENARIOS)]
+    history = read_history(history_filename)
+    fixture = fixture_hash()
+
+    regressions = 0
+    for config_set in config_sets:
+        run = FixtureRun(config_set, cmake)
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': vcpkg_cache.git_commit(build_config.scripts_path.parent),
+            'host': platform.node(),
+            'configs': sorted(config_set),
+            'fixture': fixture,
+            'repetitions': args.repetitions,
+            'scenarios': {}
+        }
+        print(f'Benchmarking {", ".join(record["configs"])} over {args.repetitions} runs:')
+        for scenario in scenarios:
+            durations = [run.measure(scenario) for _ in range(args.repetitions)]
+            result = statistics_of(durations)
+            record['scenarios'][scenario] = result
+            line = (f'  {scenario}: median {result["median"] * 1000:.1f} ms ' +
+                    f'(min {result["min"] * 1000:.1f} ms, max {result["max"] * 1000:.1f} ms, ' +
+                    f'stdev {result["stdev"] * 1000:.1f} ms)')
+            reference, reference_runs = baseline(history, record, scenario, args.baseline_runs)
+            if reference is not None:
+                change = result['median'] / reference - 1
+                line += f', {change * 100:+.1f}% compared to {reference_runs} previous runs'
+                if change > args.threshold and result['median'] - reference > MINIMUM_REGRESSION:
+                    line += ' REGRESSION'
+                    regressions += 1
+            print(line)
+
+        # The history is only ever appended to, so concurrent runs and older entries stay intact.
+        build_config.cache_path.mkdir(parents=True, exist_ok=True)
+        with open(history_filename, 'a') as history_file:
+            history_file.write(json.dumps(record) + '\n')
+        history += [record]
+
+    if regressions:
+        print(f'Error: {regressions} scenario(s) are slower than their baseline by more than ' +
+              f'{args.threshold * 100:.0f}%.')
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Measures the startup time of cmake.py, i.e. the wall time from launching the interpreter until
+# the first tool probe would be started. This covers interpreter startup, module imports, config
+# merging and schema validation. "cold" runs drop the merged config cache and validation markers
+# before each run, "warm" runs reuse them. Results are appended to a history file, so changes can
+# be compared against previous runs.
+
+import argparse
+import build_config
+from datetime import datetime
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+history_filename = build_config.cache_path / 'startup-benchmark.jsonl'
+
+parser = argparse.ArgumentParser(
+    description='Measure the time until cmake.py starts probing tools.')
+parser.add_argument('-n', '--repetitions', type=int, default=10,
+                    help='Number of runs per variant.')
+parser.add_argument('configs_json', nargs='+')
+args = parser.parse_args()
+
+command = [sys.executable, build_config.scripts_path / 'cmake.py', *args.configs_json, '--exit-before-probes']
+result = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'configs': sorted(args.configs_json)}
+for variant in ['cold', 'warm']:
+    durations = []
+    for _ in range(args.repetitions):
+        if variant == 'cold':
+            shutil.rmtree(build_config.cache_path / 'validated', ignore_errors=True)
+            for cache_filename in build_config.cache_path.glob('*.json'):
+                cache_filename.unlink()
+        start = timer()
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        durations += [timer() - start]
+        if process.returncode != 0:
+            print(process.stdout.decode(errors='replace'))
+            print(f'Error: cmake.py failed with error code {process.returncode}.')
+            exit(1)
+    result[variant] = {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'max': max(durations)
+    }
+
+# Import times of the slowest modules for the warm variant.
+process = subprocess.run([sys.executable, '-X', 'importtime', *command[1:]],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+imports = []
+for line in process.stderr.decode(errors='replace').splitlines():
+    fields = line.split('|')
+    if len(fields) == 3 and fields[1].strip().isdigit():
+        imports += [(int(fields[1].strip()), fields[2].strip())]
+result['slowest-imports'] = [[module, microseconds] for microseconds, module in sorted(imports, reverse=True)[:5]]
+
+previous = None
+try:
+    with open(history_filename, 'r') as history_file:
+        for line in history_file:
+            entry = json.loads(line)
+            if entry.get('configs') == result['configs']:
+                previous = entry
+except (OSError, ValueError):
+    pass
+
+print(f'Time to first probe over {args.repetitions} runs:')
+for variant in ['cold', 'warm']:
+    line = (f'  {variant}: median {result[variant]["median"] * 1000:.1f} ms ' +
+            f'(min {result[variant]["min"] * 1000:.1f} ms, max {result[variant]["max"] * 1000:.1f} ms)')
+    if previous is not None and variant in previous:
+        change = result[variant]['median'] / previous[variant]['median'] - 1
+        line += f', {change * 100:+.1f}% compared to {previous["timestamp"]}'
+    print(line)
+print('Slowest imports (cumulative):')
+for module, microseconds in result['slowest-imports']:
+    print(f'  {module}: {microseconds / 1000:.1f} ms')
+
+build_config.cache_path.mkdir(parents=True, exist_ok=True)
+with open(history_filename, 'a') as history_file:
+    history_file.write(json.dumps(result) + '\n')
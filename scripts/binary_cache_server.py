@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+# Minimal HTTP server for the shared vcpkg binary cache tier (see binary_cache_tiers.py). Supports
+# GET, HEAD and PUT of files below a root folder, which is all vcpkg's `http` binary source and
+# cmake.py need. Uploads are written to a temporary file and renamed in place, so concurrent
+# readers never see partial archives. Intended for local testing and small trusted networks only,
+# as there is no authentication.
+
+import argparse
+import http.server
+import os
+from pathlib import Path
+import shutil
+import socketserver
+
+
+class BinaryCacheHandler(http.server.BaseHTTPRequestHandler):
+    def _path(self):
+        # Reject anything resolving outside the root folder.
+        root = self.server.root
+        path = (root / self.path.split('?', 1)[0].lstrip('/')).resolve()
+        if path != root and root not in path.parents:
+            return None
+        return path
+
+    def _send_file(self, send_body):
+        path = self._path()
+        if path is None or not path.is_file():
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(path.stat().st_size))
+        self.end_headers()
+        if send_body:
+            with open(path, 'rb') as source:
+                shutil.copyfileobj(source, self.wfile, 1024 * 1024)
+
+    def do_GET(self):
+        self._send_file(True)
+
+    def do_HEAD(self):
+        self._send_file(False)
+
+    def do_PUT(self):
+        if self.server.readonly:
+            self.send_error(403)
+            return
+        path = self._path()
+        length = self.headers.get('Content-Length')
+        if path is None or length is None:
+            self.send_error(400)
+            return
+        os.makedirs(path.parent, exist_ok=True)
+        temp_path = path.with_name(f'{path.name}.{os.getpid()}.{id(self)}.partial')
+        try:
+            remaining = int(length)
+            with open(temp_path, 'wb') as target:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise ConnectionError('Upload was interrupted.')
+                    target.write(chunk)
+                    remaining -= len(chunk)
+            os.replace(temp_path, path)
+        except (OSError, ValueError):
+            if temp_path.exists():
+                temp_path.unlink()
+            self.send_error(500)
+            return
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class BinaryCacheServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve a folder as shared vcpkg binary cache tier over HTTP.')
+    parser.add_argument('root', help='Folder holding the archives.')
+    parser.add_argument('--bind', default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1).')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--readonly', action='store_const', const=True, default=False,
+                        help='Reject uploads.')
+    parser.add_argument('--quiet', action='store_const', const=True, default=False,
+                        help='Do not log requests.')
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    os.makedirs(root, exist_ok=True)
+    server = BinaryCacheServer((args.bind, args.port), BinaryCacheHandler)
+    server.root = root
+    server.readonly = args.readonly
+    server.quiet = args.quiet
+    print(f'Serving vcpkg binary cache "{root}" on http://{args.bind}:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Two tier vcpkg binary caching: vcpkg reads from the local `files` tier first and falls back to a
+# shared `http` tier (config setting "vcpkg-binary-cache-http-url"), and writes packages it built
+# into both. vcpkg doesn't copy archives restored from the shared tier into the local one, so
+# cmake.py prefetches all archives a configuration needs into the local tier in parallel before
+# CMake starts, and uploads archives only present locally to the shared tier afterwards.
+#
+# Which archives a configuration needs is only known after vcpkg computed the package ABIs, so
+# each configure publishes the list of installed ABIs as a manifest to the shared tier, keyed on the
+# same inputs as the shared vcpkg_installed trees. Other agents prefetch based on that manifest.
+#
+# Layout of the shared tier: `<url>/<abi>.zip` and `<url>/manifests/<key>.json`. See
+# binary_cache_server.py for a minimal local server.
+
+import concurrent.futures
+import json
+import os
+from pathlib import Path
+import shutil
+import urllib.error
+import urllib.request
+
+TIMEOUT = 30
+
+
+def url_template(base_url):
+    # URL template for vcpkg's `http` binary source.
+    return f'{base_url.rstrip("/")}/{{sha}}.zip'
+
+
+def local_archive(local_path, abi):
+    # Layout of vcpkg's `files` binary source.
+    return Path(local_path) / abi[:2] / f'{abi}.zip'
+
+
+def _download(url, filename):
+    temp_filename = filename.with_name(f'{filename.name}.{os.getpid()}.partial')
+    try:
+        with urllib.request.urlopen(url, timeout=TIMEOUT) as response, open(temp_filename, 'wb') as target:
+            shutil.copyfileobj(response, target, 1024 * 1024)
+        os.replace(temp_filename, filename)
+        return filename.stat().st_size
+    except urllib.error.HTTPError as error:
+        if error.code == 404:
+            return None
+        raise
+    finally:
+        if temp_filename.exists():
+            temp_filename.unlink()
+
+
+def _exists(url):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=TIMEOUT):
+            return True
+    except urllib.error.HTTPError as error:
+        if error.code == 404:
+            return False
+        raise
+
+
+def _upload(url, filename):
+    with open(filename, 'rb') as source:
+        request = urllib.request.Request(url, data=source, method='PUT',
+                                         headers={'Content-Length': str(filename.stat().st_size)})
+        with urllib.request.urlopen(request, timeout=TIMEOUT):
+            pass
+
+
+def fetch_manifest(base_url, key):
+    """Returns the ABIs published for the given inputs key, or an empty list."""
+    try:
+        with urllib.request.urlopen(f'{base_url.rstrip("/")}/manifests/{key}.json', timeout=TIMEOUT) as response:
+            return json.load(response).get('abis', [])
+    except (OSError, ValueError):
+        return []
+
+
+def publish_manifest(base_url, key, abis):
+    data = json.dumps({'abis': sorted(abis)}).encode()
+    request = urllib.request.Request(f'{base_url.rstrip("/")}/manifests/{key}.json', data=data, method='PUT',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=TIMEOUT):
+        pass
+
+
+def prefetch(base_url, local_path, abis, jobs=8):
+    """Downloads archives missing in the local tier from the shared tier in parallel. Returns the
+    number of downloaded archives, their total size and the number of archives not available."""
+    missing = [abi for abi in set(abis) if not local_archive(local_path, abi).exists()]
+    downloaded = 0
+    downloaded_size = 0
+    unavailable = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for abi in missing:
+            filename = local_archive(local_path, abi)
+            os.makedirs(filename.parent, exist_ok=True)
+            futures[executor.submit(_download, f'{base_url.rstrip("/")}/{abi}.zip', filename)] = abi
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                size = future.result()
+            except OSError as error:
+                print(f'Warning: Cannot prefetch "{futures[future]}": {error}')
+                size = None
+            if size is None:
+                unavailable += 1
+            else:
+                downloaded += 1
+                downloaded_size += size
+    return downloaded, downloaded_size, unavailable
+
+
+def write_back(base_url, local_path, abis, jobs=8):
+    """Uploads archives of the local tier which are missing in the shared tier. Returns the number
+    of uploaded archives and their total size."""
+    candidates = [abi for abi in set(abis) if local_archive(local_path, abi).exists()]
+    base_url = base_url.rstrip('/')
+
+    def upload_if_missing(abi):
+        url = f'{base_url}/{abi}.zip'
+        if _exists(url):
+            return 0
+        filename = local_archive(local_path, abi)
+        _upload(url, filename)
+        return filename.stat().st_size
+
+    uploaded = 0
+    uploaded_size = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(upload_if_missing, abi): abi for abi in candidates}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                size = future.result()
+            except OSError as error:
+                print(f'Warning: Cannot upload "{futures[future]}": {error}')
+                continue
+            if size:
+                uploaded += 1
+                uploaded_size += size
+    return uploaded, uploaded_size
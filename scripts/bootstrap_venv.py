@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Creates the virtual Python environment used by cmake.py and installs the required packages from
+# the bundled wheelhouse (see config setting "python-packages-path") without network access.
+# A fingerprint of the requirements, the interpreter and the wheelhouse is stored within the
+# environment, and pip is skipped entirely as long as the fingerprint doesn't change.
+# This script is run by the system interpreter and must only depend on the Python standard library.
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+import platform
+import subprocess
+import sys
+
+scripts_path = Path(__file__).parent.absolute()
+
+parser = argparse.ArgumentParser(
+    description='Create or update the virtual Python environment for cmake.py.')
+parser.add_argument('wheelhouse',
+                    help='Folder containing the wheels of all required Python packages.')
+parser.add_argument('--venv', default=scripts_path / '.venv',
+                    help='Path of the virtual environment (default: scripts/.venv).')
+parser.add_argument('--requirements', default=scripts_path / 'python_requirements.txt',
+                    help='Requirements file (default: scripts/python_requirements.txt).')
+parser.add_argument('--offline-only', action='store_const', const=True, default=False,
+                    help='Fail instead of falling back to the package index if the wheelhouse is incomplete.')
+parser.add_argument('--force', action='store_const', const=True, default=False,
+                    help='Reinstall packages even if the fingerprint is unchanged.')
+args = parser.parse_args()
+
+venv_path = Path(args.venv)
+wheelhouse_path = Path(args.wheelhouse)
+fingerprint_filename = venv_path / 'bootstrap-fingerprint.json'
+if platform.system() == 'Windows':
+    venv_python = venv_path / 'Scripts' / 'python.exe'
+else:
+    venv_python = venv_path / 'bin' / 'python'
+
+# Wheel filenames contain name and version of each package, so listing the wheelhouse is enough
+# to notice updated packages without hashing the wheels.
+wheels = sorted([wheel.name, wheel.stat().st_size] for wheel in wheelhouse_path.glob('*.whl'))
+fingerprint = {
+    'requirements': hashlib.sha256(Path(args.requirements).read_bytes()).hexdigest(),
+    'interpreter': [sys.version, Path(sys.executable).resolve().as_posix()],
+    'wheelhouse': wheels
+}
+
+try:
+    with open(fingerprint_filename, 'r') as fingerprint_file:
+        previous_fingerprint = json.load(fingerprint_file)
+except (OSError, ValueError):
+    previous_fingerprint = None
+if not args.force and previous_fingerprint == fingerprint and venv_python.exists():
+    print('* Python virtual environment is up to date.')
+    exit(0)
+
+if not venv_python.exists():
+    print(f'* Creating Python virtual environment "{venv_path}"...')
+    subprocess.run([sys.executable, '-m', 'venv', venv_path], check=True)
+if fingerprint_filename.exists():
+    os.remove(fingerprint_filename)
+
+print('* Installing required Python modules from wheelhouse...')
+pip_install = [venv_python, '-m', 'pip', 'install', '--disable-pip-version-check', '-r', args.requirements]
+process = subprocess.run(pip_install + ['--no-index', '--find-links', wheelhouse_path])
+if process.returncode != 0:
+    if args.offline_only:
+        print(f'Error: Cannot install required Python modules from "{wheelhouse_path}".')
+        exit(process.returncode)
+    print(f'Warning: Wheelhouse "{wheelhouse_path}" is incomplete for this platform, ' +
+          'falling back to the package index.')
+    process = subprocess.run(pip_install + ['--find-links', wheelhouse_path])
+    if process.returncode != 0:
+        print('Error: Cannot install required Python modules.')
+        exit(process.returncode)
+
+with open(fingerprint_filename, 'w') as fingerprint_file:
+    json.dump(fingerprint, fingerprint_file, indent=4)
@@ -1,10 +1,8 @@
 #!/bin/bash
 
-# ToDo: Check if Google Breakpad tool dump_syms is available
-if [[ ! -x $(command -v dump_syms) ]]; then
-  echo "Error: dump_syms from Google Breakpad is either not installed, or not in PATH."
-  exit 1
-fi
+# Kept for existing callers such as the release job: processes a single binary by forwarding to
+# breakpad_symbols.py, which writes the same `symbols/<name>/<id>/<name>.sym` layout. New callers
+# should use breakpad_symbols.py directly, which processes whole folders in parallel.
 
 print_help()
 {
@@ -17,22 +15,19 @@ if [[ "${2}" == "" ]]; then
   exit 1
 fi
 
-export input=${1}
-export base_path=${2}
-export strip=${3}
+input=${1}
+base_path=${2}
+strip=${3}
 
 if [[ ! -f ${input} ]]; then
   echo "Error: Cannot find input executable \"${input}\""
   print_help
   exit 1
 fi
-export output_path=${base_path}/symbols/$(basename ${input})/$(dump_syms -i ${input} | \
-  head -n1 | cut --delimiter=' ' -f4)
-export output_file=${output_path}/$(basename ${input}).sym
-mkdir -p "${output_path}"
-if [[ ! -f ${output_file} ]]; then
-  dump_syms ${input} > "${output_file}"
-fi
+# Like before, a strip command which cannot be found is ignored.
+strip_arguments=()
 if [[ -x "$(which "${strip}" 2>/dev/null | head -n 1)" ]]; then
-  ${strip} ${input}
+  strip_arguments=( --strip "${strip}" )
 fi
+exec python "$(dirname "$(readlink -f "${BASH_SOURCE[0]}")")/breakpad_symbols.py" "${input}" \
+  --output "${base_path}/symbols" "${strip_arguments[@]}"
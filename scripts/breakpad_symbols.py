@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+# Extracts Google Breakpad symbols of all executables and shared libraries below the install prefix
+# (`production`, see cmake.py), including the third-party libraries vcpkg deploys next to them.
+# Symbols are written to `<output>/<module name>/<module id>/<module name>.sym`, the layout expected
+# by minidump_stackwalk and symbol servers.
+#
+# dump_syms runs once per binary in a process pool; the module ID is taken from the `MODULE` line
+# at the start of its output, which is streamed into the final file. A persistent index within the
+# output folder remembers existing modules and the module of each binary by size and modification
+# time, so unchanged binaries are neither parsed nor is the symbols folder walked again. For changed
+# ELF binaries the module ID is derived from the GNU build ID, so a binary whose symbols exist already
+# is skipped without running dump_syms.
+
+import argparse
+import concurrent.futures
+import json
+import os
+from pathlib import Path
+import shutil
+import struct
+import subprocess
+import tempfile
+
+INDEX_FILENAME = '.breakpad-symbols-index.json'
+# Extensions of binaries on Windows; on other systems binaries are detected by their ELF header.
+PE_SUFFIXES = ['.dll', '.exe']
+# Number of bytes at the end of dump_syms' error output reported for failed binaries.
+ERROR_TAIL_SIZE = 4096
+
+
+def is_binary(path):
+    if path.suffix.lower() in PE_SUFFIXES:
+        return True
+    try:
+        with open(path, 'rb') as binary_file:
+            return binary_file.read(4) == b'\x7fELF'
+    except OSError:
+        return False
+
+
+def elf_build_id(path):
+    """Returns the GNU build ID of an ELF file, or None if it doesn't have one."""
+    try:
+        with open(path, 'rb') as elf_file:
+            header = elf_file.read(64)
+            if len(header) < 52 or header[:4] != b'\x7fELF':
+                return None
+            is_64bit = header[4] == 2
+            byte_order = '<' if header[5] == 1 else '>'
+            if is_64bit:
+                program_offset, = struct.unpack_from(f'{byte_order}Q', header, 32)
+                entry_size, entry_count = struct.unpack_from(f'{byte_order}HH', header, 54)
+            else:
+                program_offset, = struct.unpack_from(f'{byte_order}I', header, 28)
+                entry_size, entry_count = struct.unpack_from(f'{byte_order}HH', header, 42)
+            elf_file.seek(program_offset)
+            program_headers = elf_file.read(entry_size * entry_count)
+            for index in range(entry_count):
+                entry = program_headers[index * entry_size:(index + 1) * entry_size]
+                # Only PT_NOTE segments (type 4) may hold the build ID.
+                if is_64bit:
+                    segment_type, _, offset, _, _, size = struct.unpack_from(f'{byte_order}IIQQQQ', entry)
+                else:
+                    segment_type, offset, _, _, size = struct.unpack_from(f'{byte_order}IIIII', entry)
+                if segment_type != 4:
+                    continue
+                elf_file.seek(offset)
+                notes = elf_file.read(size)
+                position = 0
+                while position + 12 <= len(notes):
+                    name_size, descriptor_size, note_type = struct.unpack_from(f'{byte_order}III', notes, position)
+                    name_start = position + 12
+                    descriptor_start = name_start + (name_size + 3) // 4 * 4
+                    if note_type == 3 and notes[name_start:name_start + name_size] == b'GNU\0':
+                        return notes[descriptor_start:descriptor_start + descriptor_size]
+                    position = descriptor_start + (descriptor_size + 3) // 4 * 4
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def breakpad_module_id(build_id):
+    # Breakpad uses the first 16 bytes of the build ID as GUID, with the first three fields in big
+    # endian, followed by an age of zero.
+    identifier = (build_id + bytes(16))[:16]
+    guid = identifier[3::-1] + identifier[5:3:-1] + identifier[7:5:-1] + identifier[8:]
+    return guid.hex().upper() + '0'
+
+
+def symbol_filename(module_name):
+    # Windows modules are named after their PDB file, whose symbols drop the .pdb extension.
+    if module_name.lower().endswith('.pdb'):
+        module_name = module_name[:-4]
+    return f'{module_name}.sym'
+
+
+def dump_module(dump_syms, binary, output_path):
+    """Dumps the symbols of `binary` in a single dump_syms pass. Returns the module key
+    `<name>/<id>` and an error message, one of which is None."""
+    temp_filename = Path(output_path) / f'.{os.getpid()}.{Path(binary).name}.sym.partial'
+    try:
+        # dump_syms may write lots of warnings, which go to a file so they can't block the process
+        # while its output is read.
+        with open(temp_filename, 'wb') as temp_file, tempfile.TemporaryFile() as error_file, \
+             subprocess.Popen([dump_syms, binary], stdout=subprocess.PIPE, stderr=error_file) as process:
+            first_line = process.stdout.readline()
+            temp_file.write(first_line)
+            shutil.copyfileobj(process.stdout, temp_file, 1024 * 1024)
+            process.wait()
+            error_file.seek(max(0, error_file.tell() - ERROR_TAIL_SIZE))
+            errors = error_file.read()
+        fields = first_line.decode(errors='replace').split(maxsplit=4)
+        if process.returncode != 0 or len(fields) != 5 or fields[0] != 'MODULE':
+            return None, errors.decode(errors='replace').strip() or 'No symbols found.'
+        module_id, module_name = fields[3], fields[4].strip()
+        module_path = Path(output_path) / module_name / module_id
+        os.makedirs(module_path, exist_ok=True)
+        os.replace(temp_filename, module_path / symbol_filename(module_name))
+        return f'{module_name}/{module_id}', None
+    except OSError as error:
+        return None, str(error)
+    finally:
+        if temp_filename.exists():
+            temp_filename.unlink()
+
+
+class SymbolIndex:
+    def __init__(self, output_path):
+        self.filename = Path(output_path) / INDEX_FILENAME
+        # Keys `<name>/<id>` of all modules with symbols, and the module of each binary by identity.
+        self.modules = set()
+        self.binaries = {}
+        try:
+            with open(self.filename, 'r') as index_file:
+                index = json.load(index_file)
+            self.modules = set(index['modules'])
+            self.binaries = index['binaries']
+        except (OSError, ValueError, KeyError):
+            self.rescan()
+
+    def rescan(self):
+        # One walk over the symbols folder, only required without index.
+        self.modules = set()
+        output_path = self.filename.parent
+        if not output_path.is_dir():
+            return
+        for name_entry in os.scandir(output_path):
+            if not name_entry.is_dir():
+                continue
+            for id_entry in os.scandir(name_entry.path):
+                if (Path(id_entry.path) / symbol_filename(name_entry.name)).is_file():
+                    self.modules.add(f'{name_entry.name}/{id_entry.name}')
+
+    def lookup(self, binary, stat):
+        """Returns whether the file is unchanged since it was stored, and its module key, which is
+        None for files which are no binaries."""
+        entry = self.binaries.get(Path(binary).as_posix())
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            return False, None
+        if entry[2] is not None and entry[2] not in self.modules:
+            return False, None
+        return True, entry[2]
+
+    def store(self, binary, module_key):
+        stat = os.stat(binary)
+        self.binaries[Path(binary).as_posix()] = [stat.st_size, stat.st_mtime_ns, module_key]
+        if module_key is not None:
+            self.modules.add(module_key)
+
+    def save(self):
+        os.makedirs(self.filename.parent, exist_ok=True)
+        temp_filename = self.filename.with_suffix('.tmp')
+        with open(temp_filename, 'w') as index_file:
+            json.dump({'modules': sorted(self.modules), 'binaries': self.binaries}, index_file)
+        os.replace(temp_filename, self.filename)
+
+
+def find_binaries(paths):
+    for path in paths:
+        path = Path(path)
+        if path.is_file():
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                file_path = Path(root) / filename
+                if not file_path.is_symlink():
+                    yield file_path
+
+
+def _strip(strip, binary):
+    if subprocess.call([strip, binary]) != 0:
+        print(f'Warning: Cannot strip "{binary}".')
+
+
+def process_binaries(paths, output_path, dump_syms, strip=None, jobs=None, rescan=False):
+    """Dumps symbols of all binaries below `paths`. Returns the number of dumped, skipped and
+    failed binaries."""
+    os.makedirs(output_path, exist_ok=True)
+    index = SymbolIndex(output_path)
+    if rescan:
+        index.rescan()
+    pending = []
+    skipped = 0
+    for binary in find_binaries(paths):
+        unchanged, module_key = index.lookup(binary, binary.stat())
+        if unchanged and module_key is None:
+            continue
+        if not unchanged:
+            if not is_binary(binary):
+                index.store(binary, None)
+                continue
+            build_id = elf_build_id(binary)
+            # The module name is the file name for ELF binaries.
+            module_key = None if build_id is None else f'{binary.name}/{breakpad_module_id(build_id)}'
+            if module_key not in index.modules:
+                pending += [binary]
+                continue
+        skipped += 1
+        if not unchanged:
+            # Unchanged binaries were stripped already when they were stored.
+            if strip is not None:
+                _strip(strip, binary)
+            index.store(binary, module_key)
+
+    dumped = 0
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(dump_module, dump_syms, str(binary), str(output_path)): binary
+                   for binary in pending}
+        for future in concurrent.futures.as_completed(futures):
+            binary = futures[future]
+            module_key, error = future.result()
+            if module_key is None:
+                print(f'Warning: Cannot dump symbols of "{binary}": {error}')
+                failed += 1
+                continue
+            print(f'Dumped symbols of "{binary}" to "{module_key}".')
+            dumped += 1
+            if strip is not None:
+                _strip(strip, binary)
+            index.store(binary, module_key)
+    index.save()
+    return dumped, skipped, failed
+
+
+def main():
+    base_path = Path(__file__).parent.absolute().parent
+    parser = argparse.ArgumentParser(
+        description='Extract Google Breakpad symbols of all binaries within the install prefix.')
+    parser.add_argument('paths', nargs='*', default=[base_path / 'production'],
+                        help='Binaries or folders to process (default: the install prefix "production").')
+    parser.add_argument('--output', default=base_path / 'symbols',
+                        help='Symbols folder (default: "symbols" within the repository).')
+    parser.add_argument('--dump-syms', default='dump_syms',
+                        help='dump_syms executable (default: dump_syms from PATH).')
+    parser.add_argument('--strip', default=None,
+                        help='Strip binaries with the given command after their symbols were dumped.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of parallel dump_syms processes (default: number of cores).')
+    parser.add_argument('--rescan', action='store_const', const=True, default=False,
+                        help='Rebuild the index of existing symbol files from the symbols folder.')
+    args = parser.parse_args()
+
+    dump_syms = shutil.which(args.dump_syms)
+    if dump_syms is None:
+        print('Error: dump_syms from Google Breakpad is either not installed, or not in PATH.')
+        exit(1)
+    strip = None
+    if args.strip:
+        strip = shutil.which(args.strip)
+        if strip is None:
+            print(f'Error: Cannot find strip command "{args.strip}".')
+            exit(1)
+    dumped, skipped, failed = process_binaries(args.paths, Path(args.output), dump_syms, strip,
+                                               args.jobs, args.rescan)
+    print(f'Dumped symbols of {dumped} binaries, {skipped} binaries were unchanged, {failed} failed.')
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+# Long-running local build agent which accepts configure jobs over a Unix domain socket or a
+# localhost HTTP port. Each job runs cmake.py in a worker process that was started ahead of time
+# and has already imported all modules and compiled the config schema validator, so jobs skip the
+# interpreter and import startup. The agent keeps the merged configs and tool probe results in
+# memory (see `build_config.memory_cache`), hands them to each worker along with its job and takes
+# over the ones the job updated, so they are only read from disk again if the files changed
+# meanwhile. A warm worker is replaced as soon as it took a job, so the next job finds one as well.
+# Jobs for the same build folder run one after another, and a job identical to one still waiting
+# in the queue is merged into it. Output of each job is streamed to clients while it runs.
+#
+# API (HTTP/1.0, JSON):
+#   POST /jobs                 {"configs": [...], "options": [...], "environment": {...}}
+#                              -> {"id": ..., "deduplicated": bool, "build-folder": ...}
+#   GET  /jobs                 -> list of job states
+#   GET  /jobs/<id>            -> job state including timings and return code
+#   GET  /jobs/<id>/output     -> output of the job, streamed until it finished
+#   POST /shutdown             -> stops the agent once running jobs finished
+#
+# The agent only binds to local addresses and must run from the virtual Python environment, just
+# like cmake.py itself. Every request must carry the token the agent writes to a file only readable
+# by its user (`Authorization: Bearer <token>`), POST requests must be `application/json`, and the
+# Host header must name the agent's own address, so neither other users nor web pages can submit
+# jobs. Jobs run with the agent's environment, of which clients may only override the variables
+# affecting the configuration (see `JOB_ENVIRONMENT`), and only config files within `scripts/`.
+
+import argparse
+import build_config
+import collections
+from datetime import datetime
+import hashlib
+import hmac
+import http.client
+import http.server
+import importlib
+import json
+import os
+from pathlib import Path
+import platform
+import re
+import runpy
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+from timeit import default_timer as timer
+
+DEFAULT_SOCKET = build_config.cache_path / 'build-agent.sock'
+DEFAULT_PORT = 8765
+DEFAULT_TOKEN = build_config.cache_path / 'build-agent.token'
+# Options of cmake.py which may be passed on to jobs.
+JOB_OPTIONS = ['--refresh-toolchain', '--force-configure', '--trace']
+# Modules imported by cmake.py, loaded by workers before they receive a job.
+WORKER_PRELOAD = ['binary_cache_tiers', 'build_log', 'build_trace', 'compiler_cache', 'concurrency_planner',
+                  'concurrent.futures', 'ram_buildtrees', 'traceback', 'vcpkg_cache', 'vcpkg_log_analyzer']
+# Environment variables clients may pass to jobs, as names and name prefixes. They are also the
+# only variables which distinguish otherwise identical jobs.
+JOB_ENVIRONMENT = ['CC', 'CXX', 'PATH']
+JOB_ENVIRONMENT_PREFIXES = ['VCPKG_']
+
+
+def job_environment(environment):
+    """Returns the subset of `environment` clients may pass to jobs."""
+    return {key: str(value) for key, value in environment.items()
+            if key in JOB_ENVIRONMENT or any(key.startswith(prefix) for prefix in JOB_ENVIRONMENT_PREFIXES)}
+
+
+def job_configs(configs):
+    """Returns the config file names, refusing any file outside of `scripts/`."""
+    for config in configs:
+        path = (build_config.scripts_path / str(config)).resolve()
+        if path.parent != build_config.scripts_path.resolve() or not path.is_file():
+            raise ValueError(f'Config "{config}" is no config file within "{build_config.scripts_path}".')
+    return [str(config) for config in configs]
+
+
+def write_token(token_filename):
+    """Writes a new random token, readable by the current user only."""
+    token = secrets.token_hex(32)
+    os.makedirs(Path(token_filename).parent, exist_ok=True)
+    Path(token_filename).unlink(missing_ok=True)
+    file_descriptor = os.open(token_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(file_descriptor, 'w') as token_file:
+        token_file.write(token)
+    return token
+
+
+def read_token(token_filename):
+    return Path(token_filename).read_text().strip()
+
+
+class Job:
+    def __init__(self, id, configs, options, environment, build_folder):
+        self.id = id
+        self.configs = configs
+        self.options = options
+        self.environment = environment
+        self.build_folder = build_folder
+        self.key = hashlib.sha256(json.dumps([build_folder, sorted(configs), options, environment],
+                                             sort_keys=True).encode()).hexdigest()
+        self.state = 'queued'
+        self.returncode = None
+        self.output = []
+        self.queued = timer()
+        self.started = None
+        self.finished = None
+        self.submitted = datetime.now().isoformat(timespec='seconds')
+        self.submissions = 1
+
+    def describe(self):
+        now = timer()
+        return {
+            'id': self.id,
+            'state': self.state,
+            'configs': self.configs,
+            'options': self.options,
+            'build-folder': self.build_folder,
+            'submitted': self.submitted,
+            'submissions': self.submissions,
+            'returncode': self.returncode,
+            'queued-seconds': (self.started or now) - self.queued,
+            'run-seconds': (self.finished or now) - self.started if self.started is not None else None
+        }
+
+
+class BuildAgent:
+    def __init__(self, max_jobs, script):
+        self.max_jobs = max_jobs
+        self.script = script
+        self.jobs = {}
+        self.queue = collections.deque()
+        self.running_folders = set()
+        self.condition = threading.Condition()
+        self.next_id = 1
+        self.shutting_down = False
+        self.warm_workers = collections.deque()
+        for _ in range(max_jobs):
+            self.warm_workers.append(BuildAgent.start_worker())
+        threading.Thread(target=self.dispatch, daemon=True).start()
+
+    @staticmethod
+    def start_worker():
+        return subprocess.Popen([sys.executable, Path(__file__).absolute(), 'worker'],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                env=dict(os.environ, PYTHONUNBUFFERED='1'))
+
+    def submit(self, configs, options, environment):
+        for option in options:
+            if option not in JOB_OPTIONS:
+                raise ValueError(f'Option "{option}" is not supported by the build agent.')
+        configs = job_configs(configs)
+        environment = job_environment(environment)
+        config, _, _, _ = build_config.load_configs(configs)
+        build_folder = build_config.build_folder_name(config)
+        with self.condition:
+            if self.shutting_down:
+                raise ValueError('The build agent is shutting down.')
+            job = Job(str(self.next_id), configs, options, environment, build_folder)
+            # A job still waiting for its turn would produce the very same result.
+            for queued_job in self.queue:
+                if queued_job.key == job.key:
+                    queued_job.submissions += 1
+                    return queued_job, True
+            self.next_id += 1
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.condition.notify_all()
+            return job, False
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                job = None
+                while job is None:
+                    running = len(self.running_folders)
+                    if running < self.max_jobs:
+                        job = next((job for job in self.queue if job.build_folder not in self.running_folders), None)
+                    if job is None:
+                        self.condition.wait()
+                self.queue.remove(job)
+                self.running_folders.add(job.build_folder)
+                job.state = 'running'
+                job.started = timer()
+                warm_worker = self.warm_workers.popleft() if self.warm_workers else None
+            worker = warm_worker or BuildAgent.start_worker()
+            threading.Thread(target=self.run, args=(job, worker), daemon=True).start()
+            if warm_worker is not None:
+                # Replace the warm worker right away, so the next job finds one as well.
+                replacement = BuildAgent.start_worker()
+                with self.condition:
+                    self.warm_workers.append(replacement)
+
+    def run(self, job, worker):
+        state_filename = build_config.cache_path / f'build-agent-{os.getpid()}-job-{job.id}.json'
+        try:
+            # Up to max_jobs configure runs share the machine, like in matrix mode of cmake.py.
+            options = [*job.options, '--resource-share', str(self.max_jobs)]
+            with self.condition:
+                memory_cache = dict(build_config.memory_cache)
+            worker.stdin.write((json.dumps({'script': str(self.script), 'configs': job.configs, 'options': options,
+                                            'environment': job.environment, 'memory-cache': memory_cache,
+                                            'state-filename': str(state_filename)}) + '\n').encode())
+            worker.stdin.close()
+            for line in worker.stdout:
+                with self.condition:
+                    job.output.append(line.decode(errors='replace'))
+                    self.condition.notify_all()
+            returncode = worker.wait()
+        except OSError as error:
+            with self.condition:
+                job.output.append(f'Error: Build agent worker failed: {error}\n')
+            returncode = 1
+        try:
+            with open(state_filename, 'r') as state_file:
+                memory_cache = json.load(state_file)
+            with self.condition:
+                build_config.memory_cache.update(memory_cache)
+        except (OSError, ValueError):
+            pass
+        state_filename.unlink(missing_ok=True)
+        with self.condition:
+            job.returncode = returncode
+            job.finished = timer()
+            job.state = 'succeeded' if returncode == 0 else 'failed'
+            self.running_folders.discard(job.build_folder)
+            self.condition.notify_all()
+
+    def stream_output(self, job, write):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(job.output) and job.finished is None:
+                    self.condition.wait()
+                lines = job.output[index:]
+                finished = job.finished is not None
+            index += len(lines)
+            if lines:
+                write(''.join(lines))
+            if finished and index >= len(job.output):
+                return
+
+    def shutdown(self):
+        with self.condition:
+            self.shutting_down = True
+            while self.queue or self.running_folders:
+                self.condition.wait()
+            for worker in self.warm_workers:
+                worker.kill()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    def address_string(self):
+        # Unix domain socket clients have no address.
+        return self.client_address[0] if self.client_address else 'local'
+
+    def send_json(self, status, data):
+        body = json.dumps(data, indent=4).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def check_request(self):
+        # Returns whether the request may be served, after sending an error response otherwise.
+        if self.headers.get('Host') not in self.server.allowed_hosts:
+            self.send_json(403, {'error': 'Unexpected Host header.'})
+            return False
+        authorization = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {self.server.token}'.encode()):
+            self.send_json(401, {'error': 'Missing or invalid token.'})
+            return False
+        if self.command == 'POST' and \
+                self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self.send_json(415, {'error': 'Requests must be sent as application/json.'})
+            return False
+        return True
+
+    def do_GET(self):
+        agent = self.server.agent
+        if not self.check_request():
+            return
+        search_result = re.fullmatch(r'/jobs(?:/(\w+)(/output)?)?', self.path)
+        if search_result is None:
+            self.send_json(404, {'error': 'Unknown resource.'})
+            return
+        if search_result.group(1) is None:
+            with agent.condition:
+                self.send_json(200, [job.describe() for job in agent.jobs.values()])
+            return
+        job = agent.jobs.get(search_result.group(1))
+        if job is None:
+            self.send_json(404, {'error': f'Unknown job "{search_result.group(1)}".'})
+        elif search_result.group(2) is None:
+            with agent.condition:
+                self.send_json(200, job.describe())
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.end_headers()
+
+            def write(text):
+                self.wfile.write(text.encode())
+                self.wfile.flush()
+            try:
+                agent.stream_output(job, write)
+            except OSError:
+                pass
+
+    def do_POST(self):
+        agent = self.server.agent
+        if not self.check_request():
+            return
+        if self.path == '/shutdown':
+            self.send_json(200, {'state': 'shutting down'})
+            threading.Thread(target=lambda: (agent.shutdown(), self.server.shutdown()), daemon=True).start()
+            return
+        if self.path != '/jobs':
+            self.send_json(404, {'error': 'Unknown resource.'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job, deduplicated = agent.submit(list(request['configs']), list(request.get('options', [])),
+                                             dict(request.get('environment', {})))
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        self.send_json(200, {'id': job.id, 'deduplicated': deduplicated, 'build-folder': job.build_folder})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class LocalHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(self.socket_path))
+
+
+def connect(args):
+    if args.port is not None:
+        return http.client.HTTPConnection('127.0.0.1', args.port)
+    return UnixHTTPConnection(args.socket)
+
+
+def request(args, method, path, data=None):
+    connection = connect(args)
+    body = json.dumps(data).encode() if data is not None else None
+    connection.request(method, path, body=body,
+                       headers={'Content-Type': 'application/json',
+                                'Authorization': f'Bearer {read_token(args.token)}'})
+    response = connection.getresponse()
+    return response, connection
+
+
+def serve(args):
+    agent = BuildAgent(args.jobs, Path(args.script).absolute())
+    if args.port is not None:
+        server = LocalHTTPServer(('127.0.0.1', args.port), RequestHandler)
+        server.allowed_hosts = [f'127.0.0.1:{args.port}', f'localhost:{args.port}']
+        address = f'http://127.0.0.1:{args.port}'
+    else:
+        socket_path = Path(args.socket)
+        os.makedirs(socket_path.parent, exist_ok=True)
+        if socket_path.exists():
+            socket_path.unlink()
+        server = UnixHTTPServer(str(socket_path), RequestHandler)
+        server.allowed_hosts = ['localhost']
+        os.chmod(socket_path, 0o600)
+        address = socket_path.as_posix()
+    server.agent = agent
+    server.token = write_token(args.token)
+    print(f'Build agent listening on {address} with {args.jobs} parallel jobs.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Path(args.token).unlink(missing_ok=True)
+        if args.port is None:
+            Path(args.socket).unlink(missing_ok=True)
+
+
+def worker():
+    # Warm up while waiting for the job: import everything cmake.py needs and compile the schema
+    # validator by validating the base config.
+    for module in WORKER_PRELOAD:
+        importlib.import_module(module)
+    config, _, _, _ = build_config.load_configs(['config-base.json'])
+    try:
+        build_config.validate_config(config, use_cache=False)
+    except Exception:
+        # The base config alone lacks target settings, only the compiled validator matters.
+        pass
+    job = json.loads(sys.stdin.readline())
+    os.environ.update(job['environment'])
+    build_config.memory_cache.update(job['memory-cache'])
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.argv = [job['script'], *job['configs'], *job['options']]
+    try:
+        runpy.run_path(sys.argv[0], run_name='__main__')
+    finally:
+        # Hand the cache files read or written by the job back to the agent.
+        try:
+            with open(job['state-filename'], 'w') as state_file:
+                json.dump(build_config.memory_cache, state_file)
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local build agent which runs cmake.py jobs with warm state.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help='Unix domain socket to listen on or connect to (default: scripts/.config-cache/build-agent.sock).')
+    parser.add_argument('--token', default=DEFAULT_TOKEN,
+                        help='File the agent writes its access token to (default: scripts/.config-cache/build-agent.token).')
+    parser.add_argument('--port', type=int, default=None if hasattr(socket, 'AF_UNIX') else DEFAULT_PORT,
+                        help='Use HTTP on this localhost port instead of a Unix domain socket.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the build agent.')
+    serve_parser.add_argument('--jobs', type=int, default=2,
+                              help='Number of configure jobs to run in parallel.')
+    # Used by tests to run a stub instead of cmake.py.
+    serve_parser.add_argument('--script', default=build_config.scripts_path / 'cmake.py', help=argparse.SUPPRESS)
+    submit_parser = subparsers.add_parser('submit', help='Submit a configure job and stream its output.')
+    submit_parser.add_argument('configs_json', nargs='+')
+    for option in JOB_OPTIONS:
+        submit_parser.add_argument(option, action='store_const', const=True, default=False)
+    submit_parser.add_argument('--no-wait', action='store_const', const=True, default=False,
+                               help='Return right after submitting the job.')
+    status_parser = subparsers.add_parser('status', help='Show the state of all or a single job.')
+    status_parser.add_argument('id', nargs='?')
+    subparsers.add_parser('shutdown', help='Stop the agent once running jobs finished.')
+    # Internal: warm worker process started by the agent.
+    subparsers.add_parser('worker')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        worker()
+        return
+    if args.command == 'serve':
+        if platform.system() == 'Windows' and args.port is None:
+            args.port = DEFAULT_PORT
+        serve(args)
+        return
+
+    try:
+        match args.command:
+            case 'submit':
+                options = [option for option in JOB_OPTIONS if getattr(args, option[2:].replace('-', '_'))]
+                response, _ = request(args, 'POST', '/jobs', {'configs': args.configs_json, 'options': options,
+                                                              'environment': job_environment(os.environ)})
+                result = json.loads(response.read())
+                if response.status != 200:
+                    print(f'Error: {result["error"]}')
+                    exit(1)
+                print(f'Job {result["id"]} for "{result["build-folder"]}" ' +
+                      f'{"merged into an already queued job" if result["deduplicated"] else "submitted"}.')
+                if args.no_wait:
+                    return
+                response, _ = request(args, 'GET', f'/jobs/{result["id"]}/output')
+                while chunk := response.read1(65536):
+                    sys.stdout.write(chunk.decode(errors='replace'))
+                    sys.stdout.flush()
+                response, _ = request(args, 'GET', f'/jobs/{result["id"]}')
+                job = json.loads(response.read())
+                print(f'Job {job["id"]} {job["state"]} after {job["queued-seconds"]:.1f}s queued and ' +
+                      f'{job["run-seconds"]:.1f}s running.')
+                exit(job['returncode'])
+            case 'status':
+                response, _ = request(args, 'GET', f'/jobs/{args.id}' if args.id else '/jobs')
+                print(response.read().decode())
+            case 'shutdown':
+                response, _ = request(args, 'POST', '/shutdown', {})
+                print(response.read().decode())
+    except (OSError, http.client.HTTPException) as error:
+        print(f'Error: Cannot reach the build agent: {error}')
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# Loading, merging and path expansion of the `scripts/config-*.json` files, shared by cmake.py and
+# query_config.py. This module must only depend on the Python standard library, because
+# query_config.py runs before the virtual Python environment is set up.
+
+import collections.abc
+import hashlib
+import json
+import os
+from pathlib import Path
+
+scripts_path = Path(__file__).parent.absolute()
+base_path = scripts_path.parent
+# Merged configs are cached here, keyed on the list of input files and validated by their mtimes.
+# Tests point this to a temporary folder.
+cache_path = Path(os.environ.get('CMAKE_PY_CACHE_PATH', scripts_path / '.config-cache'))
+
+# In-memory copies of cache files, keyed on their POSIX path, as [mtime_ns, size, content]. A
+# copy is only used as long as the file still has the same mtime and size. Long-running processes
+# like the build agent keep these and hand them to the processes they start (see build_agent.py).
+memory_cache = {}
+
+# Compiled JSON schema validators, keyed on the hash of the schema file contents.
+_validators = {}
+
+# Variables which may be used within path settings, e.g. "~/vcpkg_cache/${target-system}".
+PATH_VARIABLES = [
+    'target-architecture',
+    'target-sub-architecture',
+    'target-system',
+    'vendor',
+    'cpp-runtime'
+]
+
+
+def _file_signature(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_cache_file(filename):
+    """Returns the content of a JSON cache file, from memory if it is unchanged since it was last
+    read or written by this process. Raises OSError or ValueError like reading the file does."""
+    key = Path(filename).as_posix()
+    signature = _file_signature(filename)
+    cached = memory_cache.get(key)
+    if cached is not None and signature is not None and cached[:2] == signature:
+        return cached[2]
+    with open(filename, 'r') as cache_file:
+        content = json.load(cache_file)
+    if signature is not None and _file_signature(filename) == signature:
+        memory_cache[key] = signature + [content]
+    return content
+
+
+def write_cache_file(filename, content, indent=None):
+    """Writes a JSON cache file via rename and keeps a copy in memory."""
+    filename = Path(filename)
+    temp_filename = filename.with_name(f'{filename.name}.{os.getpid()}.tmp')
+    with open(temp_filename, 'w') as cache_file:
+        json.dump(content, cache_file, indent=indent)
+    os.replace(temp_filename, filename)
+    signature = _file_signature(filename)
+    if signature is not None:
+        memory_cache[filename.as_posix()] = signature + [content]
+
+
+def update_config(config, new_config, config_guard, config_filename, warnings):
+    for key, new_value in new_config.items():
+        if isinstance(new_value, collections.abc.Mapping):
+            config[key] = update_config(config.get(key, {}), new_value,
+                                        config_guard.setdefault(key, {}), config_filename, warnings)
+        else:
+            # Keep track of where each setting originates from.
+            if key in config_guard and config_guard[key] != "config-base.json":
+                warnings.append(f'Warning: Config "{key}"="{config[key]}" previously set in "{config_guard[key]}" ' +
+                                f'will be overwritten with "{key}"="{new_value}" set in "{config_filename}"!')
+            config_guard[key] = config_filename
+            config[key] = new_value
+    return config
+
+
+def config_paths(config_filenames):
+    # Config files are always merged in sorted order, so "config-base.json" comes first and
+    # overlays are applied independent of the order given on the command line.
+    return [scripts_path / config_filename for config_filename in sorted(config_filenames)]
+
+
+def load_configs(config_filenames, use_cache=True):
+    """Merges the given config files. Returns the merged config, a tree of the same shape naming
+    the file each setting originates from, a list of warnings about overwritten settings and
+    whether the result was taken from the cache."""
+    paths = config_paths(config_filenames)
+    inputs = []
+    for path in paths:
+        stat = path.stat()
+        inputs += [[path.as_posix(), stat.st_mtime_ns, stat.st_size]]
+    cache_key = hashlib.sha256(json.dumps([path.as_posix() for path in paths]).encode()).hexdigest()
+    cache_filename = cache_path / f'{cache_key[:32]}.json'
+    if use_cache:
+        try:
+            cached = read_cache_file(cache_filename)
+            if cached['inputs'] == inputs:
+                return cached['config'], cached['guard'], cached['warnings'], True
+        except (OSError, ValueError, KeyError):
+            pass
+
+    config = {}
+    guard = {}
+    warnings = []
+    for path in paths:
+        with open(path, 'r') as config_file:
+            config = update_config(config, json.load(config_file), guard, path.name, warnings)
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        write_cache_file(cache_filename, {'inputs': inputs, 'config': config, 'guard': guard, 'warnings': warnings})
+    except OSError:
+        pass
+    return config, guard, warnings, False
+
+
+def validate_config(config, schema_filename=scripts_path / 'config.schema.json', use_cache=True):
+    """Validates a merged config against the JSON schema and raises jsonschema.ValidationError on
+    failure. Returns True if validation was skipped, because the very same config was already
+    validated against the very same schema before."""
+    schema_data = Path(schema_filename).read_bytes()
+    schema_hash = hashlib.sha256(schema_data).hexdigest()
+    config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    marker_filename = cache_path / 'validated' / \
+        hashlib.sha256(f'{schema_hash}:{config_hash}'.encode()).hexdigest()[:32]
+    if use_cache and marker_filename.exists():
+        return True
+
+    # Importing jsonschema takes a noticeable amount of time, so only do it when needed.
+    import jsonschema
+    validator = _validators.get(schema_hash)
+    if validator is None:
+        schema = json.loads(schema_data)
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        validator = validator_class(schema)
+        _validators[schema_hash] = validator
+    # Report the most relevant error, just like jsonschema.validate() does.
+    error = jsonschema.exceptions.best_match(validator.iter_errors(config))
+    if error is not None:
+        raise error
+    try:
+        os.makedirs(marker_filename.parent, exist_ok=True)
+        with open(marker_filename, 'w') as marker_file:
+            marker_file.write(f'{schema_hash}\n{config_hash}\n')
+    except OSError:
+        pass
+    return False
+
+
+def is_path_key(key):
+    return key.endswith('-path') or key.endswith('-root') or key.startswith('vcpkg-overlay-')
+
+
+def expand_path(path, config):
+    path = (path
+        .replace('\\', '/')
+        .replace('${base-path}', base_path.absolute().as_posix()))
+    for variable in PATH_VARIABLES:
+        if config.get(variable) is not None:
+            path = path.replace('${' + variable + '}', config[variable])
+    return Path(os.path.expanduser(path))
+
+
+def build_folder_name(config):
+    return (f'build-{config["target-architecture"]}{config["target-sub-architecture"]}-' +
+            f'{config["target-system"]}-{config["cpp-runtime"]}-' +
+            f'{config["cpp-build-system"]}{config["build-path-suffix"]}')
@@ -0,0 +1,84 @@
+# Streaming handling of the CMake/vcpkg output. Every line is written with a timestamp into a
+# compressed log file while CMake is still running, while console output is filtered and written in
+# batches, which is considerably cheaper than writing and flushing each line on its own. A
+# background thread flushes batches while no further output arrives, so the last lines before a
+# long running step (e.g. a vcpkg port build) show up without waiting for the next line.
+
+from datetime import datetime
+import gzip
+import os
+from pathlib import Path
+import shutil
+import sys
+import threading
+from timeit import default_timer as timer
+
+
+class LogPipeline:
+    def __init__(self, log_filename, console=sys.stdout, console_filter=None, flush_interval=0.1):
+        self.log_filename = Path(log_filename)
+        self.console = console
+        self.console_filter = console_filter
+        self.flush_interval = flush_interval
+        self.console_buffer = []
+        self.start = timer()
+        self.last_flush = self.start
+        self.log_file = gzip.open(self.log_filename, 'wt', compresslevel=6, encoding='utf-8', errors='replace')
+        self.log_file.write(f'# Log started {datetime.now().isoformat(timespec="milliseconds")}\n')
+        self.lock = threading.Lock()
+        self.closing = threading.Event()
+        self.flush_thread = threading.Thread(target=self._flush_idle, daemon=True)
+        self.flush_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, line):
+        now = timer()
+        self.log_file.write(f'{now - self.start:10.3f} {line}')
+        if self.console_filter is None or self.console_filter(line):
+            with self.lock:
+                self.console_buffer.append(line)
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.console_buffer:
+                self.console.write(''.join(self.console_buffer))
+                self.console.flush()
+                self.console_buffer = []
+            self.last_flush = timer()
+
+    def _flush_idle(self):
+        while not self.closing.wait(self.flush_interval):
+            if timer() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def close(self):
+        self.closing.set()
+        self.flush_thread.join()
+        self.flush()
+        if not self.log_file.closed:
+            self.log_file.close()
+
+
+def publish_log(source_filename, target_filename):
+    """Copies a log file to a (shared) target location, compressing it on the fly unless it is
+    compressed already. The file is renamed in place once complete, so readers never see partial
+    logs."""
+    source_filename = Path(source_filename)
+    target_filename = Path(target_filename)
+    if source_filename.suffix != '.gz' and target_filename.suffix != '.gz':
+        target_filename = target_filename.with_name(target_filename.name + '.gz')
+    temp_filename = target_filename.with_name(target_filename.name + '.partial')
+    if source_filename.suffix == '.gz':
+        shutil.copyfile(source_filename, temp_filename)
+    else:
+        with open(source_filename, 'rb') as source, gzip.open(temp_filename, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(temp_filename, target_filename)
+    return target_filename
@@ -0,0 +1,103 @@
+# Lightweight span based instrumentation for the build scripts. Recorded spans can be written as
+# Chrome trace event JSON (load in chrome://tracing or https://ui.perfetto.dev) and as a plain text
+# summary table.
+
+import contextlib
+import json
+import os
+import threading
+from timeit import default_timer as timer
+
+
+class Tracer:
+    def __init__(self):
+        self.origin = timer()
+        self.events = []
+        self.lock = threading.Lock()
+        self.main_thread_id = threading.get_ident()
+
+    @contextlib.contextmanager
+    def span(self, name, category='configure', **args):
+        start = timer()
+        try:
+            yield
+        finally:
+            self._add_span(name, category, start, timer(), args)
+
+    def _add_span(self, name, category, start, end, args):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = {key: str(value) for key, value in args.items()}
+        with self.lock:
+            self.events.append(event)
+
+    def merge_chrome_trace(self, filename, start, process_name):
+        # Merges events from a foreign Chrome trace (e.g. CMake's `--profiling-format=google-trace`
+        # output). Its clock has an unknown origin, so the earliest event is aligned to `start`,
+        # which is a timer() value taken right before the foreign process was started.
+        try:
+            with open(filename, 'r') as trace_file:
+                foreign_events = json.load(trace_file)
+        except (OSError, ValueError):
+            return False
+        if isinstance(foreign_events, dict):
+            foreign_events = foreign_events.get('traceEvents', [])
+        timed_events = [event for event in foreign_events if 'ts' in event]
+        if not timed_events:
+            return False
+        offset = (start - self.origin) * 1e6 - min(event['ts'] for event in timed_events)
+        pids = set()
+        with self.lock:
+            for event in foreign_events:
+                event = dict(event)
+                if 'ts' in event:
+                    event['ts'] += offset
+                pids.add(event.get('pid', 0))
+                self.events.append(event)
+            for pid in pids:
+                self.events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                                    'args': {'name': process_name}})
+        return True
+
+    def write_chrome_trace(self, filename):
+        with self.lock:
+            events = list(self.events)
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                       'args': {'name': 'cmake.py'}})
+        with open(filename, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def summary(self):
+        # Spans are nested by time within each thread. Spans of worker threads are attached to the
+        # innermost span of the main thread that was open when they started.
+        with self.lock:
+            spans = [event for event in self.events if event.get('ph') == 'X' and event.get('pid') == os.getpid()]
+        spans.sort(key=lambda event: (event['ts'], -event['dur']))
+        stacks = {}
+        lines = []
+        for event in spans:
+            for stack in stacks.values():
+                while stack and stack[-1][0]['ts'] + stack[-1][0]['dur'] <= event['ts']:
+                    stack.pop()
+            stack = stacks.setdefault(event['tid'], [])
+            if stack:
+                depth = stack[-1][1] + 1
+            elif event['tid'] != self.main_thread_id and stacks.get(self.main_thread_id):
+                depth = stacks[self.main_thread_id][-1][1] + 1
+            else:
+                depth = 0
+            stack.append((event, depth))
+            lines.append(('  ' * depth + event['name'], event['ts'] / 1e6, event['dur'] / 1e6))
+        name_width = max([len(name) for name, _, _ in lines] + [len('Span')])
+        result = [f'{"Span":<{name_width}}  {"Start":>9}  {"Duration":>9}']
+        for name, start, duration in lines:
+            result += [f'{name:<{name_width}}  {start:8.3f}s  {duration:8.3f}s']
+        return '\n'.join(result)
@@ -10,6 +10,9 @@ REM ############################################################################
 cls
 REM Change current working directory to the location of this script.
 cd %~dp0../
+REM Remember PATH before vsdevcmd.bat and the virtual environment change it, so cmake_presets.py
+REM stores these changes in the configure presets.
+set "CMAKE_PY_PARENT_PATH=%PATH%"
 
 REM Check version of Python available in PATH.
 set PYTHON_MAJOR_VERSION=0
@@ -108,13 +111,15 @@ if not exist "%PYTHON_PACKAGES_PATH%" (
   goto :end
 )
 set VENV_PATH=%~dp0.venv
-if not exist %VENV_PATH% (
-  python -m venv %VENV_PATH%
+REM Creates the virtual environment if necessary and installs required Python modules from
+REM %PYTHON_PACKAGES_PATH% only if the requirements, the interpreter or the wheels changed.
+python scripts/bootstrap_venv.py --offline-only --venv "%VENV_PATH%" "%PYTHON_PACKAGES_PATH%"
+if ERRORLEVEL 1 (
+  set EXIT_CODE=10004
+  goto :end
 )
 echo * Entering Python virtual environment...
 call %VENV_PATH%/Scripts/activate.bat
-echo * Installing required Python modules...
-python -m pip install --no-index --find-links %PYTHON_PACKAGES_PATH% -r scripts/python_requirements.txt
 
 REM Call Python cmake script and propagate exit code.
 python scripts/cmake.py !CONFIG_FILES!
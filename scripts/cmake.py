@@ -1,19 +1,31 @@
 #!/usr/bin/env python
 
 import argparse
-import collections.abc
+import build_config
+import build_log
+from build_trace import Tracer
+import cmake_presets
+import collections
+import compiler_cache
+import concurrency_planner
+import concurrent.futures
+import contextlib
 from datetime import datetime
+import hashlib
 import json
-from jsonschema import validate
 from pathlib import Path
 import platform
 import os
+import ram_buildtrees
 import re
 import shutil
 import subprocess
 import sys
+import threading
 from timeit import default_timer as timer
 import traceback
+import vcpkg_cache
+import vcpkg_log_analyzer
 
 if sys.prefix == sys.base_prefix:
     raise RuntimeError(
@@ -53,8 +65,133 @@ def check_version(version, version_constrtaints):
     return True
 
 
+# Description of how to locate an external tool and how to parse the output of `<tool> --version`.
+# `attribute` names the Builder member that receives the path to the located executable.
+ToolProbe = collections.namedtuple(
+    'ToolProbe', ['name', 'attribute', 'executable', 'version_pattern', 'first_line_only'],
+    defaults=[False])
+
+TOOL_PROBES = {probe.name: probe for probe in [
+    ToolProbe('cmake', 'cmake_path', lambda builder: 'cmake',
+              r'cmake version (\d+)\.(\d+)\.(\d+)'),
+    ToolProbe('ninja', 'ninja_path', lambda builder: 'ninja',
+              r'(\d+)\.(\d+)\.(\d+)'),
+    ToolProbe('clang-format', 'clang_format_path', lambda builder: 'clang-format',
+              r'clang-format version (\d+)\.(\d+)\.(\d+)'),
+    ToolProbe('git', 'git_path', lambda builder: 'git',
+              r'git version (\d+)\.(\d+)\.(\d+)\.', first_line_only=True),
+    ToolProbe('git-lfs', 'git_lfs_path', lambda builder: 'git-lfs',
+              r'git-lfs/(\d+)\.(\d+)\.(\d+)'),
+    ToolProbe('vcpkg', 'vcpkg_exe_path',
+              lambda builder: builder.vcpkg_path / ('vcpkg.exe' if platform.system() == 'Windows' else 'vcpkg'),
+              r'vcpkg package management program version (\d{4})-(\d{2})-(\d{2})-([0-9a-f]{40})'),
+]}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Prepare environment and call cmake.')
+    parser.add_argument('configs_json', nargs='+',
+                        help='Config files to merge, or comma separated sets of config files in matrix mode.')
+    parser.add_argument('--drop-to-shell', action='store_const', const=True, default=False,
+                        help='Drop to fully configured command shell right before calling CMake.')
+    parser.add_argument('--refresh-toolchain', action='store_const', const=True, default=False,
+                        help='Ignore cached tool versions and query all tools again.')
+    parser.add_argument('--force-configure', action='store_const', const=True, default=False,
+                        help='Always run a full CMake configuration, even if no input changed since the last run.')
+    parser.add_argument('--trace', action='store_const', const=True, default=False,
+                        help='Write a Chrome trace and a timing summary of all configure phases, ' +
+                             'including CMake\'s own profiling output, into the build folder.')
+    # Used by benchmark_startup.py to measure the time until the first tool probe would start.
+    parser.add_argument('--exit-before-probes', action='store_const', const=True, default=False,
+                        help=argparse.SUPPRESS)
+    # Used by benchmark_build.py to configure its fixture project instead of this repository.
+    parser.add_argument('--source', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--matrix', action='store_const', const=True, default=False,
+                        help='Configure each comma separated set of config files in its own build folder in parallel.')
+    parser.add_argument('--matrix-jobs', type=int, default=None,
+                        help='Maximum number of configurations to run in parallel in matrix mode ' +
+                             '(default: derived from CPU cores and available memory).')
+    # Passed by matrix mode to each configure run, so their vcpkg jobs share the machine.
+    parser.add_argument('--resource-share', type=int, default=1, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+class MatrixRunner:
+    # Rough resources each parallel configure run is expected to use, mostly for building vcpkg ports.
+    cores_per_job = 4
+    memory_per_job = 4 * 1024 ** 3
+
+    def __init__(self, args):
+        self.scripts_path = Path(__file__).parent.absolute()
+        self.base_path = self.scripts_path.parent
+        self.options = []
+        if args.refresh_toolchain:
+            self.options += ['--refresh-toolchain']
+        if args.force_configure:
+            self.options += ['--force-configure']
+        if args.trace:
+            self.options += ['--trace']
+        if args.drop_to_shell:
+            raise RuntimeError('Option --drop-to-shell cannot be combined with --matrix.')
+
+        self.config_sets = [config_set.split(',') for config_set in args.configs_json]
+        build_folders = {}
+        for config_set in self.config_sets:
+            config, _, _, _ = build_config.load_configs(config_set)
+            build_folder = build_config.build_folder_name(config)
+            if build_folder in build_folders:
+                raise RuntimeError(f'Config sets "{",".join(build_folders[build_folder])}" and ' +
+                                   f'"{",".join(config_set)}" would both use build folder "{build_folder}". ' +
+                                   'Please set a distinct "build-path-suffix" in one of them.')
+            build_folders[build_folder] = config_set
+
+        self.jobs = args.matrix_jobs
+        if self.jobs is None:
+            self.jobs = max(1, concurrency_planner.cpu_count() // MatrixRunner.cores_per_job)
+            memory = concurrency_planner.available_memory()
+            if memory is not None:
+                self.jobs = min(self.jobs, max(1, memory // MatrixRunner.memory_per_job))
+        self.jobs = max(1, min(self.jobs, len(self.config_sets)))
+        self.options += ['--resource-share', str(self.jobs)]
+        self.output_lock = threading.Lock()
+
+    @staticmethod
+    def label(config_set):
+        names = [Path(config_json).stem.removeprefix('config-') for config_json in config_set
+                 if Path(config_json).name != 'config-base.json']
+        return '+'.join(names) if names else 'base'
+
+    def run(self):
+        print(f'Configuring {len(self.config_sets)} configurations using {self.jobs} parallel job(s).')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            results = list(executor.map(self._configure, self.config_sets))
+
+        label_width = max(len(MatrixRunner.label(config_set)) for config_set in self.config_sets)
+        print('Matrix summary:')
+        for config_set, (returncode, duration) in zip(self.config_sets, results):
+            status = 'OK' if returncode == 0 else f'failed ({returncode})'
+            print(f'  {MatrixRunner.label(config_set):<{label_width}}  {duration:7.1f}s  {status}')
+        return 0 if all(returncode == 0 for returncode, _ in results) else 1
+
+    def _configure(self, config_set):
+        label = MatrixRunner.label(config_set)
+        command = [sys.executable, Path(__file__).absolute(), *config_set, *self.options]
+        start = timer()
+        with subprocess.Popen(command,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              universal_newlines=True,
+                              cwd=self.base_path) as process:
+            for line in process.stdout:
+                with self.output_lock:
+                    sys.stdout.write(f'[{label}] {line}')
+        return process.returncode, timer() - start
+
+
 class Builder:
-    def __init__(self):
+    def __init__(self, args, tracer):
+        self.tracer = tracer
         self.environment = os.environ.copy()
         architecture = platform.machine()
         if architecture == 'x86_64' or architecture == 'AMD64':
@@ -69,23 +206,22 @@ class Builder:
         self.scripts_path = Path(__file__).parent.absolute()
         self.base_path = self.scripts_path.parent
         os.chdir(self.base_path)
+        # Build folders and the vcpkg manifest are located within the source tree.
+        self.source_path = self.base_path if args.source is None else Path(args.source).absolute()
 
         self.env_cc = self.environment['CC'] if 'CC' in self.environment else None
         self.env_cxx = self.environment['CXX'] if 'CXX' in self.environment else None
 
-        parser = argparse.ArgumentParser(
-            description='Prepare environment and call cmake.')
-        parser.add_argument('configs_json', nargs='+')
-        parser.add_argument('--drop-to-shell', action='store_const', const=True, default=False,
-                            help='Drop to fully configured command shell right before calling CMake.')
-        args = parser.parse_args()
         self.drop_to_shell = args.drop_to_shell
-
-        with open(self.scripts_path / "config.schema.json", "r") as config_schema_file:
-            config_schema = json.load(config_schema_file)
-        for config_json in sorted(args.configs_json):
-            self._load_config(config_json)
-        validate(instance=self.config, schema=config_schema)
+        self.refresh_toolchain = args.refresh_toolchain
+        self.force_configure = args.force_configure
+        self.trace = args.trace
+        self.resource_share = max(1, args.resource_share)
+
+        self._load_configs(args.configs_json)
+        with self.tracer.span('validate config'):
+            if build_config.validate_config(self.config):
+                print('Config was already validated against the current schema.')
         print("Using config:")
         print(json.dumps(self.config, indent=4))
 
@@ -110,6 +246,7 @@ class Builder:
         self.definitions = self.config['definitions']
         self.cpp_toolset = self.config['cpp-toolset']
         self.cpp_runtime = self.config['cpp-runtime']
+        self.build_path = self.source_path / build_config.build_folder_name(self.config)
 
         # Eventually autodetect C and C++ compilers according to toolset.
         if self.env_cc is None:
@@ -147,6 +284,10 @@ class Builder:
         # self.environment['CC'] = str(self.env_cc)
         # self.environment['CXX'] = str(self.env_cxx)
 
+        with self.tracer.span('setup vcpkg caches'):
+            self._setup_vcpkg_caches()
+
+    def _setup_vcpkg_caches(self):
         vcpkg_assets_cache_path = self._expand_path(self.config['vcpkg-assets-cache-path'])
         if ',;' in str(vcpkg_assets_cache_path):
             raise RuntimeError(f'The vcpkg assets cache path "{vcpkg_assets_cache_path}" ' +
@@ -182,176 +323,190 @@ class Builder:
         else:
             vcpkg_binary_cache_rw = 'readwrite'
         self.vcpkg_binary_sources = f'clear;files,{vcpkg_binary_cache_path},{vcpkg_binary_cache_rw}'
+        self.vcpkg_binary_cache_path = vcpkg_binary_cache_path
+
+        # Optional shared tier, queried after the local one. Packages built locally are written to both.
+        vcpkg_binary_cache_http_url = self.config.get('vcpkg-binary-cache-http-url')
+        if vcpkg_binary_cache_http_url is not None:
+            if not re.match(r'https?://', vcpkg_binary_cache_http_url) or re.search(r'[,;]', vcpkg_binary_cache_http_url):
+                raise RuntimeError(f'The vcpkg binary cache URL "{vcpkg_binary_cache_http_url}" must be ' +
+                                   'a http(s) URL neither containing comma (",") nor semicolon (";") characters.')
+            vcpkg_binary_cache_http_rw = 'read' if self.config['vcpkg-binary-cache-http-readonly'] else 'readwrite'
+            # Imported on demand, as urllib adds noticeably to the startup of every configure.
+            import binary_cache_tiers
+            self.vcpkg_binary_sources += (f';http,{binary_cache_tiers.url_template(vcpkg_binary_cache_http_url)},' +
+                                          vcpkg_binary_cache_http_rw)
+            self.vcpkg_binary_cache_http_url = vcpkg_binary_cache_http_url
 
     def triple(self):
         return f'{self.target_architecture}{self.target_sub}-{self.config["target-system"]}-{self.cpp_runtime}'
 
-    def check_cmake(self):
-        print('Checking availability and version of cmake... ', end='')
-        self.cmake_path = shutil.which('cmake')
-        if not self.cmake_path is None:
-            self.cmake_path = Path(self.cmake_path)
-            command = [self.cmake_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Error: Cannot query cmake version from executable "{self.cmake_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'cmake version (\d+)\.(\d+)\.(\d+)', stdout_data.decode('ascii'))
-            cmake_version = (int(search_result.group(1)), int(
-                search_result.group(2)), int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['cmake']
-            if not check_version(cmake_version, version_constraints):
-                print(f'Error: Expected CMake version {version_constraints}, ' +
-                      f'but found version {version_to_str(cmake_version)} in "{self.cmake_path}".')
-                exit(1)
-        else:
-            print('Error: Cannot locate CMake executable.')
-            exit(1)
-        print(f'OK (found version {version_to_str(cmake_version)} in "{self.cmake_path}")')
-
-    def check_ninja(self):
-        print('Checking availability and version of ninja... ', end='')
-        self.ninja_path = shutil.which('ninja')
-        if not self.ninja_path is None:
-            self.ninja_path = Path(self.ninja_path)
-            command = [self.ninja_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Error: Cannot query ninja version from executable "{self.ninja_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'(\d+)\.(\d+)\.(\d+)', stdout_data.decode('ascii'))
-            ninja_version = (int(search_result.group(1)), int(
-                search_result.group(2)), int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['ninja']
-            if not check_version(ninja_version, version_constraints):
-                print(f'Error: Expected ninja version {version_constraints}, ' +
-                      f'but found version {version_to_str(ninja_version)} in "{self.ninja_path}".')
-                exit(1)
-        else:
-            print('Error: Cannot locate ninja executable.')
-            exit(1)
-        print(f'OK (found version {version_to_str(ninja_version)} in "{self.ninja_path}")')
-
-    def check_clang_format(self):
-        print('Checking availability and version of clang-format... ', end='')
-        self.clang_format_path = shutil.which('clang-format')
-        if not self.clang_format_path is None:
-            self.clang_format_path = Path(self.clang_format_path)
-            command = [self.clang_format_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Error: Cannot query clang-format version from executable "{self.clang_format_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'clang-format version (\d+)\.(\d+)\.(\d+)', stdout_data.decode('ascii'))
-            clang_format_version = (int(search_result.group(1)), int(
-                search_result.group(2)), int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['clang-format']
-            if not check_version(clang_format_version, version_constraints):
-                print(f'Error: Expected clang-format version {version_constraints}, ' +
-                      f'but found version {version_to_str(clang_format_version)} in "{self.clang_format_path}".')
-                exit(1)
-        else:
-            print('Error: Cannot locate clang-format executable.')
-            exit(1)
-        print(f'OK (found version {version_to_str(clang_format_version)} in "{self.clang_format_path}")')
-        
-    def check_git(self):
-        print('Checking availability and version of git... ', end='')
-        self.git_path = shutil.which('git')
-        if not self.git_path is None:
-            self.git_path = Path(self.git_path)
-            command = [self.git_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Error: Cannot query git version from executable "{self.git_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'git version (\d+)\.(\d+)\.(\d+)\.', stdout_data.decode('ascii').partition('\n')[0])
-            git_version = (int(search_result.group(1)), int(
-                search_result.group(2)), int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['git']
-            if not check_version(git_version, version_constraints):
-                print(f'Error: Expected git version {version_constraints}, ' +
-                      f'but found version {version_to_str(git_version)} in "{self.git_path}".')
-                exit(1)
-        else:
-            print('Error: Cannot locate git executable.')
+    def check_tools(self, tool_names):
+        # All tool probes are started at once, because each one mostly waits for its `--version`
+        # subprocess. Results are still reported in the order of `tool_names`.
+        probes = [TOOL_PROBES[tool_name] for tool_name in tool_names]
+        probe_cache_filename = self.build_path / 'toolchain-probes.json'
+        self.probe_cache = {}
+        if not self.refresh_toolchain:
+            try:
+                self.probe_cache = dict(build_config.read_cache_file(probe_cache_filename))
+            except (OSError, ValueError):
+                pass
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            futures = [executor.submit(self._probe_tool, probe) for probe in probes]
+            results = [future.result() for future in futures]
+        failed = False
+        cache_misses = 0
+        for probe, (path, version, error, cache_hit) in zip(probes, results):
+            print(f'Checking availability and version of {probe.name}... ', end='')
+            if error is not None:
+                print(f'Error: {error}')
+                failed = True
+            else:
+                print(f'OK (found version {version_to_str(version)} in "{path}", ' +
+                      f'{"cached" if cache_hit else "probed"})')
+            if not cache_hit:
+                cache_misses += 1
+            setattr(self, probe.attribute, path)
+        print(f'Tool probe cache: {len(probes) - cache_misses} hit(s), {cache_misses} miss(es).')
+        if cache_misses > 0:
+            try:
+                os.makedirs(self.build_path, exist_ok=True)
+                build_config.write_cache_file(probe_cache_filename, self.probe_cache, indent=4)
+            except OSError:
+                print(f'Warning: Cannot write tool probe cache "{probe_cache_filename}".')
+        if failed:
             exit(1)
-        print(f'OK (found version {version_to_str(git_version)} in "{self.git_path}")')
-        
-    def check_git_lfs(self):
-        print('Checking availability and version of git lfs... ', end='')
-        self.git_lfs_path = shutil.which('git-lfs')
-        if not self.git_lfs_path is None:
-            self.git_lfs_path = Path(self.git_lfs_path)
-            command = [self.git_lfs_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Error: Cannot query git lfs version from executable "{self.git_lfs_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'git-lfs/(\d+)\.(\d+)\.(\d+)', stdout_data.decode('ascii'))
-            git_lfs_version = (int(search_result.group(1)), int(
-                search_result.group(2)), int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['git-lfs']
-            if not check_version(git_lfs_version, version_constraints):
-                print(f'Error: Expected git lfs version {version_constraints}, ' +
-                      f'but found version {version_to_str(git_lfs_version)} in "{self.git_lfs_path}".')
-                exit(1)
-        else:
-            print('Error: Cannot locate git executable.')
+
+    def _probe_tool(self, probe):
+        with self.tracer.span(f'probe {probe.name}'):
+            return self._query_tool(probe)
+
+    def _query_tool(self, probe):
+        path = shutil.which(probe.executable(self))
+        if path is None:
+            return None, None, f'Cannot locate {probe.name} executable.', False
+        path = Path(path)
+        # Executables are identified by their resolved path and file attributes. Any update
+        # of a tool replaces or rewrites the file, which changes at least one of these.
+        resolved_path = path.resolve()
+        try:
+            stat = resolved_path.stat()
+            identity = {
+                'path': resolved_path.as_posix(),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'inode': stat.st_ino
+            }
+        except OSError:
+            identity = None
+        cache_entry = self.probe_cache.get(probe.name)
+        if (identity is not None and cache_entry is not None and
+                cache_entry.get('identity') == identity):
+            version = tuple(cache_entry['version'])
+            return path, version, self._check_tool_version(probe, path, version), True
+
+        command = [path, '--version']
+        process = subprocess.Popen(command, env=self.environment,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout_data, stderr_data = process.communicate()
+        if process.returncode != 0:
+            return path, None, f'Cannot query {probe.name} version from executable "{path}".', False
+        stdout_data = stdout_data.decode('ascii', errors='replace')
+        if probe.first_line_only:
+            stdout_data = stdout_data.partition('\n')[0]
+        search_result = re.search(probe.version_pattern, stdout_data)
+        if search_result is None:
+            return path, None, f'Cannot parse {probe.name} version from executable "{path}".', False
+        version = tuple(int(group) for group in search_result.groups()[:3])
+        if identity is not None:
+            self.probe_cache[probe.name] = {'identity': identity, 'version': list(version)}
+        return path, version, self._check_tool_version(probe, path, version), False
+
+    def _check_tool_version(self, probe, path, version):
+        version_constraints = self.config['expected-versions'][probe.name]
+        if not check_version(version, version_constraints):
+            return (f'Expected {probe.name} version {version_constraints}, ' +
+                    f'but found version {version_to_str(version)} in "{path}".')
+        return None
+
+    def check_vcpkg_setup(self):
+        if self.host_system == 'windows' and len(str(self.vcpkg_buildtrees_root)) > 5:
+            print('Error: Please configure an exceptionally short path for the config variable "vcpkg-buildtrees-root" ' +
+                  '(such as "c:/b/", see `subst` and `mklink` commands), as otherwise some builds will fail.')
             exit(1)
-        print(f'OK (found version {version_to_str(git_lfs_version)} in "{self.git_lfs_path}")')
-
-    def check_vcpkg(self):
-        print('Checking availability and version of vcpkg... ', end='')
-        vcpkg_exe = 'vcpkg.exe' if platform.system() == 'Windows' else 'vcpkg'
-        self.vcpkg_exe_path = shutil.which(self.vcpkg_path / vcpkg_exe)
-        if not self.vcpkg_exe_path is None:
-            self.vcpkg_exe_path = Path(self.vcpkg_exe_path)
-            command = [self.vcpkg_exe_path, '--version']
-            process = subprocess.Popen(command, env=self.environment,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout_data, stderr_data = process.communicate()
-            if process.returncode != 0:
-                print(f'Cannot query vcpkg version from executable "{self.vcpkg_path}".')
-                exit(process.returncode)
-            search_result = re.search(
-                r'vcpkg package management program version (\d{4})-(\d{2})-(\d{2})-([0-9a-f]{40})', stdout_data.decode('ascii'))
-            vcpkg_version = (int(search_result.group(1)),
-                             int(search_result.group(2)),
-                             int(search_result.group(3)))
-            version_constraints = self.config['expected-versions']['vcpkg']
-            if not check_version(vcpkg_version, version_constraints):
-                print(f'Error: Expected vcpkg version {version_constraints}, ' +
-                      f'but found version {version_to_str(vcpkg_version)} in "{self.vcpkg_path}".')
-                exit(1)
-            if self.host_system == 'windows' and len(str(self.vcpkg_buildtrees_root)) > 5:
-                print('Error: Please configure an exceptionally short path for the config variable "vcpkg-buildtrees-root" ' +
-                      '(such as "c:/b/", see `subst` and `mklink` commands), as otherwise some builds will fail.')
-                exit(1)
 
-            # Make sure again that the data collection by Microsoft is disabled.
-            disable_telemetry_path = self.vcpkg_path / 'vcpkg.disable-metrics'
-            if not disable_telemetry_path.exists():
-                disable_telemetry_path.touch()
+        # Make sure again that the data collection by Microsoft is disabled.
+        disable_telemetry_path = self.vcpkg_path / 'vcpkg.disable-metrics'
+        if not disable_telemetry_path.exists():
+            disable_telemetry_path.touch()
+
+    def evict_vcpkg_caches(self):
+        # Packages installed into this build folder were just used and must survive the eviction.
+        vcpkg_installed_paths = [self.build_path / 'vcpkg_installed']
+        caches = [
+            (self.vcpkg_binary_cache_path, 'binary', self.config.get('vcpkg-binary-cache-budget')),
+            (self.vcpkg_buildtrees_root, 'buildtrees', self.config.get('vcpkg-buildtrees-budget'))
+        ]
+        for path, kind, budget in caches:
+            if budget is None:
+                continue
+            if kind == 'binary' and self.config['vcpkg-binary-cache-readonly']:
+                print(f'Not evicting from read-only vcpkg binary cache "{path}".')
+                continue
+            budget = vcpkg_cache.parse_size(budget)
+            size_before, evicted_count, evicted_size = vcpkg_cache.maintain_cache(
+                path, kind, budget, vcpkg_installed_paths)
+            print(f'vcpkg {kind} cache "{path}": {vcpkg_cache.format_size(size_before)} in use, ' +
+                  f'evicted {evicted_count} entries ({vcpkg_cache.format_size(evicted_size)}) ' +
+                  f'to fit into {vcpkg_cache.format_size(budget)}.')
+
+    def evict_compiler_cache(self):
+        compiler_cache_config = self.config['compiler-cache']
+        if not compiler_cache_config['enabled'] or compiler_cache_config['budget'] is None:
+            return
+        path = self._expand_path(compiler_cache_config['path'])
+        budget = vcpkg_cache.parse_size(compiler_cache_config['budget'])
+        size_before, evicted_count, evicted_size = compiler_cache.evict(path, budget)
+        print(f'Compiler cache "{path}": {vcpkg_cache.format_size(size_before)} in use, ' +
+              f'evicted {evicted_count} entries ({vcpkg_cache.format_size(evicted_size)}) ' +
+              f'to fit into {vcpkg_cache.format_size(budget)}.')
+
+    def plan_concurrency(self):
+        planner_config = self.config['concurrency-planner']
+        if not planner_config['enabled']:
+            return
+        cores = concurrency_planner.cpu_count()
+        memory = concurrency_planner.total_memory()
+        available = concurrency_planner.available_memory()
+        # Recorded memory peaks take precedence over the configured defaults.
+        link_history_filename = self.build_path / concurrency_planner.LINK_HISTORY_FILENAME
+        link_peaks = concurrency_planner.read_link_history(link_history_filename)
+        if link_peaks:
+            concurrency_planner.compact_link_history(link_history_filename, link_peaks)
+            link_job_memory = max(link_peaks.values())
         else:
-            print('Cannot locate vcpkg executable.')
-            exit(1)
-        print(f'OK (found version {version_to_str(vcpkg_version)} in "{builder.vcpkg_exe_path}")')
+            link_job_memory = vcpkg_cache.parse_size(planner_config['link-job-memory'])
+        vcpkg_job_memory = concurrency_planner.vcpkg_job_memory_peak(
+            vcpkg_log_analyzer.read_history(self.build_path / vcpkg_log_analyzer.HISTORY_FILENAME))
+        if vcpkg_job_memory is None:
+            vcpkg_job_memory = vcpkg_cache.parse_size(planner_config['vcpkg-job-memory'])
+        self.reserved_memory = vcpkg_cache.parse_size(planner_config['reserved-memory'])
+        self.concurrency = concurrency_planner.plan(
+            cores, memory, available, self.reserved_memory,
+            vcpkg_cache.parse_size(planner_config['compile-job-memory']), link_job_memory, vcpkg_job_memory,
+            self.resource_share)
+        memory_text = 'unknown memory' if memory is None else f'{vcpkg_cache.format_size(memory)} memory'
+        share_text = '' if self.resource_share == 1 else f' shared by {self.resource_share} configure runs'
+        print(f'Planned concurrency for {cores} cores and {memory_text}{share_text}: ' +
+              f'{self.concurrency["compile-jobs"]} compile jobs, ' +
+              f'{self.concurrency["link-jobs"]} link jobs ({vcpkg_cache.format_size(link_job_memory)} each), ' +
+              f'{self.concurrency["vcpkg-jobs"]} vcpkg jobs ({vcpkg_cache.format_size(vcpkg_job_memory)} each).')
+        if 'VCPKG_MAX_CONCURRENCY' in self.environment:
+            print(f'Keeping VCPKG_MAX_CONCURRENCY={self.environment["VCPKG_MAX_CONCURRENCY"]} from the environment.')
+            self.concurrency['vcpkg-jobs'] = int(self.environment['VCPKG_MAX_CONCURRENCY'])
+        else:
+            self.environment['VCPKG_MAX_CONCURRENCY'] = str(self.concurrency['vcpkg-jobs'])
 
     def filter_environment(self):
         path_delimiter = ';' if platform.system() == 'Windows' else ':'
@@ -364,13 +519,12 @@ class Builder:
         self.environment['PATH'] = path_delimiter.join(paths)
 
     def cmake(self):
-        build_path = self.base_path / \
-            f'build-{self.triple()}-{self.cpp_build_system}{self.config["build-path-suffix"]}'
+        build_path = self.build_path
         cmake_path = build_path / 'cmake'
         os.makedirs(cmake_path, exist_ok=True)
         toolchain_path = self.base_path / 'cmake' / \
             f'Toolchain-{self.triple()}.cmake'
-        install_path = self.base_path / "production"
+        install_path = self.source_path / "production"
 
         # Store a copy of the combined config in our temporary build folder.
         combined_config_filename = build_path / "config.json"
@@ -378,10 +532,6 @@ class Builder:
             config_file.write(json.dumps(self.config, indent=4))
         print(f'Effective config written to "{combined_config_filename}".')
 
-        cmake_cache_path = build_path / Path("CMakeCache.txt")
-        if cmake_cache_path.exists():
-            os.remove(cmake_cache_path)
-
         # We need to transport the absolute path to the vcpkg cmake toolchain file to our own
         # toolchain files (`cmake/Toolchain*.cmake`), so it can be chain-loaded.
         # Passing the value by cmake command line (via `-DVCPKG_TOOLCHAIN_PATH=<path>`) doesn't work
@@ -393,7 +543,8 @@ class Builder:
         with open(build_path / 'vcpkg-path.txt', 'w') as f:
             f.write(str(self.vcpkg_path))
 
-        command = [self.cmake_path, '-S', '.', '-B', build_path.as_posix()]
+        source = '.' if self.source_path == self.base_path else self.source_path.as_posix()
+        command = [self.cmake_path, '-S', source, '-B', build_path.as_posix()]
         if self.cpp_build_system == 'ninja':
             command = command + [
                 '-G', 'Ninja Multi-Config',
@@ -401,12 +552,37 @@ class Builder:
                 f'-DCMAKE_C_COMPILER={self.env_cc}',
                 f'-DCMAKE_CXX_COMPILER={self.env_cxx}'
             ]
+            if self.concurrency is not None:
+                # Links record their peak memory, which sizes the link pool on the next configure.
+                link_launcher = ';'.join(Path(argument).as_posix() for argument in [
+                    sys.executable, self.scripts_path / 'concurrency_planner.py', 'link',
+                    '--history', build_path / concurrency_planner.LINK_HISTORY_FILENAME, '--'])
+                command = command + [
+                    f'-DCMAKE_JOB_POOLS=compile={self.concurrency["compile-jobs"]};link={self.concurrency["link-jobs"]}',
+                    '-DCMAKE_JOB_POOL_COMPILE=compile',
+                    '-DCMAKE_JOB_POOL_LINK=link',
+                    f'-DCMAKE_C_LINKER_LAUNCHER={link_launcher}',
+                    f'-DCMAKE_CXX_LINKER_LAUNCHER={link_launcher}'
+                ]
+            if self.config['compiler-cache']['enabled']:
+                launcher = [sys.executable, self.scripts_path / 'compiler_cache.py', 'compile',
+                            '--cache-path', self._expand_path(self.config['compiler-cache']['path'])]
+                if self.config['compiler-cache']['budget'] is not None:
+                    launcher = launcher + ['--budget', self.config['compiler-cache']['budget']]
+                launcher = ';'.join(Path(argument).as_posix() if isinstance(argument, Path) else str(argument)
+                                    for argument in launcher)
+                command = command + [
+                    f'-DCMAKE_C_COMPILER_LAUNCHER={launcher}',
+                    f'-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}'
+                ]
         elif self.cpp_build_system == 'msbuild':
             command = command + [
                 '-G', 'Visual Studio 17 2022',
                 '-A', 'x64',
                 '-Thost=x64'
             ]
+            if self.config['compiler-cache']['enabled']:
+                print('Note: The compiler cache is not supported with MSBuild and will not be used.')
         vcpkg_install_options = [f'--x-buildtrees-root={self.vcpkg_buildtrees_root}']
         if self.config["vcpkg-debug"]:
             vcpkg_install_options = vcpkg_install_options + ['--debug']
@@ -428,6 +604,8 @@ class Builder:
             '-DCMAKE_EXPORT_COMPILE_COMMANDS=ON',
             f'-DCMAKE_INSTALL_PREFIX={install_path}',
             f'-DCLANG_FORMAT_PATH:PATH={self.clang_format_path}',
+            # Interpreter for scripts/version_state.py, which computes the version state during builds.
+            f'-DVERSION_STATE_PYTHON:FILEPATH={Path(sys.executable).as_posix()}',
             f'-DBUILD_PATH_SUFFIX:STRING={self.config["build-path-suffix"]}',
             f'-DVCPKG_HOST_TRIPLET:STRING={self.target_architecture_short}-{self.config["target-system"]}-{self.vendor}-{self.config["cpp-runtime"]}',
             f'-DVCPKG_TARGET_TRIPLET:STRING={self.target_architecture_short}-{self.config["target-system"]}-{self.vendor}-{self.config["cpp-runtime"]}',
@@ -448,6 +626,64 @@ class Builder:
         command_string = ' '.join(
             f'"{i}"' if ' ' in str(i) else f"{i}" for i in command)
 
+        vcpkg_installed_lock = contextlib.nullcontext()
+        if self.config.get('vcpkg-installed-store-path') is not None:
+            with self.tracer.span('link vcpkg installed tree'):
+                vcpkg_installed_lock = self._link_vcpkg_installed(toolchain_path)
+        else:
+            (build_path / vcpkg_cache.INPUTS_STAMP_FILENAME).unlink(missing_ok=True)
+
+        # A full configuration run including the vcpkg manifest install is only required if the
+        # toolchain related inputs changed. Changes limited to cache variables are applied to the
+        # existing CMakeCache.txt, and if nothing changed at all CMake isn't called.
+        fingerprint = self._configure_fingerprint(command, toolchain_path)
+        fingerprint_filename = build_path / 'configure-fingerprint.json'
+        if not self.drop_to_shell:
+            with self.tracer.span('update presets'):
+                self._update_presets(command, fingerprint)
+        try:
+            with open(fingerprint_filename, 'r') as fingerprint_file:
+                previous_fingerprint = json.load(fingerprint_file)
+        except (OSError, ValueError):
+            previous_fingerprint = {}
+        cmake_cache_path = build_path / Path("CMakeCache.txt")
+        if cmake_cache_path.exists():
+            if self.force_configure or previous_fingerprint.get('toolchain') != fingerprint['toolchain']:
+                os.remove(cmake_cache_path)
+            elif self.drop_to_shell:
+                pass
+            elif previous_fingerprint == fingerprint:
+                print('Configuration is unchanged since the last successful CMake run, skipping CMake ' +
+                      '(use --force-configure to override).')
+                return
+            else:
+                print('Only cache variables changed, reconfiguring with existing CMakeCache.txt.')
+        if fingerprint_filename.exists():
+            os.remove(fingerprint_filename)
+
+        vcpkg_inputs_key = None
+        if self.vcpkg_binary_cache_http_url is not None:
+            vcpkg_inputs_key, _ = self._vcpkg_inputs_key(toolchain_path)
+            if not self.config['vcpkg-binary-cache-readonly']:
+                with self.tracer.span('prefetch binary cache'):
+                    self._prefetch_binary_cache(vcpkg_inputs_key)
+
+        ram_trees = None
+        if self.config['vcpkg-buildtrees-ram']['enabled'] and not self.drop_to_shell:
+            with self.tracer.span('prepare RAM buildtrees'):
+                ram_trees = self._prepare_ram_buildtrees()
+        line_handlers = [] if ram_trees is None else [ram_trees.process_line]
+        memory_monitor = None
+        if self.concurrency is not None and not self.drop_to_shell:
+            memory_monitor = concurrency_planner.MemoryMonitor(self.concurrency['vcpkg-jobs'], self.reserved_memory)
+            line_handlers += [memory_monitor.process_line]
+
+        # CMake's own profiling output gets merged into our trace, but is not part of the fingerprint.
+        cmake_profile_filename = build_path / 'cmake-profile.json'
+        if self.trace and not self.drop_to_shell:
+            command = command + ['--profiling-format=google-trace',
+                                 f'--profiling-output={cmake_profile_filename.as_posix()}']
+
         if self.drop_to_shell:
             print('Enter fully configured and set up sub-shell for investigation.')
             print('Call CMake with the following arguments:')
@@ -466,77 +702,220 @@ class Builder:
                 print('  ' + ' '.join(command[i:j]))
                 i = j
 
-        with subprocess.Popen(command,
-                              stdout = subprocess.PIPE,
-                              stderr = subprocess.STDOUT,
-                              universal_newlines = True,
-                              env=self.environment) as cmake_app:
+        # The complete output including all vcpkg debug output is written to a compressed log file
+        # while CMake runs. The console only receives filtered output in batches.
+        output_log_filename = build_path / 'cmake-output.log.gz'
+        cmake_start = timer()
+        with (vcpkg_installed_lock,
+              contextlib.nullcontext() if memory_monitor is None else memory_monitor,
+              self.tracer.span('cmake'),
+              subprocess.Popen(command,
+                               stdout = subprocess.PIPE,
+                               stderr = subprocess.STDOUT,
+                               universal_newlines = True,
+                               env=self.environment) as cmake_app,
+              build_log.LogPipeline(output_log_filename,
+                                    console_filter=lambda line: not line.startswith('[DEBUG]')) as log):
             for line in cmake_app.stdout:
-                # Filter verbose vcpkg debug output on console. You can find the output in
-                # ${build_path}/vcpkg-manifest-install.log
-                if not line.startswith('[DEBUG]'):
-                    sys.stdout.write(line)
+                log.write(line)
+                for line_handler in line_handlers:
+                    line_handler(line.rstrip('\n'))
+            cmake_app.wait()
+        if ram_trees is not None:
+            with self.tracer.span('release RAM buildtrees'):
+                ram_trees.finish()
+        if self.trace and not self.drop_to_shell:
+            self.tracer.merge_chrome_trace(cmake_profile_filename, cmake_start, 'cmake')
+        print(f'Note: You can find the complete CMake output in\n"{output_log_filename.as_posix()}".')
+        with self.tracer.span('publish logs'):
+            logs = [(output_log_filename, 'cmake-output.log.gz')]
             if self.config["vcpkg-debug"]:
-                # Copy vcpkg log file to shared drive to ease bug hunting.
                 source_log_filename = build_path / "vcpkg-manifest-install.log"
                 if source_log_filename.exists():
                     print(f'Note: You can find vcpkg debug output in\n"{source_log_filename.as_posix()}".')
-                    if not self.config["build-log-path"] is None:
-                        target_log_folder = self._expand_path(self.config["build-log-path"])
-                        if target_log_folder.exists():
-                            target_log_folder = target_log_folder / self.environment['USERNAME']
-                            os.makedirs(target_log_folder.as_posix(), exist_ok=True)
-                            target_log_filename = target_log_folder / datetime.now().strftime('%Y-%m-%dT%H_%M_%S_vcpkg-manifest-install.log')
-                            shutil.copy(source_log_filename, target_log_filename)
-            if (not cmake_app.returncode is None) and (cmake_app.returncode != 0):
-                print(f'The command `{command_string}´ failed with error code {cmake_app.returncode}.')
-                exit(cmake_app.returncode)
-
-    def _load_config(self, config_filename):
-        if not config_filename is Path:
-            config_filename = self.scripts_path / config_filename
-        print(f'Loading config "{config_filename}"')
-        with open(config_filename, "r") as config_file:
-            self.config = Builder._update_config(self.config, json.load(config_file),
-                                                 self.config_guard, config_filename.name)
-
-    def _expand_path(self, path: str) -> Path:
-        path = (path
-            .replace('\\', '/')
-            .replace('${base-path}', self.base_path.absolute().as_posix()))
-
-        if not self.target_architecture is None:
-            path = path.replace('${target-architecture}', self.target_architecture)
-        if not self.target_sub is None:
-            path = path.replace('${target-sub-architecture}', self.target_sub)
-        if not self.target_system is None:
-            path = path.replace('${target-system}', self.target_system)
-        if not self.vendor is None:
-            path = path.replace('${vendor}', self.vendor)
-        if not self.cpp_runtime is None:
-            path = path.replace('${cpp-runtime}', self.cpp_runtime)
-        return Path(os.path.expanduser(path))
+                    logs += [(source_log_filename, 'vcpkg-manifest-install.log.gz')]
+            if not self.config["build-log-path"] is None:
+                # Publish compressed logs to shared drive to ease bug hunting.
+                target_log_folder = self._expand_path(self.config["build-log-path"])
+                if target_log_folder.exists():
+                    user_name = self.environment.get('USERNAME', self.environment.get('USER', 'unknown'))
+                    target_log_folder = target_log_folder / user_name
+                    os.makedirs(target_log_folder.as_posix(), exist_ok=True)
+                    timestamp = datetime.now().strftime('%Y-%m-%dT%H_%M_%S')
+                    for source_log_filename, target_log_name in logs:
+                        build_log.publish_log(source_log_filename,
+                                              target_log_folder / f'{timestamp}_{target_log_name}')
+        with self.tracer.span('analyze vcpkg log'):
+            # Record per-port build times and binary cache hits, also for failed runs.
+            records, summary = vcpkg_log_analyzer.analyze_log(output_log_filename)
+            if records:
+                # Buildtree sizes are recorded even without RAM buildtrees, so enabling them has
+                # estimates right away.
+                ram_buildtrees.record_sizes(records, {} if ram_trees is None else ram_trees.sizes,
+                                            self.vcpkg_buildtrees_root)
+                if memory_monitor is not None:
+                    memory_monitor.record_peaks(records)
+                print(vcpkg_log_analyzer.format_report(records, summary, top=5))
+                vcpkg_log_analyzer.append_history(build_path / vcpkg_log_analyzer.HISTORY_FILENAME,
+                                                  records, summary)
+        if cmake_app.returncode != 0:
+            print(f'The command `{command_string}´ failed with error code {cmake_app.returncode}.')
+            exit(cmake_app.returncode)
+        if vcpkg_inputs_key is not None and not self.drop_to_shell:
+            with self.tracer.span('write back binary cache'):
+                self._write_back_binary_cache(vcpkg_inputs_key)
+        if not self.drop_to_shell:
+            with open(fingerprint_filename, 'w') as fingerprint_file:
+                json.dump(fingerprint, fingerprint_file, indent=4)
+
+    def _update_presets(self, command, fingerprint):
+        preset_hash = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode())
+        Builder._hash_path(preset_hash, self.scripts_path / 'config.schema.json')
+        preset = cmake_presets.configure_preset(self.build_path.name, self.config_filenames, command,
+                                                self.environment, preset_hash.hexdigest())
+        if cmake_presets.update_user_presets(self.source_path, preset):
+            print(f'Updated preset "{preset["name"]}" in "{self.source_path / cmake_presets.PRESETS_FILENAME}".')
+
+    def _prepare_ram_buildtrees(self):
+        ram_config = self.config['vcpkg-buildtrees-ram']
+        ram_path = self._expand_path(ram_config['path'])
+        budget = vcpkg_cache.parse_size(ram_config['budget'])
+        estimates = ram_buildtrees.estimate_sizes(
+            vcpkg_log_analyzer.read_history(self.build_path / vcpkg_log_analyzer.HISTORY_FILENAME))
+        ram_trees = ram_buildtrees.RamBuildtrees(
+            self.vcpkg_buildtrees_root, ram_path, budget, ram_config['keep-built-trees'])
+        try:
+            in_ram, on_disk = ram_trees.prepare(estimates)
+        except OSError as error:
+            # Builds still work with all buildtrees on disk.
+            print(f'Warning: Cannot prepare RAM buildtrees in "{ram_path}": {error}')
+            ram_trees.finish()
+            return None
+        print(f'Placing buildtrees of {in_ram} ports in "{ram_path}" (budget {vcpkg_cache.format_size(budget)}), ' +
+              f'{on_disk} ports exceed the budget or are linked by another configure run. Ports without recorded buildtree size are built on disk.')
+        return ram_trees
+
+    def _prefetch_binary_cache(self, vcpkg_inputs_key):
+        # Archives other agents installed for the same inputs, plus those of the previous install
+        # into this build folder.
+        import binary_cache_tiers
+        url = self.vcpkg_binary_cache_http_url
+        abis = set(binary_cache_tiers.fetch_manifest(url, vcpkg_inputs_key))
+        abis |= set(abi for _, _, abi in vcpkg_cache.installed_packages(self.build_path / 'vcpkg_installed'))
+        start = timer()
+        downloaded, downloaded_size, unavailable = binary_cache_tiers.prefetch(url, self.vcpkg_binary_cache_path, abis)
+        print(f'Prefetched {downloaded} of {len(abis)} vcpkg binary archives ' +
+              f'({vcpkg_cache.format_size(downloaded_size)}) from "{url}" in {timer() - start:.1f} seconds, ' +
+              f'{unavailable} not available.')
+
+    def _write_back_binary_cache(self, vcpkg_inputs_key):
+        url = self.vcpkg_binary_cache_http_url
+        abis = [abi for _, _, abi in vcpkg_cache.installed_packages(self.build_path / 'vcpkg_installed')]
+        if self.config['vcpkg-binary-cache-http-readonly'] or not abis:
+            return
+        import binary_cache_tiers
+        try:
+            uploaded, uploaded_size = binary_cache_tiers.write_back(url, self.vcpkg_binary_cache_path, abis)
+            binary_cache_tiers.publish_manifest(url, vcpkg_inputs_key, abis)
+        except OSError as error:
+            print(f'Warning: Cannot write back to vcpkg binary cache "{url}": {error}')
+            return
+        print(f'Uploaded {uploaded} vcpkg binary archives ({vcpkg_cache.format_size(uploaded_size)}) to "{url}".')
+
+    def _vcpkg_inputs_key(self, toolchain_path):
+        # Identifies the result of the vcpkg manifest install independent of the build folder.
+        # Returns the key and a description of the inputs it was computed from.
+        triplet = f'{self.target_architecture_short}-{self.config["target-system"]}-{self.vendor}-{self.config["cpp-runtime"]}'
+        inputs = {
+            'triplet': triplet,
+            'vcpkg': [self.probe_cache.get('vcpkg', {}).get('version'), vcpkg_cache.git_commit(self.vcpkg_path)],
+            'compilers': [self.env_cc, self.env_cxx]
+        }
+        key_hash = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode())
+        key_inputs = [self.source_path / 'vcpkg.json', self.source_path / 'vcpkg-configuration.json', toolchain_path]
+        for key in ['vcpkg-overlay-ports', 'vcpkg-overlay-triplets']:
+            if key in self.config:
+                key_inputs += [self._expand_path(self.config[key])]
+        for path in key_inputs:
+            Builder._hash_path(key_hash, path)
+        return f'{triplet}-{key_hash.hexdigest()[:16]}', dict(inputs, files=[path.as_posix() for path in key_inputs])
+
+    def _link_vcpkg_installed(self, toolchain_path):
+        # Build folders which only differ in settings not affecting the vcpkg manifest install
+        # (e.g. different "build-path-suffix" variants of a triplet) share one vcpkg_installed tree
+        # within the store. Returns the lock to hold while vcpkg may modify the shared tree.
+        key, inputs = self._vcpkg_inputs_key(toolchain_path)
+        store_path = self._expand_path(self.config['vcpkg-installed-store-path'])
+        tree_path, created = vcpkg_cache.link_installed_tree(
+            store_path, key, self.build_path / 'vcpkg_installed', inputs)
+        vcpkg_cache.write_inputs_stamp(self.build_path / vcpkg_cache.INPUTS_STAMP_FILENAME, key,
+                                       [Path(path) for path in inputs['files']])
+        print(f'Using shared vcpkg installed tree "{tree_path}".')
+        if created and not self.force_configure:
+            # The configure fingerprint can't tell that the packages still need to be installed.
+            print('Shared tree is new, forcing a full configuration.')
+            self.force_configure = True
+        return vcpkg_cache.FileLock(store_path / f'{key}.lock')
+
+    def _configure_fingerprint(self, command, toolchain_path):
+        toolchain_hash = hashlib.sha256()
+        toolchain_inputs = [toolchain_path, self.source_path / 'vcpkg.json']
+        for key in ['vcpkg-overlay-ports', 'vcpkg-overlay-triplets']:
+            if key in self.config:
+                toolchain_inputs += [self._expand_path(self.config[key])]
+        for path in toolchain_inputs:
+            Builder._hash_path(toolchain_hash, path)
+        toolchain_hash.update(json.dumps(self.probe_cache, sort_keys=True).encode())
+        toolchain_hash.update(f'{self.env_cc}\n{self.env_cxx}\n{self.cpp_build_system}'.encode())
+
+        cache_hash = hashlib.sha256(json.dumps([[str(i) for i in command], self.config],
+                                               sort_keys=True).encode())
+        return {'toolchain': toolchain_hash.hexdigest(), 'cache': cache_hash.hexdigest()}
 
     @staticmethod
-    def _update_config(config, new_config, config_guard, config_filename):
-        for key, new_value in new_config.items():
-            if isinstance(new_value, collections.abc.Mapping):
-                config[key] = Builder._update_config(config.get(key, {}), new_value,
-                                                     config_guard.get(key, {}), config_filename)
-            else:
-                # Keep track of where each setting originates from.
-                if key in config_guard and config_guard[key] != "config-base.json":
-                    print(f'Warning: Config "{key}"="{config[key]}" previously set in "{config_guard[key]}" ' +
-                          f'will be overwritten with "{key}"="{new_value}" set in "{config_filename}"!')
-                config_guard[key] = config_filename
-                config[key] = new_value
-        return config
+    def _hash_path(hasher, path):
+        path = Path(path)
+        hasher.update(path.as_posix().encode())
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    file_path = Path(root) / filename
+                    hasher.update(file_path.relative_to(path).as_posix().encode())
+                    hasher.update(file_path.read_bytes())
+        elif path.is_file():
+            hasher.update(path.read_bytes())
+        else:
+            hasher.update(b'missing')
+
+    def _load_configs(self, config_filenames):
+        self.config_filenames = build_config.config_paths(config_filenames)
+        for config_filename in build_config.config_paths(config_filenames):
+            print(f'Loading config "{config_filename}"')
+        with self.tracer.span('merge configs'):
+            self.config, self.config_guard, warnings, cached = build_config.load_configs(config_filenames)
+        for warning in warnings:
+            print(warning)
+        if cached:
+            print('Using cached merged config.')
+
+    def _expand_path(self, path: str) -> Path:
+        return build_config.expand_path(path, self.config)
 
     scripts_path = Path()
     base_path = Path()
+    source_path = Path()
     drop_to_shell = False
+    refresh_toolchain = False
+    force_configure = False
+    trace = False
+    tracer = None
+    build_path = None
+    # Maps tool names to the identity of the probed executable and its parsed version.
+    probe_cache = {}
     config = {}
     config_guard = {}
+    config_filenames = []
     cpp_build_system = None
     cpp_toolset = None
     environment = None
@@ -562,6 +941,11 @@ class Builder:
     vcpkg_exe_path = None
     vcpkg_asset_sources = None
     vcpkg_binary_sources = None
+    vcpkg_binary_cache_path = None
+    vcpkg_binary_cache_http_url = None
+    # Planned number of compile, link and vcpkg jobs, or None if the planner is disabled.
+    concurrency = None
+    reserved_memory = 0
     # Path to a custom vcpkg buildtree folder, which quickly grows to several hundred GiB in size.
     # The contents of this folder are not strictly required, but allow debugging into third-party libraries.
     vcpkg_buildtrees_root = None
@@ -569,6 +953,8 @@ class Builder:
 
 
 start = timer()
+tracer = Tracer()
+builder = None
 try:
     print('\033]2;Checking prerequisites ...\007')
     # The check for Python is hard-coded.
@@ -579,20 +965,31 @@ try:
         exit(1)
     print(f'OK (found version {version_to_str(python_version)})')
 
-    builder = Builder()
+    args = parse_arguments()
+    if args.matrix:
+        exit(MatrixRunner(args).run())
+
+    with tracer.span('load config'):
+        builder = Builder(args, tracer)
 
-    builder.check_cmake()
-    builder.check_ninja()
-    builder.check_clang_format()
-    # builder.check_git()
-    # builder.check_git_lfs()
-    builder.check_vcpkg()
-    builder.filter_environment()
+    if args.exit_before_probes:
+        exit(0)
 
-    # ToDo: Handle config['vcpkg-reuse-suffix'] and setup directory symlink/junction to reuse vcpkg installation folder.
+    # Add 'git' and 'git-lfs' to check these tools as well.
+    with tracer.span('check tools'):
+        builder.check_tools(['cmake', 'ninja', 'clang-format', 'vcpkg'])
+        builder.check_vcpkg_setup()
+    with tracer.span('filter environment'):
+        builder.filter_environment()
+    with tracer.span('plan concurrency'):
+        builder.plan_concurrency()
 
     print('\033]2;running cmake ...\007')
     builder.cmake()
+    with tracer.span('evict vcpkg caches'):
+        builder.evict_vcpkg_caches()
+    with tracer.span('evict compiler cache'):
+        builder.evict_compiler_cache()
     print('\033]2;done\007')
 except Exception:
     print('Error')
@@ -600,4 +997,11 @@ except Exception:
     exit(1)
 finally:
     end = timer()
+    if builder is not None and builder.trace and builder.build_path.exists():
+        tracer.write_chrome_trace(builder.build_path / 'configure-trace.json')
+        summary = tracer.summary()
+        with open(builder.build_path / 'configure-trace.txt', 'w') as summary_file:
+            summary_file.write(summary + '\n')
+        print(summary)
+        print(f'Configure trace written to "{builder.build_path / "configure-trace.json"}".')
     print(f'Script finished in {end - start:.1f} seconds')
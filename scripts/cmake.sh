@@ -2,6 +2,9 @@
 
 # Change current working directory to the base folder of this project.
 cd "$(dirname "$(readlink -f "${BASH_SOURCE[0]}")")/.."
+# Remember PATH before the virtual environment changes it, so cmake_presets.py stores the change
+# in the configure presets.
+export CMAKE_PY_PARENT_PATH="${PATH}"
 
 # Check version of Python available in PATH.
 python_version=$(python -c "import sys; print(sys.version)")
@@ -19,26 +22,40 @@ if [[ $# -eq 0 ]]; then
   readarray -t CONFIG_FILES < "${TEMP_ARGUMENTS_FILE}"
   [[ -e "${TEMP_ARGUMENTS_FILE}" ]] && rm "${TEMP_ARGUMENTS_FILE}"
 else
-  CONFIG_FILES=( "$@" )
+  # Options like `--refresh-toolchain` are only meant for cmake.py.
+  CONFIG_FILES=()
+  OPTIONS=()
+  for argument in "$@"; do
+    if [[ "${argument}" == -* ]]; then
+      OPTIONS+=( "${argument}" )
+    else
+      CONFIG_FILES+=( "${argument}" )
+    fi
+  done
 fi
 
 # Read all config files and query several specific settings that are needed
 # early in this setup script.
-PYTHON_PACKAGES_PATH=$(python scripts/query_config.py -q python-packages-path "${CONFIG_FILES[@]}")
+# In matrix mode each argument is a comma separated set of config files.
+QUERY_CONFIG_FILES=()
+for config_set in "${CONFIG_FILES[@]}"; do
+  IFS=',' read -ra config_set_files <<< "${config_set}"
+  QUERY_CONFIG_FILES+=( "${config_set_files[@]}" )
+done
+# The output is captured first, as `eval` itself succeeds even if query_config.py failed.
+QUERY_OUTPUT=$(python scripts/query_config.py --format shell-eval -q python-packages-path "${QUERY_CONFIG_FILES[@]}") || exit 10002
+eval "${QUERY_OUTPUT}"
 if [[ ! -d "${PYTHON_PACKAGES_PATH}" ]]; then
   echo "Error: Path to Python packages does not exist '${PYTHON_PACKAGES_PATH}'"
   exit 10003
 fi
 VENV_PATH=$(pwd)/scripts/.venv
-if [[ ! -d "${VENV_PATH}" ]]; then
-  python -m venv "${VENV_PATH}"
-fi
+# Creates the virtual environment if necessary and installs required Python modules from
+# ${PYTHON_PACKAGES_PATH} only if the requirements, the interpreter or the wheels changed.
+# The wheelhouse only contains Windows wheels of some packages, so unlike cmake.cmd this falls
+# back to the package index instead of passing --offline-only.
+python scripts/bootstrap_venv.py --venv "${VENV_PATH}" "${PYTHON_PACKAGES_PATH}" || exit 10004
 echo "* Entering Python virtual environment..."
 source ${VENV_PATH}/bin/activate
-echo "* Installing required Python modules..."
-python -m pip install --upgrade pip
-python -m pip install -r scripts/python_requirements.txt
-# ToDo: Download packages to allow offline installation.
-# python -m pip install --no-index --find-links "${PYTHON_PACKAGES_PATH}" -r scripts/python_requirements.txt
 
-python scripts/cmake.py "${CONFIG_FILES[@]}"
+python scripts/cmake.py "${CONFIG_FILES[@]}" "${OPTIONS[@]}"
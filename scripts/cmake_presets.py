@@ -0,0 +1,114 @@
+# Writes the CMake command line cmake.py assembled for a config combination as configure preset
+# into `CMakeUserPresets.json`, so IDEs and `cmake --preset <build folder>` can configure without
+# going through Python. Presets are named after the build folder, which is unique per combination
+# of config files. Each preset records the fingerprint of its inputs (merged configs, schema,
+# probed tools and the command line), and the file is only rewritten if that fingerprint changed.
+# Steps cmake.py performs around the CMake run, such as binary cache prefetching or log analysis,
+# don't happen when configuring by preset.
+
+import json
+import os
+from pathlib import Path
+
+import build_config
+import vcpkg_cache
+
+PRESETS_FILENAME = 'CMakeUserPresets.json'
+# Presets version 6 requires CMake 3.25.
+PRESETS_VERSION = 6
+VENDOR_KEY = 'AppointmentsClient/cmake.py'
+# PATH as it was before cmake.cmd/cmake.sh set up the toolset and the virtual environment.
+PARENT_PATH_VARIABLE = 'CMAKE_PY_PARENT_PATH'
+# Variables set up by vsdevcmd.bat, which cmake.cmd calls before Python starts. They are always
+# stored, as IDEs and plain shells lack them. Names are compared in upper case, like Windows does.
+TOOLSET_VARIABLES = ['DEVENVDIR', 'EXTERNAL_INCLUDE', 'INCLUDE', 'LIB', 'LIBPATH', 'PLATFORM', 'UCRTVERSION',
+                     'UNIVERSALCRTSDKDIR', 'VCINSTALLDIR', 'VCTOOLSINSTALLDIR', 'VCTOOLSREDISTDIR',
+                     'VCTOOLSVERSION', 'VISUALSTUDIOVERSION', 'VSINSTALLDIR']
+TOOLSET_VARIABLE_PREFIXES = ['VSCMD_', 'WINDOWSSDK']
+
+
+def configure_preset(name, config_filenames, command, environment, fingerprint):
+    """Translates a cmake command line as used by cmake.py into a configure preset."""
+    preset = {
+        'name': name,
+        'displayName': f'{name} ({", ".join(Path(filename).name for filename in config_filenames)})'
+    }
+    cache_variables = {}
+    arguments = [str(argument) for argument in command[1:]]
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        if argument in ['-S', '-B', '-G', '-A'] and index + 1 < len(arguments):
+            value = arguments[index + 1]
+            index += 2
+            if argument == '-B':
+                preset['binaryDir'] = value
+            elif argument == '-G':
+                preset['generator'] = value
+            elif argument == '-A':
+                preset['architecture'] = {'value': value, 'strategy': 'set'}
+            continue
+        if argument.startswith('-T'):
+            preset['toolset'] = {'value': argument[2:], 'strategy': 'set'}
+        elif argument.startswith('-D'):
+            key, _, value = argument[2:].partition('=')
+            key, _, variable_type = key.partition(':')
+            if variable_type:
+                cache_variables[key] = {'type': variable_type, 'value': value}
+            else:
+                cache_variables[key] = value
+        index += 1
+    preset['cacheVariables'] = cache_variables
+
+    # Only variables changed by cmake.py or its launcher scripts are stored, and values extending the
+    # parent environment (such as PATH) keep referring to it.
+    parent_environment = dict(os.environ)
+    if PARENT_PATH_VARIABLE in parent_environment:
+        parent_environment['PATH'] = parent_environment.pop(PARENT_PATH_VARIABLE)
+    changed = {}
+    for key, value in environment.items():
+        if key == PARENT_PATH_VARIABLE:
+            continue
+        parent_value = parent_environment.get(key)
+        is_toolset_variable = key.upper() in TOOLSET_VARIABLES or \
+            any(key.upper().startswith(prefix) for prefix in TOOLSET_VARIABLE_PREFIXES)
+        if parent_value == value and not is_toolset_variable:
+            continue
+        if parent_value and value.endswith(parent_value) and not is_toolset_variable:
+            value = value[:-len(parent_value)] + f'$penv{{{key}}}'
+        changed[key] = value
+    if changed:
+        preset['environment'] = changed
+    preset['vendor'] = {VENDOR_KEY: {'configs': [Path(filename).name for filename in config_filenames],
+                                     'fingerprint': fingerprint}}
+    return preset
+
+
+def update_user_presets(base_path, preset):
+    """Adds or replaces `preset` in the user presets file. Returns whether the file was written."""
+    filename = Path(base_path) / PRESETS_FILENAME
+    # Matrix runs update the file concurrently.
+    os.makedirs(build_config.cache_path, exist_ok=True)
+    with vcpkg_cache.FileLock(build_config.cache_path / 'user-presets.lock'):
+        try:
+            with open(filename, 'r') as presets_file:
+                presets = json.load(presets_file)
+        except (OSError, ValueError):
+            presets = {}
+        presets.setdefault('version', PRESETS_VERSION)
+        configure_presets = presets.setdefault('configurePresets', [])
+        for index, existing in enumerate(configure_presets):
+            if existing.get('name') == preset['name']:
+                if existing.get('vendor', {}).get(VENDOR_KEY, {}).get('fingerprint') == \
+                        preset['vendor'][VENDOR_KEY]['fingerprint']:
+                    return False
+                configure_presets[index] = preset
+                break
+        else:
+            configure_presets.append(preset)
+        temp_filename = filename.with_name(f'.{PRESETS_FILENAME}.{os.getpid()}.tmp')
+        with open(temp_filename, 'w') as presets_file:
+            json.dump(presets, presets_file, indent=4)
+            presets_file.write('\n')
+        os.replace(temp_filename, filename)
+    return True
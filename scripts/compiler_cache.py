@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+# Local content-addressed cache of compiler outputs, used as CMAKE_<LANG>_COMPILER_LAUNCHER when
+# the config section "compiler-cache" is enabled. Objects are keyed on the preprocessed source, all
+# compiler arguments and the identity of the compiler, so switching between build configurations
+# or branches reuses previously compiled objects. Only GCC style compile commands (`-c` with `-o`)
+# are cached; everything else is passed through to the compiler unchanged.
+#
+# The cache is size limited: entries are touched on every hit and the least recently used ones are
+# evicted by `compiler_cache.py evict`, which cmake.py runs after each configure, and by the
+# launcher itself at most once per hour.
+#
+# Usage as launcher: compiler_cache.py compile --cache-path <path> --budget <size> <compiler> <args>...
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+from timeit import default_timer as timer
+import vcpkg_cache
+
+STATS_FILENAME = 'stats.log'
+LAST_EVICTION_FILENAME = 'last-eviction'
+EVICTION_INTERVAL = 3600
+# Entries are evicted until the cache shrinks below this fraction of its budget, so the eviction
+# doesn't have to run again right away.
+EVICTION_TARGET = 0.9
+
+# Options which prevent caching, because the output depends on more than the preprocessed source
+# or consists of more than the object file and the depfile.
+UNCACHEABLE_OPTIONS = ['-E', '-S', '-M', '-MM', '-ftest-coverage', '--coverage', '-gsplit-dwarf']
+UNCACHEABLE_PREFIXES = ['-fprofile-', '-save-temps', '-fmodule', '@']
+# Options which take a separate argument and only affect dependency file generation.
+DEPFILE_OPTIONS_WITH_VALUE = ['-MF', '-MT', '-MQ']
+DEPFILE_OPTIONS = ['-MD', '-MMD', '-MP']
+
+
+def append_stats(cache_path, event, seconds=0.0):
+    # Lines below PIPE_BUF are written atomically, even by concurrent launchers.
+    try:
+        fd = os.open(cache_path / STATS_FILENAME, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, f'{event} {seconds:.3f}\n'.encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def analyze_arguments(arguments):
+    """Returns the object filename, the depfile name (or None), the arguments for running the
+    preprocessor and the arguments the cache key is computed from, or None if the command cannot be
+    cached. The latter don't depend on where `-o`, `-c` and the depfile options are placed."""
+    if '-c' not in arguments:
+        return None
+    output = None
+    depfile = None
+    preprocess = []
+    depfile_arguments = []
+    sources = 0
+    skip_next = False
+    for i, argument in enumerate(arguments):
+        if skip_next:
+            skip_next = False
+            continue
+        if argument in UNCACHEABLE_OPTIONS or argument.startswith(tuple(UNCACHEABLE_PREFIXES)):
+            return None
+        if argument == '-o':
+            if i + 1 >= len(arguments):
+                return None
+            output = arguments[i + 1]
+            skip_next = True
+            continue
+        if argument in DEPFILE_OPTIONS_WITH_VALUE:
+            if i + 1 >= len(arguments):
+                return None
+            if argument == '-MF':
+                depfile = arguments[i + 1]
+            depfile_arguments += [argument, arguments[i + 1]]
+            skip_next = True
+            continue
+        if argument in DEPFILE_OPTIONS:
+            depfile_arguments.append(argument)
+            continue
+        if argument == '-c':
+            continue
+        if not argument.startswith('-') and Path(argument).suffix.lower() in ['.c', '.cc', '.cpp', '.cxx', '.c++']:
+            sources += 1
+        preprocess.append(argument)
+    if output is None or sources != 1:
+        return None
+    if depfile is None and ('-MD' in arguments or '-MMD' in arguments):
+        depfile = str(Path(output).with_suffix('.d'))
+    return output, depfile, preprocess + ['-E'], [output, preprocess[1:], depfile_arguments]
+
+
+def compiler_identity(cache_path, compiler):
+    # `<compiler> --version` is only run once per compiler binary, identified by path, size and mtime.
+    compiler_path = shutil.which(compiler) or compiler
+    stat = os.stat(compiler_path)
+    key = hashlib.sha256(f'{Path(compiler_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()
+    identity_filename = cache_path / 'compilers' / key[:32]
+    try:
+        return identity_filename.read_text()
+    except OSError:
+        pass
+    process = subprocess.run([compiler_path, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    identity = hashlib.sha256(key.encode() + process.stdout).hexdigest()
+    os.makedirs(identity_filename.parent, exist_ok=True)
+    temp_filename = identity_filename.with_suffix(f'.{os.getpid()}.tmp')
+    temp_filename.write_text(identity)
+    os.replace(temp_filename, identity_filename)
+    return identity
+
+
+def compile_with_cache(cache_path, budget, arguments):
+    start = timer()
+    cache_path = Path(cache_path)
+    analysis = analyze_arguments(arguments)
+    if analysis is None:
+        append_stats(cache_path, 'uncacheable')
+        return subprocess.run(arguments).returncode
+    output, depfile, preprocess_arguments, key_arguments = analysis
+
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        key_hash = hashlib.sha256()
+        key_hash.update(compiler_identity(cache_path, arguments[0]).encode())
+        # The output and depfile names are part of the depfile, thus part of the key as well.
+        key_hash.update(json.dumps(key_arguments).encode())
+    except OSError:
+        append_stats(cache_path, 'uncacheable')
+        return subprocess.run(arguments).returncode
+    preprocessor = subprocess.run(preprocess_arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if preprocessor.returncode != 0:
+        # Let the compiler report the error.
+        append_stats(cache_path, 'uncacheable')
+        return subprocess.run(arguments).returncode
+    key_hash.update(preprocessor.stdout)
+    key = key_hash.hexdigest()
+    entry_path = cache_path / key[:2] / key[2:]
+
+    try:
+        with open(entry_path / 'entry.json', 'r') as entry_file:
+            entry = json.load(entry_file)
+        shutil.copyfile(entry_path / 'object', output)
+        if depfile is not None:
+            shutil.copyfile(entry_path / 'depfile', depfile)
+        sys.stderr.write(entry['stderr'])
+        os.utime(entry_path)
+        append_stats(cache_path, 'hit', max(0.0, entry['seconds'] - (timer() - start)))
+        return 0
+    except (OSError, ValueError, KeyError):
+        pass
+
+    compile_start = timer()
+    process = subprocess.run(arguments, stderr=subprocess.PIPE, universal_newlines=True)
+    compile_seconds = timer() - compile_start
+    sys.stderr.write(process.stderr)
+    if process.returncode != 0:
+        append_stats(cache_path, 'error')
+        return process.returncode
+
+    # Entries are assembled in a temporary folder and moved into place, so concurrent launchers
+    # never see incomplete entries.
+    temp_path = cache_path / 'tmp' / f'{key}.{os.getpid()}'
+    try:
+        os.makedirs(temp_path, exist_ok=True)
+        shutil.copyfile(output, temp_path / 'object')
+        if depfile is not None:
+            shutil.copyfile(depfile, temp_path / 'depfile')
+        with open(temp_path / 'entry.json', 'w') as entry_file:
+            json.dump({'seconds': compile_seconds, 'stderr': process.stderr}, entry_file)
+        os.makedirs(entry_path.parent, exist_ok=True)
+        os.rename(temp_path, entry_path)
+    except OSError:
+        shutil.rmtree(temp_path, ignore_errors=True)
+    append_stats(cache_path, 'miss', compile_seconds)
+
+    if budget is not None:
+        last_eviction = cache_path / LAST_EVICTION_FILENAME
+        try:
+            due = time.time() - last_eviction.stat().st_mtime > EVICTION_INTERVAL
+        except OSError:
+            due = True
+        if due:
+            last_eviction.touch()
+            evict(cache_path, vcpkg_cache.parse_size(budget))
+    return 0
+
+
+def entries(cache_path):
+    for shard_path in Path(cache_path).glob('[0-9a-f][0-9a-f]'):
+        for entry_path in shard_path.iterdir():
+            try:
+                size = sum(file.stat().st_size for file in entry_path.iterdir())
+                yield entry_path, size, entry_path.stat().st_mtime
+            except OSError:
+                continue
+
+
+def evict(cache_path, budget, dry_run=False):
+    """Removes the least recently used entries until the cache fits into its budget. Returns size
+    before the eviction, number and size of evicted entries."""
+    cache_entries = sorted(entries(cache_path), key=lambda entry: entry[2])
+    total_size = sum(size for _, size, _ in cache_entries)
+    evicted_count = 0
+    evicted_size = 0
+    if total_size > budget:
+        for entry_path, size, _ in cache_entries:
+            if total_size - evicted_size <= budget * EVICTION_TARGET:
+                break
+            if not dry_run:
+                shutil.rmtree(entry_path, ignore_errors=True)
+            evicted_count += 1
+            evicted_size += size
+    # Leftovers of interrupted launchers.
+    for temp_path in Path(cache_path).glob('tmp/*'):
+        try:
+            if time.time() - temp_path.stat().st_mtime > EVICTION_INTERVAL and not dry_run:
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except OSError:
+            pass
+    return total_size, evicted_count, evicted_size
+
+
+def read_stats(cache_path):
+    stats = {'hit': 0, 'miss': 0, 'uncacheable': 0, 'error': 0, 'seconds-saved': 0.0, 'seconds-compiled': 0.0}
+    try:
+        with open(Path(cache_path) / STATS_FILENAME, 'r') as stats_file:
+            for line in stats_file:
+                fields = line.split()
+                if len(fields) != 2 or fields[0] not in stats:
+                    continue
+                stats[fields[0]] += 1
+                if fields[0] == 'hit':
+                    stats['seconds-saved'] += float(fields[1])
+                elif fields[0] == 'miss':
+                    stats['seconds-compiled'] += float(fields[1])
+    except OSError:
+        pass
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Content-addressed cache of compiler outputs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help='Run a compile command through the cache.')
+    compile_parser.add_argument('--cache-path', required=True)
+    compile_parser.add_argument('--budget', default=None)
+    compile_parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    stats_parser = subparsers.add_parser('stats', help='Report hit rate and time saved.')
+    stats_parser.add_argument('--cache-path', required=True)
+    stats_parser.add_argument('--reset', action='store_const', const=True, default=False,
+                              help='Reset the statistics after reporting them.')
+    evict_parser = subparsers.add_parser('evict', help='Evict least recently used entries.')
+    evict_parser.add_argument('--cache-path', required=True)
+    evict_parser.add_argument('--budget', required=True)
+    evict_parser.add_argument('--dry-run', action='store_const', const=True, default=False)
+    clear_parser = subparsers.add_parser('clear', help='Remove all entries and statistics.')
+    clear_parser.add_argument('--cache-path', required=True)
+    args = parser.parse_args()
+
+    match args.command:
+        case 'compile':
+            if not args.arguments:
+                parser.error('No compile command given.')
+            exit(compile_with_cache(args.cache_path, args.budget, args.arguments))
+        case 'stats':
+            stats = read_stats(args.cache_path)
+            lookups = stats['hit'] + stats['miss']
+            total_size = sum(size for _, size, _ in entries(args.cache_path))
+            print(f'Compiler cache "{args.cache_path}": {vcpkg_cache.format_size(total_size)} in use')
+            print(f'  {stats["hit"]} hits, {stats["miss"]} misses, {stats["uncacheable"]} uncacheable, ' +
+                  f'{stats["error"]} failed compilations')
+            if lookups:
+                print(f'  Hit rate: {stats["hit"] / lookups * 100:.1f}%')
+            print(f'  Time saved: {stats["seconds-saved"]:.1f}s, ' +
+                  f'time spent compiling misses: {stats["seconds-compiled"]:.1f}s')
+            if args.reset:
+                try:
+                    os.remove(Path(args.cache_path) / STATS_FILENAME)
+                except FileNotFoundError:
+                    pass
+        case 'evict':
+            budget = vcpkg_cache.parse_size(args.budget)
+            total_size, evicted_count, evicted_size = evict(args.cache_path, budget, args.dry_run)
+            print(f'Compiler cache "{args.cache_path}": {vcpkg_cache.format_size(total_size)} in use, ' +
+                  f'{"would evict" if args.dry_run else "evicted"} {evicted_count} entries ' +
+                  f'({vcpkg_cache.format_size(evicted_size)}) to fit into {vcpkg_cache.format_size(budget)}.')
+        case 'clear':
+            shutil.rmtree(args.cache_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
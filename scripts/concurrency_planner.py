@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+# Plans the parallelism of vcpkg port builds and Ninja builds from the available cores and memory,
+# including cgroup limits of containers and CI agents (config setting "concurrency-planner").
+#
+# Ninja job pools are sized from the total memory limit, as they become part of the CMake cache and
+# must not change with momentary memory usage. Memory per link job is the largest recent link peak
+# recorded by the linker launcher (the `link` command of this script), which also delays links while
+# less memory is available than their last recorded peak. vcpkg's concurrency is passed by
+# environment, so it is planned from the currently available memory and the memory per job recorded
+# by `MemoryMonitor` for previous port builds. Without recorded peaks configured defaults are used.
+
+import argparse
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from timeit import default_timer as timer
+
+try:
+    import resource
+except ImportError:
+    # Peak memory of child processes is not available on Windows.
+    resource = None
+
+import vcpkg_log_analyzer
+
+LINK_HISTORY_FILENAME = 'link-memory-history.jsonl'
+# Links wait at most this long for memory to become available before running anyway.
+LINK_WAIT_SECONDS = 120
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+
+
+def _read_meminfo(key):
+    try:
+        with open('/proc/meminfo', 'r') as meminfo_file:
+            for line in meminfo_file:
+                if line.startswith(f'{key}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _read_cgroup_value(filename):
+    # Returns None for missing files and unlimited values ("max" or huge v1 values).
+    try:
+        value = filename.read_text().split()
+    except OSError:
+        return None
+    if not value or value[0] == 'max' or int(value[0]) < 0 or int(value[0]) >= 2 ** 62:
+        return None
+    return [int(field) for field in value]
+
+
+def _cgroup_folders(controller):
+    # Folders of the cgroups of this process from leaf to root, for cgroup v2 and v1 hierarchies.
+    # Within containers the own cgroup is usually mounted as root.
+    try:
+        lines = Path('/proc/self/cgroup').read_text().splitlines()
+    except OSError:
+        return []
+    folders = []
+    for line in lines:
+        _, controllers, path = line.split(':', 2)
+        if controllers == '':
+            base = CGROUP_ROOT if not (CGROUP_ROOT / 'unified').is_dir() else CGROUP_ROOT / 'unified'
+        elif controller in controllers.split(','):
+            base = CGROUP_ROOT / controllers
+            if not base.is_dir():
+                base = CGROUP_ROOT / controller
+        else:
+            continue
+        relative = Path(path.lstrip('/'))
+        for parent in [relative, *relative.parents]:
+            if (base / parent).is_dir() and base / parent not in folders:
+                folders += [base / parent]
+    return folders
+
+
+def _cgroup_memory():
+    # Returns the tightest cgroup memory limit and the usage within that cgroup.
+    result = None
+    for folder in _cgroup_folders('memory'):
+        for limit_name, usage_name in [('memory.max', 'memory.current'),
+                                       ('memory.limit_in_bytes', 'memory.usage_in_bytes')]:
+            limit = _read_cgroup_value(folder / limit_name)
+            if limit is None:
+                continue
+            usage = _read_cgroup_value(folder / usage_name)
+            if result is None or limit[0] < result[0]:
+                result = (limit[0], usage[0] if usage is not None else 0)
+    return result
+
+
+def cpu_count():
+    """Returns the number of cores this process may use, considering affinity and cgroup quotas."""
+    count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    for folder in _cgroup_folders('cpu'):
+        quota = _read_cgroup_value(folder / 'cpu.max')
+        if quota is None:
+            quota = _read_cgroup_value(folder / 'cpu.cfs_quota_us')
+            period = _read_cgroup_value(folder / 'cpu.cfs_period_us')
+            quota = None if quota is None or period is None else [quota[0], period[0]]
+        if quota is not None and len(quota) == 2 and quota[1] > 0:
+            count = min(count, max(1, -(-quota[0] // quota[1])))
+    return max(1, count)
+
+
+def total_memory():
+    """Returns the physical memory this process may use in bytes, or None if unknown."""
+    memory = _read_meminfo('MemTotal')
+    if memory is None:
+        try:
+            memory = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+    cgroup_memory = _cgroup_memory()
+    if cgroup_memory is not None:
+        memory = min(memory, cgroup_memory[0])
+    return memory
+
+
+def available_memory():
+    """Returns the amount of available physical memory in bytes, or None if unknown."""
+    memory = _read_meminfo('MemAvailable')
+    if memory is None:
+        try:
+            memory = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+    cgroup_memory = _cgroup_memory()
+    if cgroup_memory is not None:
+        memory = min(memory, max(0, cgroup_memory[0] - cgroup_memory[1]))
+    return memory
+
+
+def _jobs(memory, job_memory, cores):
+    if memory is None:
+        return cores
+    return max(1, min(cores, memory // max(1, job_memory)))
+
+
+def plan(cores, memory, available, reserved_memory, compile_job_memory, link_job_memory, vcpkg_job_memory,
+         share=1):
+    """Returns the number of parallel compile, link and vcpkg jobs. `share` is the number of
+    configure runs building vcpkg ports on this machine at the same time (see `cmake.py --matrix`),
+    which split the cores and available memory for vcpkg jobs among each other. Compile and link
+    jobs are used by later builds and are planned for the whole machine."""
+    memory = None if memory is None else max(0, memory - reserved_memory)
+    available = None if available is None else max(0, available - reserved_memory)
+    return {
+        'compile-jobs': _jobs(memory, compile_job_memory, cores),
+        'link-jobs': _jobs(memory, link_job_memory, cores),
+        'vcpkg-jobs': _jobs(None if available is None else available // share, vcpkg_job_memory,
+                            max(1, cores // share))
+    }
+
+
+def read_link_history(history_filename):
+    """Returns the most recent peak memory in bytes of each link output."""
+    peaks = {}
+    try:
+        with open(history_filename, 'r') as history_file:
+            for line in history_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('peak'):
+                    peaks[record['output']] = record['peak']
+    except OSError:
+        pass
+    return peaks
+
+
+def compact_link_history(history_filename, peaks):
+    # Keeps only the most recent record of each output, so the history doesn't grow without bounds.
+    temp_filename = Path(f'{history_filename}.{os.getpid()}.tmp')
+    with open(temp_filename, 'w') as history_file:
+        for output, peak in sorted(peaks.items()):
+            history_file.write(json.dumps({'output': output, 'peak': peak}) + '\n')
+    os.replace(temp_filename, history_filename)
+
+
+def vcpkg_job_memory_peak(port_history_records):
+    """Returns the largest memory per job recorded for the most recent build of each port."""
+    peaks = {}
+    for record in port_history_records:
+        if record.get('memory-per-job'):
+            peaks[record['port']] = record['memory-per-job']
+    return max(peaks.values()) if peaks else None
+
+
+class MemoryMonitor:
+    # Samples memory usage while vcpkg builds ports and records the peak of each port. Reports
+    # when available memory falls below the reserve, so VCPKG_MAX_CONCURRENCY can be re-planned.
+    interval = 0.5
+
+    def __init__(self, jobs, reserved_memory):
+        self.jobs = jobs
+        self.reserved_memory = reserved_memory
+        self.port = None
+        self.peaks = {}
+        self.pressure_ports = set()
+        self.minimum_available = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.baseline = self._used_memory()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+    def process_line(self, line):
+        if (search_result := vcpkg_log_analyzer.BUILDING_PATTERN.match(line)) is not None:
+            with self.lock:
+                self.port = search_result.group(1)
+        elif vcpkg_log_analyzer.ELAPSED_PATTERN.match(line) is not None:
+            with self.lock:
+                self.port = None
+
+    @staticmethod
+    def _used_memory():
+        total = total_memory()
+        available = available_memory()
+        if total is None or available is None:
+            return None
+        return total - available
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            used = self._used_memory()
+            if used is None:
+                return
+            available = available_memory()
+            with self.lock:
+                port = self.port
+            if self.minimum_available is None or available < self.minimum_available:
+                self.minimum_available = available
+            if port is None:
+                continue
+            self.peaks[port] = max(self.peaks.get(port, 0), used - (self.baseline or 0))
+            if available < self.reserved_memory and port not in self.pressure_ports:
+                self.pressure_ports.add(port)
+                print(f'Memory pressure while building {port} with {self.jobs} jobs: only ' +
+                      f'{available / 1024 ** 3:.1f} GiB available. Following runs use fewer jobs.')
+
+    def record_peaks(self, records):
+        """Adds the peak memory per job of each built port to its history record."""
+        for record in records:
+            if record['cache'] == 'built' and self.peaks.get(record['port']):
+                record['memory-per-job'] = self.peaks[record['port']] // self.jobs
+
+
+def _link_output(arguments):
+    for index, argument in enumerate(arguments):
+        if argument == '-o' and index + 1 < len(arguments):
+            return arguments[index + 1]
+        if argument.upper().startswith('/OUT:'):
+            return argument[5:]
+    return None
+
+
+def run_link(history_filename, arguments):
+    """Runs a link command, delaying it while less memory is available than its last peak."""
+    output = _link_output(arguments)
+    expected_peak = read_link_history(history_filename).get(output) if output is not None else None
+    if expected_peak is not None:
+        waited = 0.0
+        available = available_memory()
+        while available is not None and available < expected_peak and waited < LINK_WAIT_SECONDS:
+            if waited == 0.0:
+                print(f'Throttling link of "{output}": last peak was {expected_peak / 1024 ** 3:.1f} GiB, ' +
+                      f'only {available / 1024 ** 3:.1f} GiB available.', file=sys.stderr)
+            time.sleep(1.0)
+            waited += 1.0
+            available = available_memory()
+        if waited:
+            print(f'Link of "{output}" delayed by {waited:.0f} seconds.', file=sys.stderr)
+
+    start = timer()
+    returncode = subprocess.call(arguments)
+    if resource is not None and output is not None and returncode == 0:
+        # ru_maxrss covers the largest descendant, i.e. the actual linker spawned by the driver.
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+        with open(history_filename, 'a') as history_file:
+            history_file.write(json.dumps({'timestamp': datetime.now().isoformat(timespec='seconds'),
+                                           'output': output, 'peak': peak,
+                                           'seconds': round(timer() - start, 3)}) + '\n')
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Plan build concurrency from cores, memory and recorded memory peaks.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('show', help='Show detected resources.')
+    link_parser = subparsers.add_parser('link', help='Run a link command and record its peak memory.')
+    link_parser.add_argument('--history', required=True, help='Link memory history file.')
+    link_parser.add_argument('arguments', nargs=argparse.REMAINDER, help='Link command line.')
+    args = parser.parse_args()
+
+    if args.command == 'link':
+        arguments = args.arguments[1:] if args.arguments[:1] == ['--'] else args.arguments
+        exit(run_link(args.history, arguments))
+    memory = total_memory()
+    available = available_memory()
+    print(f'Cores: {cpu_count()}')
+    print(f'Memory: {"unknown" if memory is None else f"{memory / 1024 ** 3:.1f} GiB"}, ' +
+          f'available: {"unknown" if available is None else f"{available / 1024 ** 3:.1f} GiB"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+
+# Persistent index of the header dependencies of all translation units listed in a build folder's
+# `compile_commands.json`. Dependencies are taken from Ninja's deps log (`ninja -t deps`), which
+# covers every translation unit built at least once. The remaining ones are scanned by running
+# the compiler in dependency-only mode (`-M` or `/showIncludes`). Scan results are kept in
+# `include-graph-index.json` within the build folder and are only refreshed for translation units
+# whose command line, source or dependencies changed since.
+#
+# Sizes reported are based on the header file sizes, i.e. the amount of source text the
+# preprocessor has to read, not on the fully preprocessed output.
+
+import argparse
+import build_config
+import concurrent.futures
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shlex
+import shutil
+import subprocess
+import vcpkg_cache
+
+INDEX_FILENAME = 'include-graph-index.json'
+INDEX_VERSION = 1
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+TARGET_PATTERN = re.compile(r'CMakeFiles/([^/]+)\.dir/')
+
+
+def normalize(path, directory):
+    return os.path.normpath(os.path.join(directory, path)).replace('\\', '/')
+
+
+def command_arguments(entry):
+    if 'arguments' in entry:
+        return list(entry['arguments'])
+    return shlex.split(entry['command'], posix=os.name != 'nt')
+
+
+def read_compile_commands(build_path):
+    """Returns a dict mapping a key for each translation unit (its object file, or its source file
+    for older CMake versions) to its compile_commands.json entry."""
+    with open(build_path / 'compile_commands.json', 'r') as compile_commands_file:
+        entries = json.load(compile_commands_file)
+    units = {}
+    for entry in entries:
+        output = entry.get('output')
+        if output is None:
+            # CMake only writes the "output" attribute since version 3.27.
+            arguments = command_arguments(entry)
+            for i, argument in enumerate(arguments):
+                if argument == '-o' and i + 1 < len(arguments):
+                    output = arguments[i + 1]
+                elif argument.startswith(('/Fo', '-Fo')):
+                    output = argument[3:]
+        units[(output or entry['file']).replace('\\', '/')] = entry
+    return units
+
+
+def read_ninja_deps(build_path):
+    """Returns a dict mapping outputs to the files Ninja recorded as their dependencies."""
+    ninja = shutil.which('ninja')
+    if ninja is None or not (build_path / '.ninja_deps').exists():
+        return {}
+    process = subprocess.run([ninja, '-C', build_path, '-t', 'deps'], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, universal_newlines=True)
+    if process.returncode != 0:
+        return {}
+    deps = {}
+    output = None
+    for line in process.stdout.splitlines():
+        if not line.strip():
+            output = None
+        elif not line.startswith(' '):
+            search_result = re.match(r'^(.*): #deps \d+', line)
+            output = search_result.group(1) if search_result else None
+            if output is not None:
+                deps[output] = []
+        elif output is not None:
+            deps[output].append(normalize(line.strip(), build_path))
+    return deps
+
+
+def scan_command(entry):
+    """Turns a compile command into one that only lists the included files."""
+    arguments = command_arguments(entry)
+    compiler = Path(arguments[0]).stem.lower()
+    scan = [arguments[0]]
+    skip_next = False
+    for argument in arguments[1:]:
+        if skip_next:
+            skip_next = False
+            continue
+        if argument in ['-o', '-MF', '-MT', '-MQ']:
+            skip_next = True
+            continue
+        if argument in ['-c', '-MD', '-MMD', '-MP'] or argument.startswith(('-o', '/Fo', '-Fo', '/Fd', '-Fd')):
+            continue
+        scan.append(argument)
+    if compiler in ['cl', 'clang-cl']:
+        return scan + ['/showIncludes', '/Zs', '/nologo'], 'msvc'
+    return scan + ['-M'], 'gcc'
+
+
+def scan_unit(entry):
+    command, style = scan_command(entry)
+    process = subprocess.run(command, cwd=entry['directory'], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        return None
+    deps = []
+    if style == 'msvc':
+        for line in process.stdout.splitlines():
+            if line.startswith('Note: including file:'):
+                deps.append(normalize(line.split(':', 1)[1].split(':', 1)[1].strip(), entry['directory']))
+    else:
+        # Make rule syntax: `target: dep dep \` with backslash escaped spaces.
+        text = process.stdout.replace('\\\n', ' ')
+        text = text.split(':', 1)[1] if ':' in text else ''
+        for dep in re.split(r'(?<!\\)\s+', text.strip()):
+            if dep:
+                deps.append(normalize(dep.replace('\\ ', ' '), entry['directory']))
+    source = normalize(entry['file'], entry['directory'])
+    return [dep for dep in deps if dep != source]
+
+
+class IncludeIndex:
+    def __init__(self, build_path):
+        self.build_path = Path(build_path)
+        self.filename = self.build_path / INDEX_FILENAME
+        self.units = {}
+        self.files = {}
+        try:
+            with open(self.filename, 'r') as index_file:
+                index = json.load(index_file)
+            if index.get('version') == INDEX_VERSION:
+                paths = index['paths']
+                self.files = {paths[id]: stat for id, stat in index['files'].items() for id in [int(id)]}
+                for key, unit in index['units'].items():
+                    unit['deps'] = [paths[id] for id in unit['deps']]
+                    self.units[key] = unit
+        except (OSError, ValueError, KeyError, IndexError):
+            self.units = {}
+            self.files = {}
+
+    def save(self):
+        paths = sorted(set(dep for unit in self.units.values() for dep in unit['deps']) | set(self.files))
+        ids = {path: id for id, path in enumerate(paths)}
+        units = {key: dict(unit, deps=[ids[dep] for dep in unit['deps']]) for key, unit in self.units.items()}
+        temp_filename = self.filename.with_suffix(f'.{os.getpid()}.tmp')
+        with open(temp_filename, 'w') as index_file:
+            json.dump({'version': INDEX_VERSION, 'paths': paths,
+                       'files': {ids[path]: stat for path, stat in self.files.items()},
+                       'units': units}, index_file)
+        os.replace(temp_filename, self.filename)
+
+    def _stat(self, path, stats):
+        if path not in stats:
+            try:
+                stat = os.stat(path)
+                stats[path] = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                stats[path] = None
+        return stats[path]
+
+    def update(self, use_ninja=True, use_compiler=True, jobs=None):
+        """Brings the index up to date. Returns the number of translation units taken from Ninja's
+        deps log, scanned by the compiler and reused from the index."""
+        compile_commands = read_compile_commands(self.build_path)
+        ninja_deps = read_ninja_deps(self.build_path) if use_ninja else {}
+        stats = {}
+        counts = {'ninja': 0, 'scanned': 0, 'reused': 0, 'failed': 0}
+        units = {}
+        to_scan = []
+        for key, entry in compile_commands.items():
+            source = normalize(entry['file'], entry['directory'])
+            command_hash = hashlib.sha256(json.dumps(command_arguments(entry)).encode()).hexdigest()[:32]
+            unit = {'file': source, 'command-hash': command_hash}
+            if key in ninja_deps:
+                # Only depfiles (`deps = gcc`) list the compiled source file, `/showIncludes`
+                # (`deps = msvc`) doesn't.
+                units[key] = dict(unit, origin='ninja', deps=[path for path in ninja_deps[key] if path != source])
+                counts['ninja'] += 1
+                continue
+            previous = self.units.get(key)
+            # Units taken from Ninja's deps log have no scan time to check against, e.g. if the log
+            # was removed since.
+            if previous is not None and previous['command-hash'] == command_hash and 'scanned' in previous:
+                # Any change of the source or one of its dependencies may change the set of includes.
+                newest = max((stat[1] for path in [source] + previous['deps']
+                              if (stat := self._stat(path, stats)) is not None), default=0)
+                if newest <= previous['scanned']:
+                    units[key] = previous
+                    counts['reused'] += 1
+                    continue
+            if use_compiler:
+                to_scan.append((key, entry, unit))
+        if to_scan:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+                futures = {executor.submit(scan_unit, entry): (key, entry, unit) for key, entry, unit in to_scan}
+                for future in concurrent.futures.as_completed(futures):
+                    key, entry, unit = futures[future]
+                    # Anything modified during the scan will be rescanned next time.
+                    deps = future.result()
+                    if deps is None:
+                        counts['failed'] += 1
+                        continue
+                    units[key] = dict(unit, origin='compiler', deps=deps,
+                                      scanned=max((stat[1] for path in [unit['file']] + deps
+                                                   if (stat := self._stat(path, stats)) is not None), default=0))
+                    counts['scanned'] += 1
+        self.units = units
+        for unit in units.values():
+            for path in unit['deps']:
+                self._stat(path, stats)
+        self.files = {path: stat for path, stat in stats.items() if stat is not None}
+        self.save()
+        return counts
+
+    def size(self, path):
+        stat = self.files.get(path)
+        return stat[0] if stat is not None else 0
+
+    def sources_by_header(self, keys=None):
+        # Translation units built in several configurations count once.
+        sources = {}
+        for key, unit in self.units.items():
+            if keys is None or key in keys:
+                for dep in unit['deps']:
+                    sources.setdefault(dep, set()).add(unit['file'])
+        return sources
+
+    def source_count(self, keys=None):
+        return len(set(unit['file'] for key, unit in self.units.items() if keys is None or key in keys))
+
+    def resolve(self, header):
+        # Accepts absolute paths as well as trailing path components like "QtCore/qstring.h".
+        candidate = normalize(header, os.getcwd())
+        if candidate in self.files:
+            return [candidate]
+        suffix = '/' + header.replace('\\', '/').lstrip('./')
+        return sorted(path for path in self.files if path.endswith(suffix))
+
+    def targets(self):
+        targets = {}
+        for key in self.units:
+            search_result = TARGET_PATTERN.search(key)
+            targets.setdefault(search_result.group(1) if search_result else '<unknown>', set()).add(key)
+        return targets
+
+
+def is_project_file(path):
+    # Project headers change frequently, which makes them poor precompiled header candidates.
+    base_path = build_config.base_path.as_posix() + '/'
+    return path.startswith(base_path) and '/vcpkg_installed/' not in path and '/build-' not in path
+
+
+def report_affected(index, headers, list_sources):
+    sources_by_header = index.sources_by_header()
+    total = index.source_count()
+    for header in headers:
+        paths = index.resolve(header)
+        if not paths:
+            print(f'"{header}" is not included by any translation unit.')
+            continue
+        for path in paths:
+            sources = sources_by_header.get(path, set())
+            print(f'{len(sources)} of {total} translation units depend on "{path}".')
+            if list_sources:
+                for source in sorted(sources):
+                    print(f'  {source}')
+
+
+def report_heaviest(index, top):
+    sources_by_header = index.sources_by_header()
+    rows = sorted(((index.size(path) * len(sources), len(sources), path) for path, sources in sources_by_header.items()),
+                  reverse=True)
+    print(f'Headers with the largest aggregate size over {index.source_count()} translation units:')
+    for aggregate, count, path in rows[:top]:
+        print(f'  {vcpkg_cache.format_size(aggregate):>10}  {count:5} TUs  {path}')
+
+
+def report_pch_candidates(index, top, min_share):
+    for target, keys in sorted(index.targets().items()):
+        total = index.source_count(keys)
+        if total < 2:
+            continue
+        rows = []
+        for path, sources in index.sources_by_header(keys).items():
+            if len(sources) / total >= min_share:
+                rows.append((index.size(path) * len(sources), len(sources), path))
+        if not rows:
+            continue
+        print(f'{target} ({total} translation units):')
+        for aggregate, count, path in sorted(rows, reverse=True)[:top]:
+            note = '  (project header)' if is_project_file(path) else ''
+            print(f'  {vcpkg_cache.format_size(aggregate):>10}  {count:5} TUs  {path}{note}')
+
+
+def write_graph(index, top, output_filename, render_format):
+    try:
+        import graphviz
+    except ImportError:
+        print('Error: The graph command requires the Python package "graphviz".')
+        exit(1)
+    sources_by_header = index.sources_by_header()
+    headers = sorted(sources_by_header, key=lambda path: len(sources_by_header[path]), reverse=True)[:top]
+    selected = set(headers)
+    # Direct include edges aren't part of the dependency lists, so they are recovered by matching
+    # the #include directives of the selected headers against the other selected headers.
+    graph = graphviz.Digraph('includes', graph_attr={'rankdir': 'LR'}, node_attr={'shape': 'box'})
+    for path in headers:
+        label = f'{Path(path).name}\n{len(sources_by_header[path])} TUs, {vcpkg_cache.format_size(index.size(path))}'
+        graph.node(path, label=label, tooltip=path,
+                   style='filled', fillcolor='lightblue' if is_project_file(path) else 'white')
+    for path in headers:
+        try:
+            text = Path(path).read_text(errors='replace')
+        except OSError:
+            continue
+        for include in INCLUDE_PATTERN.findall(text):
+            suffix = '/' + include
+            for target in selected:
+                if target != path and target.endswith(suffix):
+                    graph.edge(path, target)
+    graph.save(output_filename)
+    print(f'Graph written to "{output_filename}".')
+    if render_format is not None:
+        try:
+            print(f'Rendered to "{graph.render(format=render_format)}".')
+        except graphviz.ExecutableNotFound:
+            print('Error: Rendering requires the Graphviz "dot" executable.')
+            exit(1)
+
+
+def find_build_path():
+    build_paths = sorted(build_path for build_path in build_config.base_path.glob('build-*')
+                         if (build_path / 'compile_commands.json').exists())
+    if len(build_paths) != 1:
+        print('Error: Please specify the build folder using --build-path, found ' +
+              f'{len(build_paths)} build folders containing a compile_commands.json.')
+        exit(1)
+    return build_paths[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Index header dependencies of all translation units and estimate rebuild costs.')
+    parser.add_argument('--build-path', default=None,
+                        help='Build folder containing compile_commands.json (default: the only such build-* folder).')
+    parser.add_argument('--no-update', action='store_const', const=True, default=False,
+                        help='Query the existing index without updating it first.')
+    parser.add_argument('--no-compiler', action='store_const', const=True, default=False,
+                        help='Only use Ninja\'s deps log and skip translation units not built yet.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of parallel compiler scans (default: number of CPU cores).')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('update', help='Update the index.')
+    affected_parser = subparsers.add_parser('affected', help='Count translation units depending on headers.')
+    affected_parser.add_argument('headers', nargs='+',
+                                 help='Header paths, or trailing path components like "QtCore/qstring.h".')
+    affected_parser.add_argument('--list', action='store_const', const=True, default=False,
+                                 help='List the affected source files.')
+    heaviest_parser = subparsers.add_parser('heaviest', help='List headers by aggregate size over all TUs.')
+    heaviest_parser.add_argument('--top', type=int, default=20)
+    pch_parser = subparsers.add_parser('pch-candidates', help='List precompiled header candidates per target.')
+    pch_parser.add_argument('--top', type=int, default=10)
+    pch_parser.add_argument('--min-share', type=float, default=0.5,
+                            help='Minimum share of a target\'s translation units including a header.')
+    graph_parser = subparsers.add_parser('graph', help='Write a Graphviz graph of the most included headers.')
+    graph_parser.add_argument('--top', type=int, default=40)
+    graph_parser.add_argument('--output', default=None,
+                              help='Output filename (default: include-graph.gv within the build folder).')
+    graph_parser.add_argument('--render', default=None,
+                              help='Also render the graph into the given format, e.g. "svg".')
+    args = parser.parse_args()
+
+    build_path = Path(args.build_path) if args.build_path is not None else find_build_path()
+    index = IncludeIndex(build_path)
+    if not args.no_update:
+        try:
+            counts = index.update(use_compiler=not args.no_compiler, jobs=args.jobs)
+        except (OSError, ValueError) as error:
+            print(f'Error: Cannot read "{build_path / "compile_commands.json"}": {error}')
+            exit(1)
+        print(f'Index updated: {counts["ninja"]} from Ninja deps log, {counts["scanned"]} scanned, ' +
+              f'{counts["reused"]} unchanged, {counts["failed"]} failed.')
+
+    match args.command:
+        case 'affected':
+            report_affected(index, args.headers, args.list)
+        case 'heaviest':
+            report_heaviest(index, args.top)
+        case 'pch-candidates':
+            report_pch_candidates(index, args.top, args.min_share)
+        case 'graph':
+            write_graph(index, args.top, args.output or build_path / 'include-graph.gv', args.render)
+
+
+if __name__ == '__main__':
+    main()
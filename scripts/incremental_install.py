@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+# Incremental install into the production prefix (`production`, see cmake.py), driven by a content
+# hash manifest of the prefix.
+#
+# `cmake --install` first installs each configuration into a staging folder within the build
+# folder, where CMake's own up-to-date check skips unchanged files. Files listed by the previous
+# install manifest of CMake but not by the current one are removed from the staging folder; files
+# deployed by install scripts without being listed (e.g. vcpkg's applocal deployment of runtime
+# dependencies) are kept. The staged files are then synchronized into the
+# prefix: only files whose content hash changed are copied, files with content already present in
+# the prefix (e.g. the release runtime dependencies vcpkg deploys for Release and RelWithDebInfo
+# alike) are hardlinked, and files no longer installed are removed. Hashes of staged files are
+# cached by size and modification time, so unchanged files are not read again. Symbolic links
+# (e.g. namelinks of shared libraries) are kept as links.
+#
+# The prefix holds `install-manifest.json` with the hash and size of every file, and
+# `install-delta.json` listing the files added, changed and removed by the last install, so
+# packaging can transfer only the delta.
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+
+MANIFEST_FILENAME = 'install-manifest.json'
+DELTA_FILENAME = 'install-delta.json'
+STAGING_FOLDER = 'install-staging'
+HASH_CACHE_FILENAME = 'install-staging-hashes.json'
+# Copy of CMake's install manifest of the previous install of each configuration.
+STAGED_MANIFEST_SUFFIX = '-install-manifest.txt'
+
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _load_json(filename):
+    try:
+        with open(filename, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(filename, data):
+    temp_filename = Path(f'{filename}.{os.getpid()}.tmp')
+    with open(temp_filename, 'w') as json_file:
+        json.dump(data, json_file, indent=1, sort_keys=True)
+    os.replace(temp_filename, filename)
+
+
+def _read_install_manifest(filename):
+    try:
+        with open(filename, 'r') as manifest_file:
+            return {Path(line.strip()).as_posix() for line in manifest_file if line.strip()}
+    except OSError:
+        return set()
+
+
+def staged_paths(staging_path):
+    """Returns all files and symbolic links within the staging folder."""
+    paths = []
+    for folder, dirnames, filenames in os.walk(staging_path):
+        # Links to folders are not followed, but staged as links.
+        paths += [Path(folder) / dirname for dirname in dirnames if (Path(folder) / dirname).is_symlink()]
+        paths += [Path(folder) / filename for filename in filenames]
+    return paths
+
+
+def stage(cmake, build_path, config, staging_path):
+    """Installs one configuration of the build folder into `staging_path`. Returns the paths of
+    all staged files."""
+    command = [cmake, '--install', build_path, '--config', config, '--prefix', staging_path]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        print(result.stdout)
+        raise RuntimeError(f'Installing configuration {config} of "{build_path}" failed.')
+
+    # Files of previous installs which are no longer installed would be mistaken as installed.
+    # Files CMake doesn't list at all can't be told apart from installed ones, so they are kept.
+    previous_manifest_filename = Path(f'{staging_path}{STAGED_MANIFEST_SUFFIX}')
+    installed = _read_install_manifest(build_path / 'install_manifest.txt')
+    for path in sorted(_read_install_manifest(previous_manifest_filename) - installed):
+        if os.path.lexists(path):
+            os.unlink(path)
+    shutil.copyfile(build_path / 'install_manifest.txt', previous_manifest_filename)
+    return staged_paths(staging_path)
+
+
+def hash_files(root, paths, hash_cache):
+    """Returns the hash and size of each of the files below `root`, or the target of symbolic links,
+    keyed on its relative POSIX path. `hash_cache` maps absolute paths to [size, mtime_ns, sha256]
+    and is updated in place."""
+    files = {}
+    for path in paths:
+        if path.is_symlink():
+            files[path.relative_to(root).as_posix()] = {'symlink': os.readlink(path)}
+            continue
+        stat = path.stat()
+        cached = hash_cache.get(path.as_posix())
+        if cached is None or cached[:2] != [stat.st_size, stat.st_mtime_ns]:
+            cached = [stat.st_size, stat.st_mtime_ns, _file_sha256(path)]
+            hash_cache[path.as_posix()] = cached
+        files[path.relative_to(root).as_posix()] = {'sha256': cached[2], 'size': stat.st_size}
+    return files
+
+
+def _is_installed(target, entry):
+    if 'symlink' in entry:
+        return target.is_symlink() and os.readlink(target) == entry['symlink']
+    return target.is_file() and not target.is_symlink()
+
+
+def _replace_symlink(link_target, target):
+    os.makedirs(target.parent, exist_ok=True)
+    temp_target = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+    if os.path.lexists(temp_target):
+        temp_target.unlink()
+    os.symlink(link_target, temp_target)
+    os.replace(temp_target, target)
+
+
+def _replace_file(source, target, link):
+    # Replace via rename, so hardlinked siblings and readers of the old file are never modified.
+    os.makedirs(target.parent, exist_ok=True)
+    temp_target = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+    if os.path.lexists(temp_target):
+        temp_target.unlink()
+    if link:
+        try:
+            os.link(source, temp_target)
+        except OSError:
+            link = False
+    if not link:
+        shutil.copy2(source, temp_target)
+    os.replace(temp_target, target)
+    return link
+
+
+def synchronize(sources, prefix_path):
+    """Synchronizes the staged files into the prefix. `sources` maps the subfolder within the prefix
+    ('' for the prefix itself) to the staging folder and its hashes. Returns the delta."""
+    prefix_path = Path(prefix_path)
+    manifest_filename = prefix_path / MANIFEST_FILENAME
+    previous = _load_json(manifest_filename).get('files', {})
+    manifest = {}
+    delta = {'added': [], 'changed': [], 'removed': []}
+    # Any file already within the prefix may serve as hardlink source for identical content.
+    content_paths = {entry['sha256']: prefix_path / path for path, entry in previous.items() if 'sha256' in entry}
+    copied = 0
+    linked = 0
+    copied_size = 0
+    for subfolder, (staging_path, files) in sources.items():
+        for relative_path, entry in files.items():
+            path = f'{subfolder}/{relative_path}' if subfolder else relative_path
+            target = prefix_path / path
+            manifest[path] = entry
+            old_entry = previous.get(path)
+            if old_entry == entry and _is_installed(target, entry):
+                if 'sha256' in entry:
+                    content_paths.setdefault(entry['sha256'], target)
+                continue
+            delta['changed' if old_entry is not None else 'added'].append(path)
+            if 'symlink' in entry:
+                _replace_symlink(entry['symlink'], target)
+                continue
+            if target.is_symlink():
+                target.unlink()
+            source = content_paths.get(entry['sha256'])
+            if (source is not None and _is_installed(source, entry) and source.stat().st_size == entry['size'] and
+                    _replace_file(source, target, link=True)):
+                linked += 1
+            else:
+                _replace_file(Path(staging_path) / relative_path, target, link=False)
+                copied += 1
+                copied_size += entry['size']
+            content_paths[entry['sha256']] = target
+
+    for path in sorted(set(previous) - set(manifest)):
+        delta['removed'].append(path)
+        target = prefix_path / path
+        if target.is_symlink() or target.is_file():
+            target.unlink()
+        # Remove folders which became empty.
+        parent = target.parent
+        while parent != prefix_path and parent.is_dir() and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+
+    os.makedirs(prefix_path, exist_ok=True)
+    _save_json(manifest_filename, {'files': manifest})
+    _save_json(prefix_path / DELTA_FILENAME, delta)
+    delta['copied'] = copied
+    delta['linked'] = linked
+    delta['copied-size'] = copied_size
+    return delta
+
+
+def main():
+    base_path = Path(__file__).parent.absolute().parent
+    parser = argparse.ArgumentParser(
+        description='Install build results incrementally into the production prefix.')
+    parser.add_argument('build_path', help='Build folder to install from.')
+    parser.add_argument('--config', action='append', default=None,
+                        help='Configuration to install, may be repeated. With more than one ' +
+                             'configuration each is installed into a subfolder of the prefix ' +
+                             '(default: Release).')
+    parser.add_argument('--prefix', default=base_path / 'production',
+                        help='Install prefix (default: "production" within the repository).')
+    parser.add_argument('--cmake', default='cmake', help='CMake executable (default: cmake from PATH).')
+    args = parser.parse_args()
+
+    build_path = Path(args.build_path).resolve()
+    configs = args.config or ['Release']
+    cmake = shutil.which(args.cmake)
+    if cmake is None:
+        print(f'Error: Cannot find CMake executable "{args.cmake}".')
+        exit(1)
+
+    hash_cache_filename = build_path / HASH_CACHE_FILENAME
+    hash_cache = _load_json(hash_cache_filename)
+    sources = {}
+    for config in configs:
+        staging_path = build_path / STAGING_FOLDER / config
+        print(f'Staging configuration {config} in "{staging_path}"...')
+        installed = stage(cmake, build_path, config, staging_path)
+        sources[config if len(configs) > 1 else ''] = (staging_path, hash_files(staging_path, installed, hash_cache))
+    # Entries of files which are no longer staged are dropped.
+    staged_paths = {(staging_path / relative_path).as_posix()
+                    for staging_path, files in sources.values() for relative_path in files}
+    _save_json(hash_cache_filename, {path: entry for path, entry in hash_cache.items() if path in staged_paths})
+
+    delta = synchronize(sources, Path(args.prefix))
+    print(f'Installed into "{args.prefix}": {len(delta["added"])} added, {len(delta["changed"])} changed, ' +
+          f'{len(delta["removed"])} removed; {delta["copied"]} files copied ' +
+          f'({delta["copied-size"] / 1024 ** 2:.1f} MiB), {delta["linked"]} hardlinked.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+
+# Analyzes the most recent build recorded in `.ninja_log` of the `build-*-ninja*` folders:
+# critical path, average and peak parallelism, phases with low parallelism and the steps that run
+# during them, and the slowest compile and link steps. The critical path is computed from the build
+# edges within the generated Ninja files, falling back to an estimate from the timing alone if
+# those cannot be read. A summary of each build is appended to a history file within the build
+# folder, so subsequent runs can report changes. A Chrome trace of the build is written as well.
+
+import argparse
+import build_config
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+
+HISTORY_FILENAME = 'ninja-build-history.jsonl'
+TRACE_FILENAME = 'ninja-trace.json'
+# Number of slowest steps stored per build within the history file, used to report deltas.
+HISTORY_STEPS = 100
+
+
+class Step:
+    def __init__(self, start, end, output, command_hash):
+        self.start = start / 1000
+        self.end = end / 1000
+        self.outputs = [output]
+        self.command_hash = command_hash
+        self.category = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @property
+    def name(self):
+        return self.outputs[0]
+
+
+def read_last_build(ninja_log_filename):
+    """Returns the steps of the most recent build recorded in a `.ninja_log` file. Ninja appends
+    each finished step with times relative to the start of its build, so a new build begins
+    wherever the end time drops."""
+    steps = []
+    last_end = -1
+    with open(ninja_log_filename, 'r', encoding='utf-8', errors='replace') as ninja_log:
+        header = ninja_log.readline()
+        if not header.startswith('# ninja log v'):
+            raise ValueError(f'"{ninja_log_filename}" is not a Ninja log file.')
+        for line in ninja_log:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4:
+                continue
+            start, end = int(fields[0]), int(fields[1])
+            command_hash = fields[4] if len(fields) > 4 else fields[3]
+            if end < last_end:
+                steps = []
+            last_end = end
+            # Steps with multiple outputs are logged once per output.
+            if (steps and steps[-1].command_hash == command_hash and
+                    steps[-1].start == start / 1000 and steps[-1].end == end / 1000):
+                steps[-1].outputs.append(fields[3])
+            else:
+                steps.append(Step(start, end, fields[3], command_hash))
+    return steps
+
+
+def _split_ninja_line(text):
+    # Splits a Ninja statement into tokens, honoring `$` escapes. Unescaped `:` and `|` separators
+    # are returned as tokens of their own.
+    tokens = []
+    token = ''
+    i = 0
+    while i < len(text):
+        character = text[i]
+        if character == '$' and i + 1 < len(text):
+            token += text[i + 1]
+            i += 2
+            continue
+        if character in ' \t':
+            if token:
+                tokens.append(token)
+                token = ''
+        elif character == ':' and ':' not in tokens:
+            if token:
+                tokens.append(token)
+                token = ''
+            tokens.append(':')
+        elif character == '|':
+            if token:
+                tokens.append(token)
+                token = ''
+            if text[i + 1:i + 2] in ['|', '@']:
+                tokens.append(text[i:i + 2])
+                i += 1
+            else:
+                tokens.append('|')
+        else:
+            token += character
+        i += 1
+    if token:
+        tokens.append(token)
+    return tokens
+
+
+def read_build_edges(build_path):
+    """Returns a dict mapping each output to its rule and all inputs, including implicit and
+    order-only dependencies, collected from the Ninja files of a (multi-config) build folder."""
+    edges = {}
+    pending = [build_path / 'build.ninja'] + sorted(build_path.glob('build-*.ninja'))
+    visited = set()
+    while pending:
+        ninja_filename = pending.pop()
+        if ninja_filename in visited or not ninja_filename.exists():
+            continue
+        visited.add(ninja_filename)
+        with open(ninja_filename, 'r', encoding='utf-8', errors='replace') as ninja_file:
+            statement = ''
+            for line in ninja_file:
+                line = line.rstrip('\r\n')
+                if line.endswith('$') and not line.endswith('$$'):
+                    statement += line[:-1]
+                    continue
+                statement += line
+                if statement.startswith('build '):
+                    tokens = _split_ninja_line(statement[6:])
+                    if ':' in tokens:
+                        separator = tokens.index(':')
+                        outputs = [token for token in tokens[:separator] if token != '|']
+                        rule = tokens[separator + 1] if separator + 1 < len(tokens) else 'phony'
+                        inputs = []
+                        for token in tokens[separator + 2:]:
+                            if token == '|@':
+                                break
+                            if token not in ['|', '||']:
+                                inputs.append(token)
+                        for output in outputs:
+                            edges[output] = (rule, inputs)
+                elif statement.startswith('include ') or statement.startswith('subninja '):
+                    pending.append(build_path / statement.split(maxsplit=1)[1].strip())
+                statement = ''
+    return edges
+
+
+def categorize(step, edges):
+    name = step.name.replace('\\', '/')
+    if '_autogen/' in name or '/qrc_' in name or name.startswith('qrc_'):
+        return 'autogen'
+    rule = edges[step.name][0] if step.name in edges else ''
+    if '_COMPILER__' in rule:
+        return 'compile'
+    if '_LINKER__' in rule:
+        return 'link'
+    if rule:
+        return 'custom'
+    suffix = Path(name).suffix
+    if suffix in ['.o', '.obj']:
+        return 'compile'
+    if suffix in ['.so', '.a', '.lib', '.dll', '.exe', '.dylib', ''] and '/CMakeFiles/' not in f'/{name}':
+        return 'link'
+    return 'custom'
+
+
+def critical_path(steps, edges):
+    """Returns the chain of steps which determines the build's wall time. Without build edges the
+    chain is estimated by walking back from the last step to the latest step finished before it
+    started."""
+    step_by_output = {output: step for step in steps for output in step.outputs}
+    if edges:
+        # Longest path through the dependency graph, weighted by the duration of all steps run
+        # within this build. Computed iteratively, as the graph may be deep.
+        length = {}
+        predecessor = {}
+        for root in step_by_output:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if node in length:
+                    continue
+                inputs = edges[node][1] if node in edges else []
+                if not expanded:
+                    stack.append((node, True))
+                    stack.extend((input, False) for input in inputs if input not in length)
+                    continue
+                best_input, best_length = None, 0.0
+                for input in inputs:
+                    if length.get(input, 0.0) > best_length:
+                        best_input, best_length = input, length[input]
+                step = step_by_output.get(node)
+                length[node] = best_length + (step.duration if step is not None else 0.0)
+                predecessor[node] = best_input
+        node = max(step_by_output, key=lambda output: length.get(output, 0.0), default=None)
+        path = []
+        while node is not None:
+            step = step_by_output.get(node)
+            if step is not None and (not path or path[-1] is not step):
+                path.append(step)
+            node = predecessor.get(node)
+        return list(reversed(path)), False
+
+    path = []
+    candidates = sorted(steps, key=lambda step: step.end)
+    step = candidates[-1] if candidates else None
+    while step is not None:
+        path.append(step)
+        previous = [candidate for candidate in candidates if candidate.end <= step.start]
+        step = previous[-1] if previous else None
+    return list(reversed(path)), True
+
+
+def parallelism(steps, low_threshold):
+    """Returns average and peak parallelism, the time spent with at most `low_threshold` steps
+    running, and per step the time it ran within such low-parallelism phases."""
+    events = sorted([(step.start, 1, index) for index, step in enumerate(steps)] +
+                    [(step.end, -1, index) for index, step in enumerate(steps)])
+    running = set()
+    peak = 0
+    low_time = 0.0
+    exposure = [0.0] * len(steps)
+    last_time = events[0][0] if events else 0.0
+    for time, change, index in events:
+        if time > last_time and running and len(running) <= low_threshold:
+            low_time += time - last_time
+            for running_index in running:
+                exposure[running_index] += time - last_time
+        last_time = time
+        if change > 0:
+            running.add(index)
+            peak = max(peak, len(running))
+        else:
+            running.discard(index)
+    wall_time = max(step.end for step in steps) - min(step.start for step in steps) if steps else 0.0
+    busy_time = sum(step.duration for step in steps)
+    average = busy_time / wall_time if wall_time > 0 else 0.0
+    return average, peak, low_time, exposure
+
+
+def chrome_trace(steps, critical_steps, process_name):
+    # Steps are packed into lanes, so the trace resembles the build's actual job slots.
+    lanes = []
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 0, 'args': {'name': process_name}}]
+    critical = set(id(step) for step in critical_steps)
+    for step in sorted(steps, key=lambda step: step.start):
+        for lane, lane_end in enumerate(lanes):
+            if lane_end <= step.start:
+                break
+        else:
+            lane = len(lanes)
+            lanes.append(0.0)
+        lanes[lane] = step.end
+        events.append({
+            'name': step.name,
+            'cat': step.category + (',critical' if id(step) in critical else ''),
+            'ph': 'X',
+            'ts': step.start * 1e6,
+            'dur': step.duration * 1e6,
+            'pid': 0,
+            'tid': lane,
+            'args': {'outputs': step.outputs, 'critical': id(step) in critical}
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def read_previous_summary(history_filename, fingerprint):
+    previous = None
+    try:
+        with open(history_filename, 'r') as history_file:
+            for line in history_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('fingerprint') != fingerprint:
+                    previous = entry
+    except OSError:
+        pass
+    return previous
+
+
+def format_seconds(seconds):
+    if seconds >= 60:
+        return f'{int(seconds // 60)}m{seconds % 60:04.1f}s'
+    return f'{seconds:.1f}s'
+
+
+def analyze(build_path, top, low_threshold, write_history, write_trace):
+    ninja_log_filename = build_path / '.ninja_log'
+    steps = read_last_build(ninja_log_filename)
+    print(f'* {build_path.name}:')
+    if not steps:
+        print('  No build steps recorded.')
+        return
+    try:
+        edges = read_build_edges(build_path)
+    except OSError:
+        edges = {}
+    for step in steps:
+        step.category = categorize(step, edges)
+    critical_steps, estimated = critical_path(steps, edges)
+    average, peak, low_time, exposure = parallelism(steps, low_threshold)
+    wall_time = max(step.end for step in steps) - min(step.start for step in steps)
+    busy_time = sum(step.duration for step in steps)
+    critical_time = sum(step.duration for step in critical_steps)
+
+    print(f'  {len(steps)} steps, wall time {format_seconds(wall_time)}, ' +
+          f'CPU time {format_seconds(busy_time)}')
+    print(f'  Parallelism: average {average:.1f}, peak {peak}, ' +
+          f'{format_seconds(low_time)} ({low_time / wall_time * 100 if wall_time else 0:.0f}%) ' +
+          f'with at most {low_threshold} steps running')
+    print(f'  Critical path{" (estimated)" if estimated else ""}: {len(critical_steps)} steps, ' +
+          f'{format_seconds(critical_time)}')
+    for step in sorted(critical_steps, key=lambda step: step.duration, reverse=True)[:top]:
+        print(f'    {format_seconds(step.duration):>9}  {step.category:<8} {step.name}')
+    serializing = sorted(((exposure[index], step) for index, step in enumerate(steps) if exposure[index] > 0),
+                         key=lambda entry: entry[0], reverse=True)
+    if serializing:
+        print('  Steps running during low parallelism phases:')
+        for seconds, step in serializing[:top]:
+            print(f'    {format_seconds(seconds):>9}  {step.category:<8} {step.name}')
+    for category, title in [('compile', 'Slowest translation units'), ('link', 'Slowest links'),
+                            ('autogen', 'Slowest Qt code generation steps')]:
+        category_steps = sorted((step for step in steps if step.category == category),
+                                key=lambda step: step.duration, reverse=True)
+        if category_steps:
+            print(f'  {title}:')
+            for step in category_steps[:top]:
+                print(f'    {format_seconds(step.duration):>9}  {step.name}')
+
+    fingerprint = hashlib.sha256(
+        json.dumps([[step.start, step.end, step.command_hash] for step in steps]).encode()).hexdigest()
+    summary = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'fingerprint': fingerprint,
+        'steps': len(steps),
+        'wall-seconds': wall_time,
+        'cpu-seconds': busy_time,
+        'average-parallelism': average,
+        'peak-parallelism': peak,
+        'low-parallelism-seconds': low_time,
+        'critical-path-seconds': critical_time,
+        'critical-path': [step.name for step in critical_steps],
+        'slowest-steps': {step.name: step.duration for step in
+                          sorted(steps, key=lambda step: step.duration, reverse=True)[:HISTORY_STEPS]}
+    }
+    history_filename = build_path / HISTORY_FILENAME
+    previous = read_previous_summary(history_filename, fingerprint)
+    if previous is not None:
+        print(f'  Compared to the build analyzed {previous["timestamp"]}:')
+        for key, title in [('wall-seconds', 'wall time'), ('cpu-seconds', 'CPU time'),
+                           ('critical-path-seconds', 'critical path')]:
+            print(f'    {title}: {format_seconds(previous[key])} -> {format_seconds(summary[key])} ' +
+                  f'({summary[key] - previous[key]:+.1f}s)')
+        print(f'    average parallelism: {previous["average-parallelism"]:.1f} -> {average:.1f}')
+        changes = sorted(((duration - previous['slowest-steps'][name], name, duration)
+                          for name, duration in summary['slowest-steps'].items()
+                          if name in previous['slowest-steps']),
+                         key=lambda change: abs(change[0]), reverse=True)
+        changes = [change for change in changes if abs(change[0]) >= 0.5]
+        if changes:
+            print('    Largest changes of individual steps:')
+            for change, name, duration in changes[:top]:
+                print(f'      {change:+8.1f}s  {format_seconds(duration):>9}  {name}')
+    if write_history:
+        last_entry = None
+        try:
+            with open(history_filename, 'r') as history_file:
+                for line in history_file:
+                    last_entry = line
+        except OSError:
+            pass
+        # Don't record the very same build twice when analyzing it repeatedly.
+        if last_entry is None or json.loads(last_entry).get('fingerprint') != fingerprint:
+            with open(history_filename, 'a') as history_file:
+                history_file.write(json.dumps(summary) + '\n')
+    if write_trace:
+        trace_filename = build_path / TRACE_FILENAME
+        with open(trace_filename, 'w') as trace_file:
+            json.dump(chrome_trace(steps, critical_steps, build_path.name), trace_file)
+        print(f'  Trace written to "{trace_filename.as_posix()}".')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Report critical path, parallelism and slowest steps of the last Ninja build.')
+    parser.add_argument('build_paths', nargs='*',
+                        help='Build folders to analyze (default: all build-*-ninja* folders).')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of steps to list per category.')
+    parser.add_argument('--low-parallelism', type=int, default=None,
+                        help='Job count considered low parallelism (default: a quarter of the CPU cores).')
+    parser.add_argument('--no-history', action='store_const', const=True, default=False,
+                        help=f'Do not append the results to {HISTORY_FILENAME}.')
+    parser.add_argument('--no-trace', action='store_const', const=True, default=False,
+                        help=f'Do not write {TRACE_FILENAME}.')
+    args = parser.parse_args()
+
+    build_paths = [Path(build_path) for build_path in args.build_paths]
+    if not build_paths:
+        build_paths = sorted(build_path for build_path in build_config.base_path.glob('build-*-ninja*')
+                             if (build_path / '.ninja_log').exists())
+    if not build_paths:
+        print('Error: No build folders containing a .ninja_log found.')
+        exit(1)
+    low_threshold = args.low_parallelism
+    if low_threshold is None:
+        low_threshold = max(1, (os.cpu_count() or 4) // 4)
+    for build_path in build_paths:
+        try:
+            analyze(build_path, args.top, low_threshold, not args.no_history, not args.no_trace)
+        except (OSError, ValueError) as error:
+            print(f'Error: Cannot analyze "{build_path}": {error}')
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,62 @@
 #!/usr/bin/env python
 
 import argparse
-import collections.abc
+import build_config
 import json
-import os
-from pathlib import Path
-
-scripts_path = Path(__file__).parent.absolute()
-base_path = scripts_path.parent
-
-def update_config(old_config, new_config):
-    for key, new_value in new_config.items():
-        if isinstance(new_value, collections.abc.Mapping):
-            old_config[key] = update_config(old_config.get(key, {}), new_value)
-        else:
-            if isinstance(new_value, str):
-                if str(key).endswith('-path'):
-                    new_value = os.path.expanduser(new_value).replace('\\', '/')
-                new_value = new_value.replace('${base-path}', base_path.absolute().as_posix())
-            old_config[key] = new_value
-    return old_config
-
-def load_config(config, config_filename):
-    if not config_filename is Path:
-        config_filename = scripts_path / config_filename
-    with open(config_filename, "r") as config_file:
-        return update_config(config, json.load(config_file))
+import re
+import sys
+
+FORMATS = ['pipe', 'shell-eval', 'json', 'nul']
+
+
+def query_config(config, query):
+    config_node = config
+    for field in query.split('.'):
+        if not isinstance(config_node, dict) or not field in config_node:
+            return None, False
+        config_node = config_node[field]
+    # Use the same path expansion rules as cmake.py.
+    if isinstance(config_node, str) and build_config.is_path_key(query.split('.')[-1]):
+        config_node = build_config.expand_path(config_node, config).as_posix()
+    return config_node, True
+
+
+def to_text(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def shell_variable_name(query):
+    return re.sub(r'[^A-Z0-9_]', '_', query.upper())
+
+
+def shell_quote(text):
+    return "'" + text.replace("'", "'\\''") + "'"
+
 
 parser = argparse.ArgumentParser(
     description='Query config settings.')
-parser.add_argument('-q', '--query', required=True, action='append')
+parser.add_argument('-q', '--query', required=True, action='append',
+                    help='Setting to query, nested settings are separated by dots (e.g. "expected-versions.cmake").')
+parser.add_argument('-f', '--format', choices=FORMATS, default='pipe',
+                    help='pipe: values separated by "|"; shell-eval: `NAME=value` assignments for `eval`; ' +
+                         'json: object mapping queries to values; nul: NUL terminated values.')
+parser.add_argument('--no-cache', action='store_const', const=True, default=False,
+                    help='Ignore the cached merged config.')
 parser.add_argument('configs_json', nargs='+')
 args = parser.parse_args()
-config = {}
-for config_json in args.configs_json:
-    config = load_config(config, config_json)
+config, _, _, _ = build_config.load_configs(args.configs_json, use_cache=not args.no_cache)
 
-first = True
-for query in args.query:
-    config_node = config
-    found = True
-    for field in query.split('.'):
-        if not field in config_node:
-            found = False
-            break
-        config_node = config_node[field]
-    if first:
-        first = False
-    else:
-        print('|', end='')
-    if found:
-        print(config_node, end='')
-    else:
-        print(f'[{query}-unknown]', end='')
-if not first:
-    print('')
+results = [(query, *query_config(config, query)) for query in args.query]
+match args.format:
+    case 'pipe':
+        print('|'.join(str(value) if found else f'[{query}-unknown]' for query, value, found in results))
+    case 'shell-eval':
+        for query, value, found in results:
+            if found:
+                print(f'{shell_variable_name(query)}={shell_quote(to_text(value))}')
+            else:
+                print(f'Warning: Unknown config setting "{query}".', file=sys.stderr)
+    case 'json':
+        print(json.dumps({query: value for query, value, found in results}, indent=2))
+    case 'nul':
+        sys.stdout.write(''.join(f'{to_text(value) if found else ""}\0' for query, value, found in results))
@@ -0,0 +1,194 @@
+# Places vcpkg buildtrees of selected ports on a RAM backed file system (config setting
+# "vcpkg-buildtrees-ram"), such as tmpfs on Linux or a RAM disk on Windows.
+#
+# vcpkg only accepts a single `--x-buildtrees-root`, which stays on disk (and short on Windows).
+# Before the manifest install, each port whose buildtree is expected to fit into the RAM budget
+# gets its `<buildtrees-root>/<port>` folder replaced by a link into the RAM folder. A previous
+# on-disk tree of that port is moved aside and restored if vcpkg doesn't rebuild the port.
+#
+# The expected size of a buildtree is the largest size recorded for the port in the vcpkg port
+# history (see vcpkg_log_analyzer.py) plus a safety margin. Ports without recorded size are built
+# on disk. vcpkg builds one port at a time, so each tree is released as soon as vcpkg finished its
+# port: it is measured for the history and then either deleted or moved to disk. Trees of failed
+# builds are always moved to disk, as they are needed to investigate the failure.
+#
+# The buildtrees root is shared by all build folders. Each configure run places its trees into its
+# own subfolder of the RAM folder and holds a lock on that subfolder until all of its trees were
+# released, so links of a running install are never mistaken for those of an interrupted one. The
+# lock on the buildtrees root itself is only held while links are created or removed, so parallel
+# configure runs (e.g. in matrix mode) don't wait for each other's manifest installs. A port linked
+# by another run stays as it is.
+#
+# vcpkg keeps finished buildtrees, so the estimates of all linked ports are accumulated against the
+# budget rather than compared one by one.
+
+import os
+from pathlib import Path
+import shutil
+
+import vcpkg_cache
+import vcpkg_log_analyzer
+
+SIZE_MARGIN = 1.25
+ASIDE_SUFFIX = '.ram-aside'
+LOCK_FILENAME = '.ram-buildtrees.lock'
+OWNER_LOCK_SUFFIX = '.lock'
+
+
+def estimate_sizes(history_records):
+    """Returns the expected buildtree size in bytes for each port with recorded sizes."""
+    sizes = {}
+    for record in history_records:
+        size = record.get('buildtree-size')
+        if size:
+            sizes[record['port']] = max(sizes.get(record['port'], 0), size)
+    return {port: int(size * SIZE_MARGIN) for port, size in sizes.items()}
+
+
+class RamBuildtrees:
+    def __init__(self, disk_root, ram_root, budget, keep_built_trees):
+        self.disk_root = Path(disk_root)
+        self.ram_root = Path(ram_root)
+        self.budget = budget
+        self.keep_built_trees = keep_built_trees
+        # Ports currently linked into the RAM folder, and measured sizes of released trees.
+        self.ports = set()
+        self.sizes = {}
+        self.failed_ports = set()
+        self.lock = vcpkg_cache.FileLock(self.disk_root / LOCK_FILENAME)
+        self.owner_path = self.ram_root / f'run-{os.getpid()}'
+        self.owner_lock = vcpkg_cache.FileLock(self.owner_path.with_name(self.owner_path.name + OWNER_LOCK_SUFFIX))
+        self.owner_locked = False
+
+    def prepare(self, estimates):
+        """Links the largest ports which fit into the budget together into the RAM folder. Returns
+        the number of linked ports and the number of ports left on disk."""
+        os.makedirs(self.disk_root, exist_ok=True)
+        os.makedirs(self.ram_root, exist_ok=True)
+        with self.lock:
+            self._recover()
+            self.owner_locked = self.owner_lock.acquire()
+            os.makedirs(self.owner_path, exist_ok=True)
+            # Other users of the RAM file system count against the budget as well.
+            budget = min(self.budget, shutil.disk_usage(self.ram_root).free)
+            on_disk = 0
+            for port, size in sorted(estimates.items(), key=lambda item: (-item[1], item[0])):
+                link_path = self.disk_root / port
+                if size > budget or vcpkg_cache.is_directory_link(link_path):
+                    on_disk += 1
+                    continue
+                if link_path.exists():
+                    os.replace(link_path, self.disk_root / f'{port}{ASIDE_SUFFIX}')
+                os.makedirs(self.owner_path / port, exist_ok=True)
+                vcpkg_cache.create_directory_link(self.owner_path / port, link_path)
+                self.ports.add(port)
+                budget -= size
+        return len(self.ports), on_disk
+
+    def process_line(self, line):
+        # Called with each line of the manifest install output to release finished ports early.
+        if (search_result := vcpkg_log_analyzer.FAILED_PATTERN.match(line)) is not None:
+            self.failed_ports.add(search_result.group(1))
+        elif (search_result := vcpkg_log_analyzer.ELAPSED_PATTERN.match(line)) is not None:
+            if search_result.group(1) in self.ports:
+                self._try_release(search_result.group(1))
+
+    def finish(self):
+        try:
+            for port in sorted(self.ports):
+                self._try_release(port)
+        finally:
+            if self.owner_locked:
+                self.owner_locked = False
+                _remove_owner(self.owner_path, self.owner_lock)
+
+    def _try_release(self, port):
+        try:
+            self.release(port)
+        except OSError as error:
+            print(f'Warning: Cannot release RAM buildtree of "{port}": {error}')
+
+    def release(self, port):
+        self.ports.discard(port)
+        tree_path = self.owner_path / port
+        built = tree_path.is_dir() and any(tree_path.iterdir())
+        if built:
+            self.sizes[port] = vcpkg_cache.directory_size(tree_path)
+        keep = built and (self.keep_built_trees or port in self.failed_ports)
+        with self.lock:
+            self._unlink(port, tree_path, built, keep)
+        if built and not keep:
+            shutil.rmtree(tree_path)
+
+    def _unlink(self, port, tree_path, built, keep):
+        # Replaces the link of a port by the tree moved to disk, by the tree moved aside before, or
+        # by nothing. Requires the lock on the buildtrees root.
+        link_path = self.disk_root / port
+        aside_path = self.disk_root / f'{port}{ASIDE_SUFFIX}'
+        vcpkg_cache.remove_directory_link(link_path)
+        if not built:
+            # The port was restored from the binary cache or not needed at all.
+            if tree_path.is_dir():
+                tree_path.rmdir()
+            if aside_path.exists():
+                os.replace(aside_path, link_path)
+            return
+        if aside_path.exists():
+            shutil.rmtree(aside_path)
+        if keep:
+            shutil.move(tree_path, link_path)
+
+    def _recover(self):
+        # Releases links left behind by interrupted runs, whose subfolder lock is free. Their trees
+        # are kept like those of failed builds, unless the RAM file system was cleared in between.
+        # Requires the lock on the buildtrees root.
+        ram_root = Path(os.path.realpath(self.ram_root))
+        owners = {}
+        for link_path in list(self.disk_root.iterdir()):
+            if not vcpkg_cache.is_directory_link(link_path):
+                continue
+            tree_path = Path(os.path.realpath(link_path))
+            if tree_path.parent.parent != ram_root:
+                continue
+            owner_path = tree_path.parent
+            if owner_path not in owners:
+                owner_lock = vcpkg_cache.FileLock(owner_path.with_name(owner_path.name + OWNER_LOCK_SUFFIX))
+                owners[owner_path] = owner_lock if owner_lock.acquire(blocking=False) else None
+            if owners[owner_path] is not None:
+                built = tree_path.is_dir() and any(tree_path.iterdir())
+                self._unlink(link_path.name, tree_path, built, built)
+        for owner_path, owner_lock in owners.items():
+            if owner_lock is not None:
+                _remove_owner(owner_path, owner_lock)
+        for aside_path in list(self.disk_root.glob(f'*{ASIDE_SUFFIX}')):
+            link_path = self.disk_root / aside_path.name[:-len(ASIDE_SUFFIX)]
+            if not link_path.exists():
+                os.replace(aside_path, link_path)
+
+
+def _remove_owner(owner_path, owner_lock):
+    # Removes the subfolder of a run and its lock, which must be held.
+    shutil.rmtree(owner_path, ignore_errors=True)
+    owner_lock.release()
+    owner_lock.lock_filename.unlink(missing_ok=True)
+
+
+def record_sizes(records, sizes, disk_root):
+    """Adds the buildtree size of each built port to its history record. Sizes of ports built on
+    disk are taken from the buildtrees index, which is shared with the buildtrees eviction (see
+    vcpkg_cache.py), so only trees changed since they were last measured are walked."""
+    index = None
+    for record in records:
+        if record['cache'] != 'built':
+            continue
+        size = sizes.get(record['port'])
+        if size is None:
+            tree_path = Path(disk_root) / record['port']
+            if not tree_path.is_dir() or vcpkg_cache.is_directory_link(tree_path):
+                continue
+            if index is None:
+                index = vcpkg_cache.CacheIndex(disk_root, 'buildtrees')
+            size = index.measure(record['port'])
+        record['buildtree-size'] = size
+    if index is not None:
+        index.save()
@@ -0,0 +1,86 @@
+# Runs binary_cache_server.py and round-trips archives and manifests through the shared tier.
+# Run with `python -m unittest discover -s scripts/tests` from the virtual Python environment.
+
+import os
+from pathlib import Path
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+scripts_path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(scripts_path))
+
+import binary_cache_tiers  # noqa: E402
+
+ABIS = ['a1' * 32, 'b2' * 32, 'c3' * 32]
+
+
+class BinaryCacheTiersTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = Path(tempfile.mkdtemp())
+        self.server_root = self.temp_path / 'shared'
+        with socket.socket() as probe_socket:
+            probe_socket.bind(('127.0.0.1', 0))
+            port = probe_socket.getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/cache'
+        self.server = subprocess.Popen([sys.executable, scripts_path / 'binary_cache_server.py', self.server_root,
+                                        '--port', str(port), '--quiet'],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > deadline or self.server.poll() is not None:
+                    raise
+                time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def _write_archive(self, local_path, abi):
+        filename = binary_cache_tiers.local_archive(local_path, abi)
+        os.makedirs(filename.parent, exist_ok=True)
+        filename.write_bytes(abi.encode() * 1000)
+        return filename
+
+    def test_round_trip(self):
+        writer_path = self.temp_path / 'writer'
+        for abi in ABIS[:2]:
+            self._write_archive(writer_path, abi)
+
+        # Only archives present locally are uploaded, and only once.
+        uploaded, uploaded_size = binary_cache_tiers.write_back(self.url, writer_path, ABIS)
+        self.assertEqual(uploaded, 2)
+        self.assertEqual(uploaded_size, 2 * 64000)
+        self.assertEqual(binary_cache_tiers.write_back(self.url, writer_path, ABIS), (0, 0))
+        for abi in ABIS[:2]:
+            self.assertEqual((self.server_root / 'cache' / f'{abi}.zip').read_bytes(), abi.encode() * 1000)
+
+        self.assertEqual(binary_cache_tiers.fetch_manifest(self.url, 'key'), [])
+        binary_cache_tiers.publish_manifest(self.url, 'key', ABIS)
+        self.assertEqual(binary_cache_tiers.fetch_manifest(self.url, 'key'), sorted(ABIS))
+
+        # Another agent prefetches everything the manifest lists.
+        reader_path = self.temp_path / 'reader'
+        downloaded, downloaded_size, unavailable = binary_cache_tiers.prefetch(
+            self.url, reader_path, binary_cache_tiers.fetch_manifest(self.url, 'key'))
+        self.assertEqual((downloaded, downloaded_size, unavailable), (2, 2 * 64000, 1))
+        for abi in ABIS[:2]:
+            self.assertEqual(binary_cache_tiers.local_archive(reader_path, abi).read_bytes(), abi.encode() * 1000)
+        self.assertFalse(binary_cache_tiers.local_archive(reader_path, ABIS[2]).exists())
+        self.assertEqual(list(reader_path.rglob('*.partial')), [])
+
+        # Archives already present locally are not downloaded again.
+        self.assertEqual(binary_cache_tiers.prefetch(self.url, reader_path, ABIS[:2]), (0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
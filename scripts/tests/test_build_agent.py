@@ -0,0 +1,144 @@
+# Runs the build agent in HTTP mode and talks to it like local clients do. Jobs run a stub script
+# instead of cmake.py, which reports whether the agent handed its cache file over in memory.
+# Run with `python -m unittest discover -s scripts/tests` from the virtual Python environment.
+
+import http.client
+import json
+import os
+from pathlib import Path
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+scripts_path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(scripts_path))
+
+import build_agent  # noqa: E402
+
+CONFIGS = ['config-base.json', 'config-target-x86_64-linux-gcc.json']
+# Stands in for cmake.py: merges the configs like it does, counts its runs in a cache file and
+# holds the build folder for a while.
+STUB_SCRIPT = """
+import build_config
+import sys
+import time
+
+counter_filename = build_config.cache_path / 'stub-counter.json'
+warm = counter_filename.as_posix() in build_config.memory_cache
+build_config.load_configs([argument for argument in sys.argv[1:] if argument.endswith('.json')])
+try:
+    runs = build_config.read_cache_file(counter_filename)['runs']
+except OSError:
+    runs = 0
+build_config.write_cache_file(counter_filename, {'runs': runs + 1})
+print(f'stub run {runs + 1}, warm {warm}, options {" ".join(sys.argv[len(sys.argv) - 2:])}')
+time.sleep(2)
+"""
+
+
+class BuildAgentTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = Path(tempfile.mkdtemp())
+        self.token_filename = self.temp_path / 'token'
+        self.cache_path = self.temp_path / 'cache'
+        with socket.socket() as probe_socket:
+            probe_socket.bind(('127.0.0.1', 0))
+            self.port = probe_socket.getsockname()[1]
+        stub_filename = self.temp_path / 'stub.py'
+        stub_filename.write_text(STUB_SCRIPT)
+        self.environment = dict(os.environ)
+        self.agent = subprocess.Popen([sys.executable, scripts_path / 'build_agent.py', '--port', str(self.port),
+                                       '--token', self.token_filename, 'serve', '--jobs', '1',
+                                       '--script', stub_filename],
+                                      env=dict(os.environ, CMAKE_PY_CACHE_PATH=str(self.cache_path)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while not self.token_filename.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.token = self.token_filename.read_text()
+
+    def tearDown(self):
+        try:
+            self.request('POST', '/shutdown', {})
+            self.agent.wait(60)
+        except (OSError, http.client.HTTPException, subprocess.TimeoutExpired):
+            self.agent.kill()
+            self.agent.wait()
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def request(self, method, path, data=None, headers=None, host=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        request_headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        request_headers.update(headers or {})
+        connection.putrequest(method, path, skip_host=True)
+        connection.putheader('Host', host or f'127.0.0.1:{self.port}')
+        body = json.dumps(data).encode() if data is not None else b''
+        for key, value in request_headers.items():
+            connection.putheader(key, value)
+        connection.putheader('Content-Length', str(len(body)))
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def submit(self, environment):
+        status, body = self.request('POST', '/jobs', {'configs': CONFIGS, 'options': [],
+                                                      'environment': environment})
+        self.assertEqual(status, 200, body)
+        return json.loads(body)
+
+    def test_token_is_private(self):
+        self.assertEqual(self.token_filename.stat().st_mode & 0o777, 0o600)
+
+    def test_rejects_unauthenticated_requests(self):
+        self.assertEqual(self.request('GET', '/jobs', headers={'Authorization': 'Bearer wrong'})[0], 401)
+        self.assertEqual(self.request('POST', '/shutdown', {}, headers={'Authorization': ''})[0], 401)
+
+    def test_rejects_foreign_hosts_and_content_types(self):
+        self.assertEqual(self.request('GET', '/jobs', host='example.com')[0], 403)
+        self.assertEqual(self.request('POST', '/shutdown', {}, headers={'Content-Type': 'text/plain'})[0], 415)
+
+    def test_rejects_configs_outside_scripts(self):
+        status, _ = self.request('POST', '/jobs', {'configs': ['../CMakeLists.txt'], 'environment': {}})
+        self.assertEqual(status, 400)
+        status, _ = self.request('POST', '/jobs', {'configs': [str(scripts_path / 'tests' / 'config-x.json')]})
+        self.assertEqual(status, 400)
+
+    def test_deduplicates_jobs_of_different_shells(self):
+        first = self.submit(build_agent.job_environment(self.environment))
+        self.assertFalse(first['deduplicated'])
+        # The first job keeps the build folder busy, so the second one stays queued.
+        second = self.submit(dict(self.environment, PWD='/a', SHLVL='1'))
+        third = self.submit(dict(self.environment, PWD='/b', SHLVL='2', LD_PRELOAD='/tmp/evil.so'))
+        self.assertFalse(second['deduplicated'])
+        self.assertTrue(third['deduplicated'])
+        self.assertEqual(third['id'], second['id'])
+        status, body = self.request('GET', f'/jobs/{second["id"]}')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['submissions'], 2)
+
+    def run_job(self):
+        job = self.submit(build_agent.job_environment(self.environment))
+        status, output = self.request('GET', f'/jobs/{job["id"]}/output')
+        self.assertEqual(status, 200)
+        status, body = self.request('GET', f'/jobs/{job["id"]}')
+        self.assertEqual(json.loads(body)['state'], 'succeeded', output)
+        return output.decode()
+
+    def test_streams_output_of_finished_job(self):
+        self.assertIn('stub run 1, warm False, options --resource-share 1', self.run_job())
+
+    def test_keeps_cache_files_in_memory(self):
+        self.run_job()
+        self.assertIn('stub run 2, warm True', self.run_job())
+        # Files changed behind the agent's back are read again.
+        (self.cache_path / 'stub-counter.json').write_text('{"runs": 10, "changed": true}')
+        self.assertIn('stub run 11,', self.run_job())
+        self.assertEqual(list(self.cache_path.glob('build-agent-*-job-*.json')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Runs compile commands through compiler_cache.py with a stub compiler, and evicts a cache filled
+# with entries of known sizes.
+# Run with `python -m unittest discover -s scripts/tests` from the virtual Python environment.
+
+import io
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+scripts_path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(scripts_path))
+
+import compiler_cache  # noqa: E402
+
+# Stands in for GCC: `-E` prints the source with its `#include "..."` lines replaced by the included
+# files, `-c` writes the preprocessed source to the object file (and a depfile for `-MD`) and
+# counts the compilations.
+STUB_COMPILER = f"""#!{sys.executable}
+import pathlib
+import sys
+
+arguments = sys.argv[1:]
+if arguments == ['--version']:
+    print('stub 1.0')
+    sys.exit(0)
+source = pathlib.Path(next(argument for argument in arguments if argument.endswith('.cpp')))
+lines = []
+for line in source.read_text().splitlines():
+    if line.startswith('#include "'):
+        line = (source.parent / line.split('"')[1]).read_text()
+    lines.append(line)
+if '-E' in arguments:
+    print('\\n'.join(lines))
+    sys.exit(0)
+counter = pathlib.Path(__file__).with_suffix('.count')
+counter.write_text(str(int(counter.read_text()) + 1 if counter.exists() else 1))
+output = pathlib.Path(arguments[arguments.index('-o') + 1])
+output.write_text('object of ' + '|'.join(lines))
+if '-MD' in arguments:
+    output.with_suffix('.d').write_text(f'{{output}}: {{source}}')
+"""
+
+
+class CompilerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = Path(tempfile.mkdtemp())
+        self.cache_path = self.temp_path / 'cache'
+        self.compiler = self.temp_path / 'stub-compiler'
+        self.compiler.write_text(STUB_COMPILER)
+        self.compiler.chmod(0o755)
+        self.source = self.temp_path / 'source.cpp'
+        self.header = self.temp_path / 'header.h'
+        self.source.write_text('#include "header.h"\nint main() {}\n')
+        self.header.write_text('int answer = 42;')
+        self.output = self.temp_path / 'source.o'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def compile(self, arguments):
+        with mock.patch('sys.stderr', io.StringIO()):
+            self.assertEqual(compiler_cache.compile_with_cache(self.cache_path, None,
+                                                               [str(self.compiler), *arguments]), 0)
+        return self.output.read_text()
+
+    def compilations(self):
+        return int(self.compiler.with_suffix('.count').read_text())
+
+    def test_hit_and_miss(self):
+        arguments = ['-O2', '-c', str(self.source), '-o', str(self.output)]
+        self.assertEqual(self.compile(arguments), 'object of int answer = 42;|int main() {}')
+        self.output.unlink()
+        self.assertEqual(self.compile(arguments), 'object of int answer = 42;|int main() {}')
+        self.assertEqual(self.compilations(), 1)
+
+        # Changing an included file changes the preprocessed source, even though the source file
+        # itself is unchanged.
+        self.header.write_text('int answer = 43;')
+        self.assertEqual(self.compile(arguments), 'object of int answer = 43;|int main() {}')
+        self.assertEqual(self.compilations(), 2)
+        stats = compiler_cache.read_stats(self.cache_path)
+        self.assertEqual((stats['hit'], stats['miss']), (1, 2))
+
+        # Different compiler arguments don't share entries.
+        self.compile(['-O0', '-c', str(self.source), '-o', str(self.output)])
+        self.assertEqual(self.compilations(), 3)
+
+    def test_key_is_independent_of_argument_order(self):
+        self.compile(['-c', str(self.source), '-o', str(self.output), '-O2', '-MD'])
+        self.compile(['-o', str(self.output), '-MD', str(self.source), '-c', '-O2'])
+        self.compile([str(self.source), '-O2', '-MD', '-o', str(self.output), '-c'])
+        self.assertEqual(self.compilations(), 1)
+        self.assertEqual(compiler_cache.analyze_arguments(['cc', '-c', 'a.cpp', '-o', 'a.o'])[3],
+                         compiler_cache.analyze_arguments(['cc', '-o', 'a.o', '-c', 'a.cpp'])[3])
+        # The output name is part of the depfile, and the order of other arguments can matter.
+        self.assertNotEqual(compiler_cache.analyze_arguments(['cc', '-c', 'a.cpp', '-o', 'a.o'])[3],
+                            compiler_cache.analyze_arguments(['cc', '-c', 'a.cpp', '-o', 'b.o'])[3])
+        self.assertNotEqual(compiler_cache.analyze_arguments(['cc', '-c', 'a.cpp', '-Ia', '-Ib', '-o', 'a.o'])[3],
+                            compiler_cache.analyze_arguments(['cc', '-c', 'a.cpp', '-Ib', '-Ia', '-o', 'a.o'])[3])
+
+    def test_evicts_least_recently_used_entries_to_target(self):
+        for index in range(10):
+            entry_path = self.cache_path / f'{index:02x}' / 'entry'
+            os.makedirs(entry_path)
+            (entry_path / 'object').write_bytes(b'x' * 100)
+            os.utime(entry_path, (1000000 + index, 1000000 + index))
+        # A hit makes the oldest entry the most recently used one.
+        os.utime(self.cache_path / '00' / 'entry')
+
+        self.assertEqual(compiler_cache.evict(self.cache_path, 800, dry_run=True), (1000, 3, 300))
+        self.assertEqual(len(list(compiler_cache.entries(self.cache_path))), 10)
+        # Evicting two entries would fit the budget, but the eviction continues down to 90% of it.
+        self.assertEqual(compiler_cache.evict(self.cache_path, 800), (1000, 3, 300))
+        self.assertEqual(sorted(entry_path.parent.name for entry_path, _, _ in compiler_cache.entries(self.cache_path)),
+                         ['00', '04', '05', '06', '07', '08', '09'])
+        self.assertEqual(compiler_cache.evict(self.cache_path, 800), (700, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
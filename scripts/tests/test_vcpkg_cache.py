@@ -0,0 +1,119 @@
+# Evicts and deduplicates temporary binary caches and buildtrees with vcpkg_cache.py.
+# Run with `python -m unittest discover -s scripts/tests` from the virtual Python environment.
+
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import unittest
+
+scripts_path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(scripts_path))
+
+import vcpkg_cache  # noqa: E402
+
+ABIS = ['a1' * 32, 'b2' * 32, 'c3' * 32, 'd4' * 32]
+
+
+class VcpkgCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def write_archive(self, root, abi, content, last_used):
+        filename = root / abi[:2] / f'{abi}.zip'
+        os.makedirs(filename.parent, exist_ok=True)
+        filename.write_bytes(content)
+        os.utime(filename, (last_used, last_used))
+        return filename
+
+    def test_evicts_least_recently_used_entries(self):
+        root = self.temp_path / 'binary'
+        for age, abi in enumerate(ABIS):
+            self.write_archive(root, abi, abi.encode() * 10, 1000000 - age * 1000)
+        index = vcpkg_cache.CacheIndex(root, 'binary')
+        index.scan()
+        self.assertEqual(index.total_size(), 4 * 640)
+        # ABIS[3] is the oldest entry, but protected, e.g. because a vcpkg_installed tree uses it.
+        protected_keys = index.keys_for_packages([('zlib', 'x64-linux', ABIS[3])])
+        self.assertEqual(index.evict(3 * 640, protected_keys, dry_run=True), (1, 640))
+        self.assertTrue(all(path.exists() for path in root.glob('*/*.zip')))
+        self.assertEqual(index.evict(2 * 640, protected_keys), (2, 2 * 640))
+        self.assertEqual(sorted(path.stem for path in root.glob('*/*.zip')), [ABIS[0], ABIS[3]])
+
+        # Use is tracked across scans, also for entries whose file wasn't touched.
+        index.mark_used(protected_keys, when=2000000)
+        index.save()
+        index = vcpkg_cache.CacheIndex(root, 'binary')
+        index.scan()
+        self.assertEqual(index.evict(640), (1, 640))
+        self.assertEqual([path.stem for path in root.glob('*/*.zip')], [ABIS[3]])
+
+    def test_hardlinked_files_count_once(self):
+        folder = self.temp_path / 'buildtrees' / 'zlib'
+        os.makedirs(folder / 'src')
+        (folder / 'a.txt').write_bytes(b'x' * 1000)
+        os.link(folder / 'a.txt', folder / 'src' / 'b.txt')
+        (folder / 'c.txt').write_bytes(b'y' * 100)
+        self.assertEqual(vcpkg_cache.directory_size(folder), 1100)
+
+        root = self.temp_path / 'binary'
+        first = self.write_archive(root, ABIS[0], b'z' * 500, 1000000)
+        os.link(first, root / ABIS[0][:2] / f'{ABIS[1]}.zip')
+        self.write_archive(root, ABIS[2], b'z' * 300, 2000000)
+        index = vcpkg_cache.CacheIndex(root, 'binary')
+        index.scan()
+        self.assertEqual(index.total_size(), 800)
+        # Only removing the second link of an archive reclaims its size.
+        self.assertEqual(index.evict(400), (2, 500))
+
+    def test_deduplicates_identical_files_only(self):
+        roots = [self.temp_path / 'binary', self.temp_path / 'assets']
+        for root in roots:
+            os.makedirs(root)
+        (roots[0] / 'a.zip').write_bytes(b'same content')
+        (roots[1] / 'a.tar.gz').write_bytes(b'same content')
+        (roots[0] / 'b.zip').write_bytes(b'diff content')
+        index_filename = self.temp_path / 'dedup-index.json'
+        self.assertEqual(vcpkg_cache.deduplicate(roots, index_filename, dry_run=True), (1, 12))
+        self.assertEqual((roots[1] / 'a.tar.gz').stat().st_nlink, 1)
+        self.assertEqual(vcpkg_cache.deduplicate(roots, index_filename), (1, 12))
+        self.assertTrue((roots[0] / 'a.zip').samefile(roots[1] / 'a.tar.gz'))
+        self.assertEqual((roots[0] / 'b.zip').stat().st_nlink, 1)
+        self.assertEqual(vcpkg_cache.deduplicate(roots, index_filename), (0, 0))
+        self.assertEqual(list(self.temp_path.rglob('*.dedup-tmp')), [])
+
+    @unittest.skipIf(os.name == 'nt', 'The change time is the creation time on Windows.')
+    def test_deduplicate_rehashes_changed_files(self):
+        roots = [self.temp_path / 'binary']
+        os.makedirs(roots[0])
+        (roots[0] / 'a.zip').write_bytes(b'same content')
+        (roots[0] / 'b.zip').write_bytes(b'diff content')
+        index_filename = self.temp_path / 'dedup-index.json'
+        self.assertEqual(vcpkg_cache.deduplicate(roots, index_filename), (0, 0))
+
+        # A file changed without changing its size and modification time is hashed again, so the
+        # file which now has its former content isn't linked to it.
+        stat = (roots[0] / 'b.zip').stat()
+        (roots[0] / 'b.zip').write_bytes(b'same content')
+        os.utime(roots[0] / 'b.zip', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        (roots[0] / 'c.zip').write_bytes(b'diff content')
+        self.assertEqual(vcpkg_cache.deduplicate(roots, index_filename), (1, 12))
+        self.assertTrue((roots[0] / 'b.zip').samefile(roots[0] / 'a.zip'))
+        self.assertEqual((roots[0] / 'c.zip').read_bytes(), b'diff content')
+        self.assertEqual((roots[0] / 'c.zip').stat().st_nlink, 1)
+
+    def test_lock_can_be_tried(self):
+        lock_filename = self.temp_path / 'locks' / 'tree.lock'
+        with vcpkg_cache.FileLock(lock_filename):
+            self.assertFalse(vcpkg_cache.FileLock(lock_filename).acquire(blocking=False))
+        lock = vcpkg_cache.FileLock(lock_filename)
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,636 @@
+#!/usr/bin/env python
+
+# Maintenance of the local vcpkg binary cache and buildtrees folders. Both grow without bounds,
+# so this script keeps an index with the size and last use time of each entry and evicts least
+# recently used entries until a cache fits into its byte budget.
+#
+# Binary cache entries are the `<abi[:2]>/<abi>.zip` archives written by vcpkg's `files` provider.
+# Buildtrees entries are the per-port folders below `--x-buildtrees-root`. Entries referenced by a
+# `vcpkg_installed` tree passed via `--keep-installed` are marked as used and are never evicted.
+#
+# The per-triplet binary caches and the asset cache often hold identical files. The `dedup` command
+# hashes their contents and replaces duplicates with hardlinks or reflinks. Hashes are kept in a
+# persistent index, so rescans only read files which are new or changed.
+#
+# Build folders with identical vcpkg inputs may share one `vcpkg_installed` tree from a store
+# (config setting "vcpkg-installed-store-path"), which is linked into each build folder and locked
+# while vcpkg may modify it.
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import stat
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Reflinks and flock() are not available on Windows.
+    fcntl = None
+
+INDEX_FILENAME = '.vcpkg-cache-index.json'
+DEDUP_INDEX_FILENAME = '.vcpkg-dedup-index.json'
+INPUTS_STAMP_FILENAME = 'vcpkg-installed-inputs.txt'
+# ioctl request code to share all extents of one file with another (Linux only).
+FICLONE = 0x40049409
+
+SIZE_UNITS = {
+    '': 1,
+    'B': 1,
+    'K': 1000, 'KB': 1000, 'KIB': 1024,
+    'M': 1000 ** 2, 'MB': 1000 ** 2, 'MIB': 1024 ** 2,
+    'G': 1000 ** 3, 'GB': 1000 ** 3, 'GIB': 1024 ** 3,
+    'T': 1000 ** 4, 'TB': 1000 ** 4, 'TIB': 1024 ** 4,
+}
+
+
+def parse_size(size):
+    if isinstance(size, int):
+        return size
+    search_result = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', str(size))
+    if search_result is None or search_result.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Malformed size: '{size}'")
+    return int(float(search_result.group(1)) * SIZE_UNITS[search_result.group(2).upper()])
+
+
+def format_size(size):
+    if size < 1024:
+        return f'{size} B'
+    for unit in ['KiB', 'MiB', 'GiB', 'TiB']:
+        size /= 1024
+        if size < 1024 or unit == 'TiB':
+            return f'{size:.1f} {unit}'
+
+
+def installed_packages(vcpkg_installed_path):
+    """Returns (package, triplet, abi) tuples listed in the status file of a vcpkg_installed tree."""
+    packages = []
+    try:
+        with open(Path(vcpkg_installed_path) / 'vcpkg' / 'status', 'r') as status_file:
+            paragraphs = status_file.read().split('\n\n')
+    except OSError:
+        return packages
+    for paragraph in paragraphs:
+        fields = {}
+        for line in paragraph.splitlines():
+            key, _, value = line.partition(':')
+            fields[key.strip()] = value.strip()
+        if 'Package' in fields and 'Abi' in fields and 'Feature' not in fields:
+            packages += [(fields['Package'], fields.get('Architecture', ''), fields['Abi'])]
+    return packages
+
+
+def directory_size(path):
+    # Hardlinked files (see `deduplicate`) only occupy their size once.
+    size = 0
+    inodes = set()
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                stat = os.lstat(os.path.join(root, filename))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in inodes:
+                    continue
+                inodes.add((stat.st_dev, stat.st_ino))
+            size += stat.st_size
+    return size
+
+
+def _directory_signature(path):
+    # Recursive size calculations of buildtrees are expensive, so they are only repeated if the
+    # modification time of the folder itself or any of its direct children changed.
+    signature = [os.stat(path).st_mtime_ns]
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                signature += [entry.stat(follow_symlinks=False).st_mtime_ns]
+            except OSError:
+                pass
+    return sorted(signature)
+
+
+class CacheIndex:
+    def __init__(self, root, kind):
+        if kind not in ['binary', 'buildtrees']:
+            raise ValueError(f'Unknown cache kind "{kind}".')
+        self.root = Path(root)
+        self.kind = kind
+        self.index_filename = self.root / INDEX_FILENAME
+        self.entries = {}
+        try:
+            with open(self.index_filename, 'r') as index_file:
+                index = json.load(index_file)
+            if index.get('kind') == kind:
+                self.entries = index.get('entries', {})
+        except (OSError, ValueError):
+            pass
+
+    def scan(self):
+        entries = {}
+        if self.root.is_dir():
+            if self.kind == 'binary':
+                for key, stat in self._scan_archives():
+                    entry = self.entries.get(key, {})
+                    entries[key] = {
+                        'size': stat.st_size,
+                        'signature': stat.st_mtime_ns,
+                        'last_used': max(entry.get('last_used', 0), stat.st_mtime),
+                        'inode': [stat.st_dev, stat.st_ino],
+                        'links': stat.st_nlink
+                    }
+            else:
+                with os.scandir(self.root) as folders:
+                    for folder in folders:
+                        if folder.is_dir(follow_symlinks=False):
+                            entries[folder.name] = self._folder_entry(folder.name)
+        self.entries = entries
+
+    def _folder_entry(self, name):
+        entry = self.entries.get(name, {})
+        signature = _directory_signature(self.root / name)
+        size = entry.get('size')
+        if size is None or entry.get('signature') != signature:
+            size = directory_size(self.root / name)
+        return {
+            'size': size,
+            'signature': signature,
+            'last_used': max(entry.get('last_used', 0), max(signature) / 1e9)
+        }
+
+    def measure(self, name):
+        """Returns the size of a single buildtree, which is only measured again if it changed, and
+        records it in the index."""
+        self.entries[name] = self._folder_entry(name)
+        return self.entries[name]['size']
+
+    def _scan_archives(self):
+        with os.scandir(self.root) as prefixes:
+            for prefix in prefixes:
+                if not prefix.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(prefix.path) as archives:
+                    for archive in archives:
+                        if archive.name.endswith('.zip') and archive.is_file(follow_symlinks=False):
+                            yield f'{prefix.name}/{archive.name}', archive.stat(follow_symlinks=False)
+
+    def keys_for_packages(self, packages):
+        if self.kind == 'binary':
+            return {f'{abi[:2]}/{abi}.zip' for _, _, abi in packages}
+        return {package for package, _, _ in packages}
+
+    def mark_used(self, keys, when=None):
+        when = time.time() if when is None else when
+        for key in keys:
+            if key in self.entries:
+                self.entries[key]['last_used'] = when
+
+    @staticmethod
+    def _inode(key, entry):
+        # Entries hardlinked to each other (see `deduplicate`) share their inode.
+        inode = entry.get('inode')
+        return tuple(inode) if inode is not None else key
+
+    def total_size(self):
+        sizes = {self._inode(key, entry): entry['size'] for key, entry in self.entries.items()}
+        return sum(sizes.values())
+
+    def evict(self, budget, protected_keys=(), dry_run=False):
+        """Removes least recently used entries until the cache fits into `budget` bytes.
+        Returns the number of evicted entries and the number of bytes reclaimed. The size of
+        hardlinked archives only counts as reclaimed once their last link is removed, including
+        links outside of the cache (e.g. in the asset cache)."""
+        total_size = self.total_size()
+        evicted_count = 0
+        evicted_size = 0
+        # Links of each inode not yet evicted, within the index and elsewhere.
+        remaining_links = collections.Counter()
+        for key, entry in self.entries.items():
+            inode = self._inode(key, entry)
+            if inode not in remaining_links:
+                remaining_links[inode] = entry.get('links', 1)
+        candidates = sorted((entry['last_used'], key) for key, entry in self.entries.items()
+                            if key not in protected_keys)
+        for _, key in candidates:
+            if total_size <= budget:
+                break
+            inode = self._inode(key, self.entries[key])
+            size = self.entries[key]['size'] if remaining_links[inode] <= 1 else 0
+            if not dry_run:
+                path = self.root / key
+                try:
+                    if path.is_dir():
+                        shutil.rmtree(path)
+                    else:
+                        path.unlink()
+                except OSError as error:
+                    print(f'Warning: Cannot evict "{path}": {error}')
+                    continue
+                del self.entries[key]
+            remaining_links[inode] -= 1
+            total_size -= size
+            evicted_count += 1
+            evicted_size += size
+        return evicted_count, evicted_size
+
+    def save(self):
+        if not self.root.is_dir():
+            return
+        temp_filename = self.index_filename.with_suffix('.tmp')
+        with open(temp_filename, 'w') as index_file:
+            json.dump({'kind': self.kind, 'entries': self.entries}, index_file)
+        os.replace(temp_filename, self.index_filename)
+
+
+def maintain_cache(root, kind, budget, vcpkg_installed_paths=(), dry_run=False):
+    index = CacheIndex(root, kind)
+    index.scan()
+    protected_keys = set()
+    for vcpkg_installed_path in vcpkg_installed_paths:
+        protected_keys |= index.keys_for_packages(installed_packages(vcpkg_installed_path))
+    index.mark_used(protected_keys)
+    size_before = index.total_size()
+    evicted_count, evicted_size = (0, 0) if budget is None else index.evict(budget, protected_keys, dry_run)
+    index.save()
+    return size_before, evicted_count, evicted_size
+
+
+def git_folder(worktree_path):
+    """Returns the git folder of a worktree, following the `.git` file of worktrees and submodules,
+    or None if the path is not a git checkout."""
+    git_path = Path(worktree_path) / '.git'
+    try:
+        if git_path.is_file():
+            git_path = (git_path.parent / git_path.read_text().strip().removeprefix('gitdir:').strip()).resolve()
+    except OSError:
+        return None
+    return git_path if git_path.is_dir() else None
+
+
+def git_commit(worktree_path):
+    """Returns the commit checked out in a worktree, or None if it is not a git checkout. Reads the
+    files within `.git` directly instead of spawning git."""
+    git_path = git_folder(worktree_path)
+    if git_path is None:
+        return None
+    try:
+        head = (git_path / 'HEAD').read_text().strip()
+        if not head.startswith('ref:'):
+            return head
+        ref = head.removeprefix('ref:').strip()
+        roots = [git_path]
+        if (git_path / 'commondir').exists():
+            roots += [(git_path / (git_path / 'commondir').read_text().strip()).resolve()]
+        for root in roots:
+            if (root / ref).exists():
+                return (root / ref).read_text().strip()
+            if (root / 'packed-refs').exists():
+                for line in (root / 'packed-refs').read_text().splitlines():
+                    if line.endswith(' ' + ref):
+                        return line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+class FileLock:
+    """Exclusive inter-process lock, e.g. on a tree within the shared vcpkg_installed store, held
+    while vcpkg may modify the tree. The lock is released by the OS if the process dies."""
+
+    def __init__(self, lock_filename):
+        self.lock_filename = Path(lock_filename)
+        self.lock_file = None
+
+    def acquire(self, blocking=True):
+        """Acquires the lock. Returns False instead of waiting if `blocking` is False and another
+        process holds the lock."""
+        os.makedirs(self.lock_filename.parent, exist_ok=True)
+        self.lock_file = open(self.lock_filename, 'a+')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if not blocking:
+                    self.lock_file.close()
+                    return False
+                print(f'Waiting for other configure run to release "{self.lock_filename}"...')
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            waiting = False
+            while True:
+                try:
+                    msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        self.lock_file.close()
+                        return False
+                    if not waiting:
+                        print(f'Waiting for other configure run to release "{self.lock_filename}"...')
+                        waiting = True
+                    time.sleep(1)
+        return True
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        else:
+            import msvcrt
+            self.lock_file.seek(0)
+            msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.lock_file.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def is_directory_link(path):
+    try:
+        link_stat = os.lstat(path)
+    except OSError:
+        return False
+    # Junctions are reparse points just like symlinks, but not reported by Path.is_symlink().
+    return (stat.S_ISLNK(link_stat.st_mode) or
+            (os.name == 'nt' and link_stat.st_reparse_tag == stat.IO_REPARSE_TAG_MOUNT_POINT))
+
+
+def create_directory_link(target_path, link_path):
+    """Creates a directory symlink, or a junction on Windows, which unlike a symlink doesn't
+    require special privileges."""
+    if os.name == 'nt':
+        import _winapi
+        _winapi.CreateJunction(str(target_path), str(link_path))
+    else:
+        os.symlink(target_path, link_path, target_is_directory=True)
+
+
+def remove_directory_link(link_path):
+    # Directory links and junctions are removed like empty directories on Windows.
+    if os.name == 'nt':
+        os.rmdir(link_path)
+    else:
+        os.unlink(link_path)
+
+
+def link_installed_tree(store_path, key, link_path, inputs):
+    """Makes `link_path` (a build folder's vcpkg_installed) point to the store tree for `key`.
+    Returns the path of the tree and whether it was newly created."""
+    store_path = Path(store_path)
+    link_path = Path(link_path)
+    # Other configure runs may update the metadata or install into the tree at the same time.
+    with FileLock(store_path / f'{key}.lock'):
+        return _link_installed_tree(store_path, key, link_path, inputs)
+
+
+def _link_installed_tree(store_path, key, link_path, inputs):
+    tree_path = store_path / key
+    created = not tree_path.exists()
+    os.makedirs(tree_path, exist_ok=True)
+
+    # Record the inputs and all build folders using a tree, to ease finding unused trees.
+    metadata_filename = store_path / f'{key}.json'
+    try:
+        with open(metadata_filename, 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+    except (OSError, ValueError):
+        metadata = {'inputs': inputs, 'users': []}
+    if link_path.parent.as_posix() not in metadata['users']:
+        metadata['users'].append(link_path.parent.as_posix())
+    metadata['last-used'] = time.time()
+    temp_filename = metadata_filename.with_suffix(f'.{os.getpid()}.tmp')
+    with open(temp_filename, 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+    os.replace(temp_filename, metadata_filename)
+
+    if is_directory_link(link_path):
+        if Path(os.path.realpath(link_path)) == Path(os.path.realpath(tree_path)):
+            return tree_path, created
+        remove_directory_link(link_path)
+    elif link_path.exists():
+        # A private tree from before the store was used; its packages are restored from the
+        # binary cache anyway.
+        print(f'Replacing private "{link_path}" by shared tree "{tree_path}".')
+        shutil.rmtree(link_path)
+    create_directory_link(tree_path, link_path)
+    return tree_path, created
+
+
+def write_inputs_stamp(stamp_filename, key, paths):
+    """Writes the hashes of the files the key of a shared vcpkg_installed tree was computed from.
+    CMake reruns not started by cmake.py check them (see cmake/CheckVcpkgInstalledInputs.cmake), so
+    vcpkg never installs into a tree shared under a key which no longer matches the inputs."""
+    lines = [f'key|{key}']
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            # Same listing as CMake's file(GLOB_RECURSE) followed by list(SORT).
+            filenames = sorted(file_path.relative_to(path).as_posix()
+                               for file_path in path.rglob('*') if file_path.is_file())
+            lines += [f'folder|{path.as_posix()}|{hashlib.sha256(";".join(filenames).encode()).hexdigest()}']
+            lines += [f'file|{(path / filename).as_posix()}|{_file_sha256(path / filename)}'
+                      for filename in filenames]
+        elif path.is_file():
+            lines += [f'file|{path.as_posix()}|{_file_sha256(path)}']
+        else:
+            lines += [f'missing|{path.as_posix()}']
+    temp_filename = Path(f'{stamp_filename}.{os.getpid()}.tmp')
+    with open(temp_filename, 'w') as stamp_file:
+        stamp_file.write('\n'.join(lines) + '\n')
+    os.replace(temp_filename, stamp_filename)
+
+
+class DedupIndex:
+    def __init__(self, index_filename):
+        self.index_filename = Path(index_filename)
+        self.entries = {}
+        try:
+            with open(self.index_filename, 'r') as index_file:
+                self.entries = json.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, path, stat):
+        entry = self.entries.get(path.as_posix())
+        if entry is not None and entry['identity'] == DedupIndex.identity(stat):
+            return entry['sha256']
+        return None
+
+    def store(self, path, stat, sha256):
+        self.entries[path.as_posix()] = {'identity': DedupIndex.identity(stat), 'sha256': sha256}
+
+    def prune(self, paths):
+        paths = {path.as_posix() for path in paths}
+        self.entries = {key: entry for key, entry in self.entries.items() if key in paths}
+
+    def save(self):
+        temp_filename = self.index_filename.with_suffix('.tmp')
+        with open(temp_filename, 'w') as index_file:
+            json.dump(self.entries, index_file)
+        os.replace(temp_filename, self.index_filename)
+
+    @staticmethod
+    def identity(stat):
+        # Unlike the modification time, the change time can't be restored after modifying a file.
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, stat.st_dev]
+
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _replace_with_link(original, duplicate, mode):
+    temp_filename = duplicate.with_name(duplicate.name + '.dedup-tmp')
+    try:
+        if mode == 'reflink':
+            if fcntl is None:
+                raise OSError('Reflinks are not supported on this platform.')
+            with open(original, 'rb') as source, open(temp_filename, 'wb') as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            shutil.copystat(original, temp_filename)
+        else:
+            os.link(original, temp_filename)
+        os.replace(temp_filename, duplicate)
+    except OSError:
+        temp_filename.unlink(missing_ok=True)
+        raise
+
+
+def deduplicate(roots, index_filename, mode='hardlink', dry_run=False):
+    """Replaces files with identical contents below `roots` by links to a single copy.
+    Returns the number of replaced files and the number of bytes reclaimed."""
+    files = []
+    for root in roots:
+        for folder, dirs, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.startswith('.vcpkg-') or filename.endswith('.dedup-tmp'):
+                    continue
+                path = Path(folder) / filename
+                try:
+                    files += [(path, path.lstat())]
+                except OSError:
+                    pass
+    index = DedupIndex(index_filename)
+    index.prune(path for path, _ in files)
+
+    # Only files sharing their size with another file on the same device can be duplicates.
+    by_size = {}
+    for path, stat in files:
+        by_size.setdefault((stat.st_dev, stat.st_size), []).append((path, stat))
+    replaced_count = 0
+    reclaimed_size = 0
+    for (_, size), candidates in by_size.items():
+        if len(candidates) < 2 or size == 0:
+            continue
+        by_hash = {}
+        for path, stat in candidates:
+            sha256 = index.lookup(path, stat)
+            if sha256 is None:
+                sha256 = _file_sha256(path)
+                index.store(path, stat, sha256)
+            by_hash.setdefault(sha256, []).append((path, stat))
+        for sha256, duplicates in by_hash.items():
+            # Keep the oldest copy and link all other copies to it.
+            duplicates.sort(key=lambda duplicate: duplicate[1].st_mtime_ns)
+            original, original_stat = duplicates[0]
+            replaced_inodes = {original_stat.st_ino}
+            for path, stat in duplicates[1:]:
+                if stat.st_ino == original_stat.st_ino:
+                    continue
+                if not dry_run:
+                    try:
+                        _replace_with_link(original, path, mode)
+                    except OSError as error:
+                        print(f'Warning: Cannot deduplicate "{path}": {error}')
+                        continue
+                    # Linking changes the change time of the original as well.
+                    index.store(path, path.lstat(), sha256)
+                    index.store(original, original.lstat(), sha256)
+                replaced_count += 1
+                if stat.st_ino not in replaced_inodes:
+                    reclaimed_size += size
+                    replaced_inodes.add(stat.st_ino)
+    if not dry_run:
+        index.save()
+    return replaced_count, reclaimed_size
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Index vcpkg binary cache and buildtrees folders and evict least recently used entries.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help in [('stats', 'Show size and age of a cache.'),
+                          ('evict', 'Evict least recently used entries down to a byte budget.')]:
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument('--binary-cache', action='append', default=[],
+                               help='vcpkg binary cache folder (`files` provider).')
+        subparser.add_argument('--buildtrees', action='append', default=[],
+                               help='vcpkg buildtrees root folder.')
+        subparser.add_argument('--keep-installed', action='append', default=[],
+                               help='vcpkg_installed folder whose packages are marked as used and never evicted.')
+        if command == 'evict':
+            subparser.add_argument('--budget', required=True,
+                                   help='Maximum size of each cache, e.g. "200GiB".')
+            subparser.add_argument('--dry-run', action='store_const', const=True, default=False,
+                                   help='Only report what would be evicted.')
+    subparser = subparsers.add_parser('dedup', help='Replace identical files in binary and asset caches by links.')
+    subparser.add_argument('roots', nargs='+',
+                           help='Cache folders to deduplicate, e.g. all per-triplet binary caches and the asset cache.')
+    subparser.add_argument('--mode', choices=['hardlink', 'reflink'], default='hardlink',
+                           help='Link type used to replace duplicates (reflinks require btrfs, XFS or similar).')
+    subparser.add_argument('--index', default=None,
+                           help=f'Hash index file (default: {DEDUP_INDEX_FILENAME} in the common parent of all roots).')
+    subparser.add_argument('--dry-run', action='store_const', const=True, default=False,
+                           help='Only report what would be deduplicated.')
+    args = parser.parse_args()
+
+    if args.command == 'dedup':
+        roots = [Path(os.path.expanduser(root)).absolute() for root in args.roots]
+        index_filename = args.index
+        if index_filename is None:
+            index_filename = Path(os.path.commonpath(roots)) / DEDUP_INDEX_FILENAME
+        replaced_count, reclaimed_size = deduplicate(roots, index_filename, args.mode, args.dry_run)
+        print(f'{"Would replace" if args.dry_run else "Replaced"} {replaced_count} duplicate files ' +
+              f'by {args.mode}s, reclaiming {format_size(reclaimed_size)}.')
+        return
+
+    caches = [(path, 'binary') for path in args.binary_cache] + [(path, 'buildtrees') for path in args.buildtrees]
+    if not caches:
+        parser.error('At least one of --binary-cache or --buildtrees is required.')
+    for path, kind in caches:
+        path = Path(os.path.expanduser(path))
+        if args.command == 'stats':
+            index = CacheIndex(path, kind)
+            index.scan()
+            for vcpkg_installed_path in args.keep_installed:
+                index.mark_used(index.keys_for_packages(installed_packages(vcpkg_installed_path)))
+            index.save()
+            now = time.time()
+            ages = [now - entry['last_used'] for entry in index.entries.values()]
+            print(f'{kind} cache "{path}": {len(index.entries)} entries, {format_size(index.total_size())}' +
+                  (f', last use between {min(ages) / 86400:.1f} and {max(ages) / 86400:.1f} days ago' if ages else ''))
+        else:
+            budget = parse_size(args.budget)
+            size_before, evicted_count, evicted_size = maintain_cache(
+                path, kind, budget, args.keep_installed, args.dry_run)
+            print(f'{kind} cache "{path}": {format_size(size_before)} in use, ' +
+                  f'{"would evict" if args.dry_run else "evicted"} {evicted_count} entries ' +
+                  f'({format_size(evicted_size)}) to fit into {format_size(budget)}.')
+
+
+if __name__ == '__main__':
+    main()
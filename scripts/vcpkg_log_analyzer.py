@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# Streaming parser for vcpkg manifest install output. It accepts either the plain
+# `vcpkg-manifest-install.log` or the timestamped `cmake-output.log.gz` written by cmake.py, and
+# extracts per port: triplet, version, whether the port was restored from the binary cache or
+# built, build duration and time spent downloading (the latter requires timestamped input).
+# Results are appended as JSON lines to a history file within the build folder. cmake.py adds the
+# buildtree size of built ports, which ram_buildtrees.py uses as estimate.
+
+import argparse
+from datetime import datetime
+import gzip
+import json
+from pathlib import Path
+import re
+import statistics
+
+HISTORY_FILENAME = 'vcpkg-port-history.jsonl'
+
+TIMESTAMP_PATTERN = re.compile(r'^\s*(\d+\.\d{3}) (.*)$', re.DOTALL)
+INSTALLING_PATTERN = re.compile(r'^Installing (\d+)/(\d+) ([^:\s]+):([^@\s]+?)(?:@(\S+?))?\.\.\.\s*$')
+BUILDING_PATTERN = re.compile(r'^Building ([^:\s]+):([^@\s]+?)(?:@\S+?)?\.\.\.\s*$')
+ELAPSED_PATTERN = re.compile(r'^Elapsed time to handle ([^:\s]+):(\S+?): (.+)$')
+STORED_PATTERN = re.compile(r'^Stored binar(?:y|ies) (?:cache|in \d+ destinations?)')
+FAILED_PATTERN = re.compile(r'^error: building ([^:\s]+):(\S+) failed with: (\S+)')
+RESTORED_PATTERN = re.compile(r'^Restored (\d+) package\(s\) from (.+) in (.+?)\. ')
+ALREADY_INSTALLED_PATTERN = re.compile(r'^\s+([^:\s]+):([^@\s]+)(?:@\S+)?\s*$')
+DOWNLOAD_PATTERN = re.compile(r'^(?:-- )?Downloading ')
+TOTAL_PATTERN = re.compile(r'^Total (?:install|elapsed) time: (.+)$')
+DURATION_UNITS = {'us': 1e-6, 'ms': 1e-3, 's': 1, 'min': 60, 'h': 3600}
+
+
+def parse_duration(text):
+    search_result = re.search(r'([\d.]+)\s*(us|ms|s|min|h)\b', text)
+    if search_result is None:
+        return None
+    return float(search_result.group(1)) * DURATION_UNITS[search_result.group(2)]
+
+
+def open_log(filename):
+    filename = Path(filename)
+    if filename.suffix == '.gz':
+        return gzip.open(filename, 'rt', encoding='utf-8', errors='replace')
+    return open(filename, 'r', encoding='utf-8', errors='replace')
+
+
+def analyze_log(filename):
+    """Returns a list of per-port records and a dict with summary information."""
+    records = []
+    summary = {'log': Path(filename).as_posix(), 'restored': 0, 'built': 0, 'failed': 0,
+               'already-installed': 0, 'total-seconds': None, 'restore-seconds': None}
+    current = None
+    download_start = None
+    in_already_installed = False
+
+    def finish(record, end_time):
+        if record['seconds'] is None and record['start'] is not None and end_time is not None:
+            record['seconds'] = end_time - record['start']
+        del record['start']
+        records.append(record)
+
+    with open_log(filename) as log_file:
+        for line in log_file:
+            timestamp = None
+            search_result = TIMESTAMP_PATTERN.match(line)
+            if search_result is not None:
+                timestamp = float(search_result.group(1))
+                line = search_result.group(2)
+            line = line.rstrip('\n')
+            if line.startswith('[DEBUG]') or line.startswith('# Log started'):
+                continue
+
+            # Downloads end with the first line that isn't part of the download.
+            if download_start is not None and not DOWNLOAD_PATTERN.match(line):
+                if current is not None and timestamp is not None:
+                    current['download-seconds'] += timestamp - download_start
+                download_start = None
+            if DOWNLOAD_PATTERN.match(line) and download_start is None and timestamp is not None:
+                download_start = timestamp
+
+            if line.startswith('The following packages are already installed'):
+                in_already_installed = True
+                continue
+            if in_already_installed:
+                if ALREADY_INSTALLED_PATTERN.match(line):
+                    summary['already-installed'] += 1
+                    continue
+                in_already_installed = False
+
+            if (search_result := INSTALLING_PATTERN.match(line)) is not None:
+                if current is not None:
+                    finish(current, timestamp)
+                current = {
+                    'port': search_result.group(3),
+                    'triplet': search_result.group(4),
+                    'version': search_result.group(5),
+                    'cache': 'restored',
+                    'seconds': None,
+                    'download-seconds': 0.0,
+                    'stored': False,
+                    'start': timestamp
+                }
+            elif (search_result := BUILDING_PATTERN.match(line)) is not None:
+                if current is not None and current['port'] == search_result.group(1):
+                    current['cache'] = 'built'
+            elif STORED_PATTERN.match(line):
+                if current is not None:
+                    current['stored'] = True
+            elif (search_result := FAILED_PATTERN.match(line)) is not None:
+                if current is not None and current['port'] == search_result.group(1):
+                    current['cache'] = 'failed'
+            elif (search_result := ELAPSED_PATTERN.match(line)) is not None:
+                if current is not None and current['port'] == search_result.group(1):
+                    current['seconds'] = parse_duration(search_result.group(3))
+                    finish(current, timestamp)
+                    current = None
+            elif (search_result := RESTORED_PATTERN.match(line)) is not None:
+                summary['restore-seconds'] = parse_duration(search_result.group(3))
+            elif (search_result := TOTAL_PATTERN.match(line)) is not None:
+                summary['total-seconds'] = parse_duration(search_result.group(1))
+    if current is not None:
+        finish(current, None)
+
+    for record in records:
+        summary[record['cache']] += 1
+    lookups = summary['restored'] + summary['built'] + summary['failed']
+    summary['hit-ratio'] = summary['restored'] / lookups if lookups else None
+    return records, summary
+
+
+def append_history(history_filename, records, summary):
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    with open(history_filename, 'a') as history_file:
+        for record in records:
+            history_file.write(json.dumps({'timestamp': timestamp, **record}) + '\n')
+        history_file.write(json.dumps({'timestamp': timestamp, 'summary': summary}) + '\n')
+
+
+def read_history(history_filename):
+    records = []
+    try:
+        with open(history_filename, 'r') as history_file:
+            for line in history_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'port' in record:
+                    records.append(record)
+    except OSError:
+        pass
+    return records
+
+
+def format_report(records, summary, top=10):
+    lines = []
+    timed_records = sorted((record for record in records if record['seconds'] is not None),
+                           key=lambda record: record['seconds'], reverse=True)
+    if timed_records:
+        port_width = max(len(f'{record["port"]}:{record["triplet"]}') for record in timed_records[:top])
+        lines += [f'Slowest {min(top, len(timed_records))} of {len(records)} ports:']
+        for record in timed_records[:top]:
+            spec = f'{record["port"]}:{record["triplet"]}'
+            line = f'  {spec:<{port_width}}  {record["seconds"]:9.1f}s  {record["cache"]}'
+            if record['download-seconds']:
+                line += f' (downloads {record["download-seconds"]:.1f}s)'
+            lines += [line]
+    if summary['hit-ratio'] is not None:
+        lines += [f'Binary cache: {summary["restored"]} restored, {summary["built"]} built, ' +
+                  f'{summary["failed"]} failed, hit ratio {summary["hit-ratio"] * 100:.1f}%']
+    if summary['already-installed']:
+        lines += [f'{summary["already-installed"]} packages were already installed.']
+    if summary['total-seconds'] is not None:
+        lines += [f'Total install time: {summary["total-seconds"]:.1f}s']
+    return '\n'.join(lines)
+
+
+def format_history_report(records, top=10):
+    # Aggregates all runs of each port, which is more robust against outliers than a single run.
+    ports = {}
+    for record in records:
+        ports.setdefault((record['port'], record['triplet']), []).append(record)
+    rows = []
+    for (port, triplet), port_records in ports.items():
+        built = [record['seconds'] for record in port_records
+                 if record['cache'] == 'built' and record['seconds'] is not None]
+        misses = sum(1 for record in port_records if record['cache'] != 'restored')
+        rows += [(statistics.median(built) if built else 0.0, f'{port}:{triplet}', len(port_records), misses)]
+    rows.sort(reverse=True)
+    lines = [f'Ports with the highest median build time over {len(records)} recorded installs:']
+    for median, spec, count, misses in rows[:top]:
+        lines += [f'  {spec:<40}  {median:9.1f}s  {misses}/{count} cache misses']
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Extract per-port build statistics from vcpkg manifest install output.')
+    parser.add_argument('log', nargs='?',
+                        help='vcpkg-manifest-install.log or cmake-output.log.gz file.')
+    parser.add_argument('--history', default=None,
+                        help=f'History file to append results to (default: {HISTORY_FILENAME} next to the log).')
+    parser.add_argument('--no-history', action='store_const', const=True, default=False,
+                        help='Do not append results to the history file.')
+    parser.add_argument('--aggregate', action='store_const', const=True, default=False,
+                        help='Report aggregated statistics over all runs recorded in the history file.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest ports to report.')
+    args = parser.parse_args()
+    if args.log is None and (args.aggregate is False or args.history is None):
+        parser.error('A log file is required unless --aggregate is used together with --history.')
+
+    history_filename = args.history
+    if history_filename is None:
+        history_filename = Path(args.log).parent / HISTORY_FILENAME
+    if args.log is not None:
+        records, summary = analyze_log(args.log)
+        print(format_report(records, summary, args.top))
+        if not args.no_history:
+            append_history(history_filename, records, summary)
+    if args.aggregate:
+        print(format_history_report(read_history(history_filename), args.top))
+
+
+if __name__ == '__main__':
+    main()
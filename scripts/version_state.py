@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# Version state of the source tree (commit hash and whether the worktree is dirty) for the
+# `update_build_version` target (see cmake/UtilityMacros.cmake). The state is written as a small
+# CMake stamp file, which cmake/UpdateBuildVersion.cmake includes instead of calling git, and which
+# is only rewritten if the state changed.
+#
+# Calling `git status` on every build is expensive, mostly due to the `dependencies/vcpkg`
+# submodule. Instead, the commit is read from `.git` directly, and the previous state is reused as
+# long as HEAD and the size and modification time of git's index are unchanged, and none of the
+# tracked files the index marks as racy or modified was touched again. Other changes, such as new
+# untracked files or edits to files which were clean, are noticed once git updates the index, e.g.
+# when staging or committing. Otherwise git is queried once and the result is cached, together
+# with git's abbreviation of the commit hash.
+#
+# This module must only depend on the Python standard library and modules using it only, because
+# it runs during builds.
+
+import argparse
+import json
+import os
+from pathlib import Path
+import struct
+import subprocess
+
+import vcpkg_cache
+
+# Mode of index entries referring to a submodule commit.
+GITLINK_MODE = 0o160000
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_index(index_filename):
+    """Returns `(path, mode, size, mtime_ns, sha)` for each entry of a git index, or None if the
+    index uses an unsupported version."""
+    with open(index_filename, 'rb') as index_file:
+        data = index_file.read()
+    signature, version, count = struct.unpack_from('>4sII', data, 0)
+    if signature != b'DIRC' or version not in [2, 3]:
+        return None
+    entries = []
+    position = 12
+    for _ in range(count):
+        (_, _, mtime_seconds, mtime_nanoseconds, _, _, mode, _, _, size, sha,
+         flags) = struct.unpack_from('>IIIIIIIIII20sH', data, position)
+        path_start = position + 62
+        if flags & 0x4000:
+            # Extended flags of version 3.
+            path_start += 2
+        path_end = data.index(b'\0', path_start)
+        entries += [(data[path_start:path_end].decode('utf-8', errors='surrogateescape'), mode, size,
+                     mtime_seconds * 1000000000 + mtime_nanoseconds, sha.hex())]
+        # Entries are padded with 1 to 8 NUL bytes to a multiple of 8 bytes.
+        position += (path_end - position + 8) // 8 * 8
+    return entries
+
+
+def worktree_root(source_path):
+    """Returns the root of the git worktree containing a folder, or None."""
+    for path in [source_path, *source_path.parents]:
+        if (path / '.git').exists():
+            return path if vcpkg_cache.git_folder(path) is not None else None
+    return None
+
+
+def watched_files(root_path, entries, index_mtime_ns):
+    """Returns the signatures of the tracked files whose content git can't tell from the index
+    alone: files which differ in size or modification time from their entries, and files modified
+    in the same second the index was written, whose content might have changed without changing
+    their stat ("racy git")."""
+    watched = {}
+    for path, mode, size, mtime_ns, _ in entries:
+        if mode == GITLINK_MODE:
+            continue
+        try:
+            stat = os.lstat(root_path / path)
+        except OSError:
+            watched[path] = None
+            continue
+        # The index only stores the lower 32 bits of sizes, and times with second precision on some
+        # systems.
+        if stat.st_size & 0xffffffff != size or \
+                (stat.st_mtime_ns != mtime_ns and stat.st_mtime_ns // 1000000000 * 1000000000 != mtime_ns) or \
+                mtime_ns // 1000000000 >= index_mtime_ns // 1000000000:
+            watched[path] = [stat.st_size, stat.st_mtime_ns]
+    return watched
+
+
+def _watched_files_unchanged(root_path, watched):
+    for path, signature in watched.items():
+        try:
+            stat = os.lstat(root_path / path)
+        except OSError:
+            if signature is not None:
+                return False
+            continue
+        if signature != [stat.st_size, stat.st_mtime_ns]:
+            return False
+    return True
+
+
+def _run_git(source_path, arguments):
+    result = subprocess.run(['git', *arguments], cwd=source_path, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout.rstrip('\n')
+
+
+def compute_state(source_path, cache_filename):
+    """Returns the abbreviated commit hash, the `git status` output (None if unknown) and whether
+    git was queried. Like git, the status lists paths relative to `source_path`, which may be a
+    folder within the worktree."""
+    source_path = Path(source_path).absolute()
+    root_path = worktree_root(source_path)
+    commit = vcpkg_cache.git_commit(root_path) if root_path is not None else None
+    if commit is None:
+        return None, None, False
+    try:
+        with open(cache_filename, 'r') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        cache = {}
+
+    index_filename = vcpkg_cache.git_folder(root_path) / 'index'
+    key = [commit, _signature(index_filename)]
+    if key[1] is not None and cache.get('key') == key and 'abbreviation' in cache and \
+            isinstance(cache.get('watched'), dict) and _watched_files_unchanged(root_path, cache['watched']):
+        return cache['abbreviation'], cache['status'], False
+
+    # The abbreviation depends on the objects in the repository (see core.abbrev), so it is left
+    # to git, but only queried again if the commit changed.
+    abbreviation = cache.get('abbreviation') if cache.get('key', [None])[0] == commit else None
+    if abbreviation is None:
+        abbreviation = _run_git(source_path, ['rev-parse', '--short', commit])
+    status = _run_git(source_path, ['status', '-s'])
+    if abbreviation is None:
+        return commit[:7], status, True
+    if status is not None:
+        # git may have refreshed the index while checking the worktree.
+        key = [commit, _signature(index_filename)]
+        try:
+            entries = read_index(index_filename)
+        except (OSError, ValueError, struct.error):
+            entries = None
+        if entries is not None and key[1] is not None:
+            temp_filename = Path(f'{cache_filename}.{os.getpid()}.tmp')
+            with open(temp_filename, 'w') as cache_file:
+                json.dump({'key': key, 'watched': watched_files(root_path, entries, key[1][1]),
+                           'abbreviation': abbreviation, 'status': status}, cache_file)
+            os.replace(temp_filename, cache_filename)
+    return abbreviation, status, True
+
+
+def _cmake_string(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$') + '"'
+
+
+def write_stamp(stamp_filename, abbreviation, status):
+    """Writes the CMake stamp file if its content changed. Returns whether it was written."""
+    lines = ['# Written by scripts/version_state.py, see cmake/UpdateBuildVersion.cmake.']
+    if abbreviation is not None:
+        lines += [f'set(BUILD_VERSION_HASH {_cmake_string(abbreviation)})']
+    if status is not None:
+        lines += [f'set(GIT_STATUS_OUTPUT {_cmake_string(status)})']
+    content = '\n'.join(lines) + '\n'
+    try:
+        with open(stamp_filename, 'r') as stamp_file:
+            if stamp_file.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(stamp_filename, 'w') as stamp_file:
+        stamp_file.write(content)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write the git version state of the source tree to a CMake stamp file.')
+    parser.add_argument('--source', default=Path(__file__).parent.absolute().parent,
+                        help='Source tree (default: this repository).')
+    parser.add_argument('--stamp', required=True, help='CMake stamp file to write.')
+    args = parser.parse_args()
+
+    stamp_filename = Path(args.stamp)
+    abbreviation, status, queried = compute_state(args.source, stamp_filename.with_suffix('.json'))
+    written = write_stamp(stamp_filename, abbreviation, status)
+    if queried:
+        print(f'Queried git for the version state ({"updated" if written else "unchanged"}).')
+
+
+if __name__ == '__main__':
+    main()